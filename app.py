@@ -1,121 +1,156 @@
-import copy
-from dotenv import load_dotenv
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+import assets
+import atexit
+import blocks
+from cache import LRUCache
+import changes
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from db import Database
+from duplicates import DuplicateIndex
+from flask import abort, Flask, g, request, render_template, redirect, Response, send_file, url_for, session, stream_template
 from functools import wraps
+import hmac
+from idempotency import IdempotencyStore
+from installations import ClientPool, InstallationStore
+from jobs import JobQueue, PRIORITY_HIGH, PRIORITY_LOW, PRIORITY_NORMAL
 import json
+from matcher import FaqMatcher
+import metrics
+import mimetypes
 import os
+import profiling
+import queries
+import re
+import review
+from settings import Settings
+from slack_dispatch import SlackDispatcher
 import slackeventsapi
 from slack_sdk import WebClient
+from snapshot import SnapshotReader
+import traffic
 import sqlite3
+import time
 from urllib.parse import urlencode
 import urllib.parse
-import warnings
+from usage import UsageTracker
+from werkzeug.http import is_resource_modified
+from werkzeug.security import safe_join
 
 
-load_dotenv()
+# Importing this module only defines the Flask app and its routes. Settings, the database and the
+# Slack clients are set up by create_app(), and the schema/admin setup is done once by
+# `manage.py init` (gunicorn runs it from on_starting), so workers don't repeat any of it.
 
 # Flask
 app = Flask(__name__, template_folder="website/templates", static_folder="website/static")
 
-flask_secret_key = os.getenv("FLASK_SECRET_KEY")
-if not flask_secret_key:
-    warnings.warn("FLASK_SECRET_KEY environment variable is not set. A random key will be used, which will invalidate sessions on server restart.")
-    flask_secret_key = os.urandom(24)
-
-app.secret_key = flask_secret_key
-
-
-# Slack credentials/config
-slack_bot_token = os.getenv("SLACK_BOT_TOKEN")
-if not slack_bot_token:
-    raise ValueError("SLACK_BOT_TOKEN environment variable is not set.")
-
-slack_signing_secret = os.getenv("SLACK_SIGNING_SECRET")
-if not slack_signing_secret:
-    raise ValueError("SLACK_SIGNING_SECRET environment variable is not set.")
-
-slack_client = WebClient(token=slack_bot_token)
-slack_events_adapter = slackeventsapi.SlackEventAdapter(slack_signing_secret, "/slack/events", app)
-
-slack_api_app_id = os.getenv("SLACK_API_APP_ID")
-if not slack_api_app_id:
-    warnings.warn("SLACK_API_APP_ID environment variable is not set.")
-
-slack_client_id = os.getenv("SLACK_CLIENT_ID")
-if not slack_client_id:
-    raise ValueError("SLACK_CLIENT_ID environment variable is not set.")
-
-slack_oauth_redirect_url = os.getenv("SLACK_OAUTH_REDIRECT_URL")
-if not slack_oauth_redirect_url:
-    raise ValueError("SLACK_OAUTH_REDIRECT_URL environment variable is not set.")
-
-slack_client_secret = os.getenv("SLACK_CLIENT_SECRET")
-if not slack_client_secret:
-    raise ValueError("SLACK_CLIENT_SECRET environment variable is not set.")
-
 # Slack Scopes
 bot_scopes = "app_mentions:read,chat:write,chat:write.public,commands,im:write,reactions:write"
 user_scopes = "channels:read,groups:read"
 
+# Set by create_app()
+settings = None
+db = None
+slack_client = None
+slack_jobs = None
+slack_api = None
+slack_events_adapter = None
+faq_options_cache = None
+faq_matcher = None
+idempotency = None
+corpus_version_cache = None
+duplicate_index = None
+usage_tracker = None
+answer_cache = None
+installations = None
+faq_snapshot = None
+traffic_recorder = None
+
+
+def create_app(app_settings=None, slack_dispatcher=None):
+    # async_app.py passes its own dispatcher, which sends Slack calls from an event loop
+    global settings, db, slack_client, slack_jobs, slack_api, slack_events_adapter, faq_options_cache, faq_matcher, idempotency, corpus_version_cache, duplicate_index, usage_tracker, answer_cache, installations, faq_snapshot, traffic_recorder
+    if settings is not None:
+        return app
+
+    app_settings = app_settings or Settings.load()
+    app.secret_key = app_settings.flask_secret_key or os.urandom(24)
+    # A restart can change templates, so cached pages from before it aren't reused
+    app.config["STARTED_AT"] = int(time.time())
+    metrics.enable()
+    # Content-hashed static files from `manage.py assets`, templates link to them with asset_url()
+    app.config["ASSET_MANIFEST"] = assets.load_manifest(app.static_folder)
+    # Off until switched on with `manage.py profile on` or /admin/profiling
+    app.wsgi_app = profiling.ProfilerMiddleware(app.wsgi_app)
+    # Writes the Slack requests to TRAFFIC_RECORD_DIR for replaying them with bench/replay.py
+    if app_settings.traffic_record_dir:
+        traffic_recorder = traffic.TrafficRecorder(app_settings.traffic_record_dir, app_settings.traffic_record_sample_rate, app_settings.traffic_record_keep_text)
+        app.wsgi_app = traffic.RecorderMiddleware(app.wsgi_app, traffic_recorder)
+
+    # Outbound Slack calls run here so requests can be acknowledged within Slack's 3 second window
+    slack_jobs = JobQueue("slack", workers=app_settings.slack_job_workers, max_size=app_settings.slack_job_queue_size)
+    atexit.register(slack_jobs.shutdown)
+
+    # Connections are opened per thread on first use. An options-load replica (SNAPSHOT_ONLY) has no
+    # database, the stores below are never used there because only the options menu is served.
+    db = None if app_settings.snapshot_only else Database(
+        app_settings.db_path,
+        busy_timeout=app_settings.db_busy_timeout,
+        cache_size=app_settings.db_cache_size,
+        mmap_size=app_settings.db_mmap_size
+    )
 
+    # Bot tokens of the workspaces the app is installed in. SLACK_BOT_TOKEN stays the client for the
+    # home workspace (the review channel) and for teams without an installation.
+    installations = InstallationStore(db, cache_size=app_settings.installation_cache_size, ttl=app_settings.installation_cache_ttl)
+
+    # Rate limits and retries outbound Slack calls, modal opens jump the queue since their trigger_id expires quickly
+    if slack_dispatcher is None:
+        base_url = app_settings.slack_api_base_url or WebClient.BASE_URL
+        slack_client = WebClient(token=app_settings.slack_bot_token, base_url=base_url)
+        slack_dispatcher = SlackDispatcher(
+            slack_client,
+            slack_jobs,
+            max_retries=app_settings.slack_api_max_retries,
+            clients=ClientPool(installations, lambda token: WebClient(token=token, base_url=base_url), max_size=app_settings.slack_client_pool_size)
+        )
+    slack_api = slack_dispatcher
 
-# Database
-db_path = os.getenv("DATABASE_PATH")
-if not db_path:
-    raise ValueError("DATABASE_PATH environment variable is not set.")
-
-# Test database connection
-try:
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT 1")
-except sqlite3.Error as e:
-    raise ValueError(f"Failed to connect to database: {e}")
-finally:
-    conn.close()
-
-
-admin = os.getenv("ADMIN_ID")
-if not admin:
-    raise ValueError("ADMIN_ID environment variable is not set.")
-
-try:
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("SELECT user_id FROM reviewers")
-
-    rows = cursor.fetchall()
+    slack_events_adapter = slackeventsapi.SlackEventAdapter(app_settings.slack_signing_secret, "/slack/events", app)
+    slack_events_adapter.on("app_mention", handle_app_mention)
+    slack_events_adapter.on("app_uninstalled", handle_uninstall)
+    slack_events_adapter.on("tokens_revoked", handle_uninstall)
 
-    for row in rows:
-        if row[0] == admin:
-            db_configured_admin = True
-            break
-    else:
-        db_configured_admin = False
+    # Per-channel cache of the options shown in the "Trigger FAQ" select menu, keyed by (channel_id, query)
+    faq_options_cache = LRUCache(max_size=app_settings.faq_options_cache_size, ttl=app_settings.faq_options_cache_ttl)
 
-    if not db_configured_admin:
-        cursor.execute("INSERT INTO reviewers (user_id, admin) VALUES (?, ?)", (admin, True))
-        conn.commit()
-        print(f"Admin user {admin} added to reviewers table.")
+    # Rendered answer blocks keyed by (faq_id, corpus version). The version is part of the key, so entries never go stale.
+    answer_cache = LRUCache(max_size=app_settings.answer_cache_size, ttl=24 * 60 * 60)
 
-except sqlite3.Error as e:
-    raise ValueError(f"Error connecting to database: {e}")
-finally:
-    conn.close()
+    # Memory-mapped FAQ snapshot for the options menu and the trigger form, swapped when a new export shows up.
+    # Until the first one exists (or without SNAPSHOT_PATH) they read from the database, with SNAPSHOT_ONLY
+    # options loads are refused instead. A trigger form submission still claims its idempotency key and records usage.
+    if app_settings.snapshot_path:
+        faq_snapshot = SnapshotReader(app_settings.snapshot_path, check_interval=app_settings.snapshot_check_interval)
 
+    # Suggests an approved FAQ in the thread when the bot is mentioned, the index is built on the first mention
+    faq_matcher = FaqMatcher(db)
 
-review_channel_id = os.getenv("FAQ_SUBMISSION_REVIEW_CHANNEL")
-if not review_channel_id:
-    raise ValueError("FAQ_SUBMISSION_REVIEW_CHANNEL environment variable is not set.")
+    # Finds approved/pending FAQs similar to a new submission for the review message, built on the first submission
+    duplicate_index = DuplicateIndex(db)
 
+    # Buffers FAQ triggers and writes them in batches, the daily counts rank the options menu
+    usage_tracker = UsageTracker(db, flush_interval=app_settings.usage_flush_interval, batch_size=app_settings.usage_batch_size)
+    atexit.register(usage_tracker.flush)
 
-with open("faq-submission.json", "r") as f:
-    faq_submission_view = json.load(f)
-
-with open("faq-trigger-form.json", "r") as f:
-    faq_trigger_form = json.load(f)
+    # Drops Slack retries and double-clicked buttons before they reach the database or Slack
+    idempotency = IdempotencyStore(db, ttl=app_settings.idempotency_ttl)
 
+    # (version, updated_at) of the approved FAQs, kept briefly so repeat /faqs views are answered without a query
+    corpus_version_cache = LRUCache(max_size=1, ttl=app_settings.corpus_version_ttl)
 
+    settings = app_settings
+    return app
 
 
 def login_required(f):
@@ -127,6 +162,38 @@ def login_required(f):
     return decorated_function
 
 
+# Static files built by `manage.py assets`. Their names change with their content, so they can be
+# cached for a year, and a precompressed copy is sent to clients that accept it. A reverse proxy in
+# front of gunicorn can serve website/static/dist directly instead (see README).
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+
+@app.template_global()
+def asset_url(filename):
+    hashed = app.config.get("ASSET_MANIFEST", {}).get(filename)
+    if hashed:
+        return url_for("static_asset", filename=hashed)
+    return url_for("static", filename=filename)
+
+@app.route("/static/dist/<path:filename>")
+def static_asset(filename):
+    path = safe_join(os.path.join(app.static_folder, assets.DIST), filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    encoding, suffix = assets.negotiate(request.headers.get("Accept-Encoding"), path)
+    response = send_file(
+        path + suffix,
+        mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream",
+        max_age=ASSET_MAX_AGE,
+        conditional=True
+    )
+    if encoding:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.immutable = True
+    return response
+
+
 # Website
 @app.route("/")
 def index():
@@ -139,7 +206,39 @@ def commands():
 @app.route("/faqs")
 @login_required
 def faqs():
-    return render_template("faqs.html")
+    query = request.args.get("q", "").strip()
+    channel_id = request.args.get("channel", "").strip() or None
+    after = request.args.get("after", 0, type=int)
+
+    # Pages only change with the corpus version, so a matching ETag gets a 304 before any query runs
+    version, updated_at = get_corpus_version()
+    etag = f"faqs-{app.config['STARTED_AT']:x}-{version}"
+    last_modified = datetime.fromtimestamp(max(updated_at, app.config["STARTED_AT"]), timezone.utc)
+    if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+        response = Response(status=304)
+    else:
+        search_query = build_faq_search_query(query)
+        params = {"query": search_query, "after": after, "channel": channel_id, "limit": settings.faqs_page_size + 1}
+        rows = db.query(queries.FAQ_PAGE_SEARCH if search_query else queries.FAQ_PAGE, params)
+
+        next_after = None
+        if len(rows) > settings.faqs_page_size:
+            rows = rows[:settings.faqs_page_size]
+            next_after = rows[-1][0]
+
+        response = Response(stream_template(
+            "faqs.html",
+            faqs=[(faq_id, is_global, question, answer, channels.split(",") if channels else []) for faq_id, is_global, question, answer, channels in rows],
+            query=query,
+            channel_id=channel_id or "",
+            after=after,
+            next_after=next_after
+        ))
+
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
 
 
 
@@ -148,10 +247,10 @@ def faqs():
 def login():
     next_url = request.args.get("next") or request.headers.get("Referer", "/")
     query = {
-        "client_id": slack_client_id,
+        "client_id": settings.slack_client_id,
         "scope": bot_scopes,
         "user_scope": user_scopes,
-        "redirect_uri": slack_oauth_redirect_url,
+        "redirect_uri": settings.slack_oauth_redirect_url,
         "state": next_url
     }
     print(query)
@@ -167,11 +266,12 @@ def oauth_redirect():
     state = request.args.get("state", "/")
     print(f"State: {state}")
 
-    response = slack_client.oauth_v2_access(
-        client_id=slack_client_id,
-        client_secret=slack_client_secret,
+    response = slack_api.call_now(
+        "oauth_v2_access",
+        client_id=settings.slack_client_id,
+        client_secret=settings.slack_client_secret,
         code=code,
-        redirect_uri=slack_oauth_redirect_url
+        redirect_uri=settings.slack_oauth_redirect_url
     )
 
     if not response["ok"]:
@@ -185,17 +285,11 @@ def oauth_redirect():
     session["user_id"] = user_id
     
     try:
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute("SELECT slack_user_id FROM site_users WHERE slack_user_id = ?", (user_id,))
-        if cursor.fetchone() is None:
-            cursor.execute("INSERT INTO site_users (slack_user_id, user_access_token) VALUES (?, ?)", (user_id, user_access_token))
-        else:
-            cursor.execute("UPDATE site_users SET user_access_token = ? WHERE slack_user_id = ?", (user_access_token, user_id))
-        conn.commit()
+        db.execute(queries.UPSERT_SITE_USER, (user_id, user_access_token))
+        # Installing (or logging in from) a workspace stores its bot token, later calls for that team use it
+        installations.save(response["team"]["id"], bot_access_token, response.get("bot_user_id"), user_id)
     except sqlite3.Error as e:
         return render_template("error.html", error="Database error.", description=f"Failed to connect to database: '{e}'. You can try again or report the issue."), 500
-    conn.close()
 
     return redirect(state)
 
@@ -207,6 +301,84 @@ def logout():
     return redirect(state)
 
 
+# Metrics
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+# What an options-load replica (SNAPSHOT_ONLY) serves, the rest needs the database
+SNAPSHOT_ONLY_ENDPOINTS = frozenset(("slack_external_options_load", "prometheus_metrics", "static", "static_asset"))
+
+@app.before_request
+def require_database():
+    if settings is not None and settings.snapshot_only and request.endpoint not in SNAPSHOT_ONLY_ENDPOINTS:
+        return "Not served by an options-load replica.", 404
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get("request_started")
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe("http_request_duration_seconds", elapsed, route=route, method=request.method, status=response.status_code)
+
+        interaction = g.get("interaction")
+        if interaction:
+            metrics.observe("slack_interaction_duration_seconds", elapsed, type=interaction[0], id=interaction[1])
+
+    metrics.flush()
+    return response
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+# Profiling, admin only. POST {"sample_rate": 0.05, "tracemalloc": true, "minutes": 15} turns it on
+# for every worker, {"sample_rate": 0} turns it off.
+@app.route("/admin/profiling", methods=["GET", "POST"])
+@login_required
+def admin_profiling():
+    if session.get("user_id") != settings.admin:
+        return {"error": "Only the admin can change profiling."}, 403
+
+    if request.method == "POST":
+        # JSON only, so a cross-site form can't switch it on
+        options = request.get_json(silent=True)
+        if not isinstance(options, dict):
+            return {"error": "Expected a JSON object."}, 400
+        try:
+            profiling.write_control(
+                sample_rate=float(options.get("sample_rate", 0)),
+                use_tracemalloc=bool(options.get("tracemalloc", False)),
+                snapshot_interval=int(options.get("snapshot_interval", 60)),
+                minutes=float(options.get("minutes", 15)) or None
+            )
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+
+    return profiling.status()
+
+
+# Change feed for other tools (wiki sync, search indexer, analytics), disabled unless CHANGES_API_TOKEN is set
+@app.route("/api/changes")
+def api_changes():
+    if not settings.changes_api_token:
+        return {"error": "The change feed is disabled."}, 404
+    if not hmac.compare_digest(request.headers.get("Authorization", ""), f"Bearer {settings.changes_api_token}"):
+        return {"error": "Missing or invalid token."}, 401
+
+    since = request.args.get("since", 0, type=int)
+    limit = max(1, min(request.args.get("limit", 1000, type=int), 10000))
+    rows = changes.read(db, since, limit + 1)
+
+    return {
+        "changes": rows[:limit],
+        "cursor": rows[limit - 1]["id"] if len(rows) > limit else (rows[-1]["id"] if rows else since),
+        "has_more": len(rows) > limit,
+    }
+
+
 # 404 Page
 @app.errorhandler(404)
 def page_not_found(e):
@@ -216,38 +388,55 @@ def page_not_found(e):
 
 
 # Slack Bot
+# The handle_* functions below don't use Flask's request, async_app.py serves the same logic with asyncio
 @app.route("/slack/command", methods=["POST"])
 def slack_command():
-    data = request.form
+    return handle_command(request.form)
+
+
+def handle_command(data):
     command = data.get("command")
     user_id = data.get("user_id")
     command_text = data.get("text")
+    team_id = data.get("team_id")
     
     if command == "/add-faq":
         trigger_id = data.get("trigger_id")
-        slack_client.views_open(
-            view=faq_submission_view,
+        slack_api.call(
+            "views_open",
+            priority=PRIORITY_HIGH,
+            team_id=team_id,
+            view=blocks.load_view("faq-submission.json"),
             trigger_id=trigger_id
         )
     
     elif command == "/add-faq-reviewer":
-        if user_id != admin:
-            return jsonify({"response_type": "ephemeral", "text": "You are not allowed to use this command."}), 200
+        if user_id != settings.admin:
+            return {"response_type": "ephemeral", "text": "You are not allowed to use this command."}, 200
         
         if command_text.startswith("<@") and command_text.endswith(">"):
             new_reviewer_id = command_text[2:-1]
         else:
-            return jsonify({"response_type": "ephemeral", "text": "The command text must be just a mention of the user."}), 200
+            return {"response_type": "ephemeral", "text": "The command text must be just a mention of the user."}, 200
 
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO reviewers (user_id, admin) VALUES (?, ?)", (new_reviewer_id, False))
-            conn.commit()
+            db.execute(queries.UPSERT_REVIEWER, (new_reviewer_id, False))
         except sqlite3.Error as e:
             raise ValueError(f"Error connecting to database: {e}")
-        finally:
-            conn.close()
+
+    elif command == "/review-faqs":
+        if not review.is_reviewer(db, user_id):
+            return {"response_type": "ephemeral", "text": "You are not allowed to use this command."}, 200
+        if not review.count_pending(db):
+            return {"response_type": "ephemeral", "text": "There are no FAQs waiting for review."}, 200
+
+        slack_api.call(
+            "views_open",
+            priority=PRIORITY_HIGH,
+            team_id=team_id,
+            view=review_queue_view(),
+            trigger_id=data.get("trigger_id")
+        )
 
     return "", 200
 
@@ -255,8 +444,32 @@ def slack_command():
 
 @app.route("/slack/interactions", methods=["POST"])
 def slack_interactions():
-
     payload = json.loads(request.form["payload"])
+    g.interaction = interaction_label(payload)
+    return handle_interaction(payload)
+
+
+def handle_interaction(payload):
+    # Checked before the claim, so a faked click can't use up the key of a real one
+    if payload.get("type") == "block_actions" and payload.get("api_app_id") != settings.slack_api_app_id:
+        return "", 200 # Faked request
+
+    dedupe_key = interaction_dedupe_key(payload)
+    if dedupe_key and not idempotency.claim(*dedupe_key):
+        return "", 200 # Already handled
+
+    try:
+        return dispatch_interaction(payload)
+    except Exception:
+        # Not handled after all, the next click on the same button has to get through
+        if dedupe_key:
+            idempotency.release(*dedupe_key)
+        raise
+
+
+def dispatch_interaction(payload):
+    # Replies go out with the client of the workspace the interaction came from
+    team_id = (payload.get("team") or {}).get("id")
 
     if payload.get("type") == "message_action":
         trigger_id = payload.get("trigger_id")
@@ -265,7 +478,9 @@ def slack_interactions():
         if callback_id == "faq_bot_test":
             channel_id = payload["channel"]["id"]
             user_id = payload["user"]["id"]
-            slack_client.chat_postMessage(
+            slack_api.call(
+                "chat_postMessage",
+                team_id=team_id,
                 channel=channel_id,
                 text=f":hyper-dino-wave: <@{user_id}>"
             )
@@ -275,13 +490,14 @@ def slack_interactions():
         elif callback_id == "faq_trigger_form_open":
             channel_id = payload["channel"]["id"]
             message_ts = payload["message"]["ts"]
-            resp = slack_client.views_open(
-                view=generate_faq_form(channel_id, message_ts),
+            slack_api.call(
+                "views_open",
+                priority=PRIORITY_HIGH,
+                team_id=team_id,
+                view=blocks.trigger_form(channel_id, message_ts),
                 trigger_id=trigger_id
             )
 
-            print("views_open response:", resp)
-
         else:
             return "", 200
 
@@ -298,72 +514,30 @@ def slack_interactions():
             answer = values["answer_block"]["answer"]["value"]
 
             try:
-                conn = sqlite3.connect(db_path)
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO faq_pending (global, question, answer, created_by)
-                    VALUES (?, ?, ?, ?)
-                """, (is_global, question, answer, user_id))
-                
-                faq_id = cursor.lastrowid
-
-                if not is_global:
-                    channels = values["channel_block"]["channels"]["selected_channels"]
+                with db.transaction("submit_faq") as cursor:
+                    cursor.execute("""
+                        INSERT INTO faq_pending (global, question, answer, created_by, team_id)
+                        VALUES (?, ?, ?, ?, ?)
+                    """, (is_global, question, answer, user_id, team_id))
                     
-                    for channel_id in channels:
-                        cursor.execute("""
-                            INSERT INTO faq_pending_channels (faq_id, channel_id)
-                            VALUES (?, ?)
-                        """, (faq_id, channel_id))
+                    faq_id = cursor.lastrowid
 
-                conn.commit()
+                    if not is_global:
+                        channels = values["channel_block"]["channels"]["selected_channels"]
+                        
+                        for channel_id in channels:
+                            cursor.execute("""
+                                INSERT INTO faq_pending_channels (faq_id, channel_id)
+                                VALUES (?, ?)
+                            """, (faq_id, channel_id))
 
             except sqlite3.Error as e:
                 raise ValueError(f"Failed to insert FAQ into database: {e}")
-            finally:
-                cursor.close()
-                conn.close()
 
-            
-            slack_client.chat_postMessage(
-                channel=review_channel_id,
-                text="New FAQ submitted.",
-                blocks=[
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": (
-                                f"New FAQ submitted by <@{user_id}>.\n"
-                                f"Global: `{is_global}`"
-                                + (
-                                    f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
-                                    if not is_global else ""
-                                )
-                                + f"\n*Question:*\n```{question}```\n*Answer:*\n```{answer}```"
-                            )
-                        }
-                    },
-                    {
-                        "type": "actions",
-                        "elements": [
-                            {
-                                "type": "button",
-                                "text": {"type": "plain_text", "text": ":white_check_mark: Approve"},
-                                "value": str(faq_id),
-                                "action_id": "approve_faq"
-                            },
-                            {
-                                "type": "button",
-                                "text": {"type": "plain_text", "text": ":x: Reject"},
-                                "value": str(faq_id),
-                                "action_id": "reject_faq"
-                            }
-                        ]
-                    }
-                ]
-            )
-            
+
+            # The duplicate lookup and the review message don't hold up the response
+            slack_jobs.submit(post_submission_for_review, faq_id, user_id, is_global, [] if is_global else channels, question, answer)
+
             return "", 200
 
 
@@ -375,224 +549,71 @@ def slack_interactions():
             values = payload["view"]["state"]["values"]
             faq_id = values["faq_selection_block"]["faq_selection"]["selected_option"]["value"]
 
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT question, answer FROM faqs WHERE id = ?", (faq_id,))
-            faq = cursor.fetchone()
-            conn.close()
+            section = get_answer_section(faq_id)
+            if section is None:
+                return "", 200 # Deleted since the options were loaded
 
-            slack_client.chat_postMessage(
+            usage_tracker.record(faq_id, channel_id, user_id)
+
+            slack_api.call(
+                "chat_postMessage",
+                team_id=team_id,
                 channel=channel_id,
                 thread_ts=message_ts,
                 text=f"<@{user_id}> has triggered a FAQ response.",
-                blocks=[
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": f"*Question:*\n```{faq[0]}```\n*Answer:*\n```{faq[1]}```"
-                        }
-                    },
-                    {
-                        "type": "context",
-                        "elements": [
-                            {
-                                "type": "mrkdwn",
-                                "text": f"I am a bot. This response triggered by <@{user_id}>"
-                            }
-                        ]
-                    }
-                ]
+                blocks=blocks.triggered_response(section, user_id)
             )
             return "", 200
 
 
-    elif payload.get("type") == "block_actions":
-
-        if payload["api_app_id"] != slack_api_app_id:
-            return "", 200 # Faked request
-        
-        # Transfer faq from pending to normal
-        actions = payload.get("actions")
-        if actions and actions[0]["action_id"] == "approve_faq":
-            # Move to main table
-            pending_faq_id = payload["actions"][0]["value"]
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT global, question, answer, created_by FROM faq_pending WHERE id = ?", (pending_faq_id,))
-            faq = cursor.fetchone()
-            if faq:
-                # Get channels
-                cursor.execute("SELECT channel_id FROM faq_pending_channels WHERE faq_id = ?", (pending_faq_id,))
-                channel_ids = cursor.fetchall()
-                
-                # Add the faq into the approved table
-                cursor.execute("INSERT INTO faqs (global, question, answer, created_by) VALUES (?, ?, ?, ?)", faq)
-                new_faq_id = cursor.lastrowid
-
-                # Map channels to the new FAQ
-                for (channel_id,) in channel_ids:
-                    cursor.execute("INSERT INTO faq_channels (faq_id, channel_id) VALUES (?, ?)", (new_faq_id, channel_id))
-
-                cursor.execute("DELETE FROM faq_pending WHERE id = ?", (payload["actions"][0]["value"],))
-                cursor.execute("DELETE FROM faq_pending_channels WHERE faq_id = ?", (pending_faq_id,))
-            conn.commit()
-            conn.close()
-
-            reviewer_id = payload["user"]["id"]
-            is_global = faq[0]
-            question = faq[1]
-            answer = faq[2]
-            user_id = faq[3]
-            channels = [channel_id for (channel_id,) in channel_ids]
-
-            slack_client.chat_update(
-                channel=review_channel_id,
-                ts=payload["message"]["ts"],
-                text="New FAQ submitted.",
-                blocks=[
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": (
-                                f"New FAQ submitted by <@{user_id}>.\n"
-                                f"Global: `{is_global}`"
-                                + (
-                                    f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
-                                    if not is_global else ""
-                                )
-                                + f"\n*Question:*\n```{question}```\n*Answer:*\n```{answer}```"
-                            )
-                        }
-                    },
-                    {
-                        "type": "context",
-                        "elements": [
-                            {
-                                "type": "mrkdwn",
-                                "text": f":white_check_mark: Approved by <@{reviewer_id}>"
-                            }
-                        ]
-                    }
-                ]
-            )
-
-            # Notify the user
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="Your FAQ submission has been approved!",
-                blocks=[
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": (
-                                f"Your FAQ submission has been approved!\n"
-                                f"Global: `{is_global}`"
-                                + (
-                                    f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
-                                    if not is_global else ""
-                                )
-                                + f"\n*Question:*\n```{question}```\n*Answer:*\n```{answer}```"
-                            )
-                        }
-                    }
-                ]
-            )
+        # Reviewer approves or rejects FAQs from the review queue
+        elif callback_id == "faq_review_queue":
+            if not review.is_reviewer(db, user_id):
+                return {"response_action": "errors", "errors": {"decision_block": "You are not allowed to review FAQs."}}, 200
 
+            private_metadata = json.loads(payload["view"]["private_metadata"])
+            values = payload["view"]["state"]["values"]
+            approved = values["decision_block"]["decision"]["selected_option"]["value"] == "approve"
+            # Nothing selected means every FAQ on the page
+            selected = values["selection_block"]["selection"].get("selected_options") or []
+            pending_ids = [option["value"] for option in selected] or private_metadata["ids"]
+            rejection_reason = None if approved else values["reason_block"]["reason"].get("value")
+
+            reviewed = review_faqs(pending_ids, user_id, approved, rejection_reason)
+            notify_reviewed(reviewed, user_id, approved, rejection_reason)
+
+            # Show what's left of the queue from the same page on
+            if review.count_pending(db):
+                return {"response_action": "update", "view": review_queue_view(private_metadata["after"])}, 200
             return "", 200
 
 
-        elif actions and actions[0]["action_id"] == "reject_faq":
-            # Move to rejected table
-            rejection_reason = "PLACEHOLDER REASON CHANGE THIS LATER WHEN ADDING REASON POPUP" # Change this later when adding reason popup
-
-            pending_faq_id = payload["actions"][0]["value"]
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-            cursor.execute("SELECT global, question, answer, created_by FROM faq_pending WHERE id = ?", (pending_faq_id,))
-            faq = cursor.fetchone()
-            if faq:
-                # Get channels
-                cursor.execute("SELECT channel_id FROM faq_pending_channels WHERE faq_id = ?", (pending_faq_id,))
-                channel_ids = cursor.fetchall()
-                
-                # Add the faq into the rejected table
-                cursor.execute("INSERT INTO faq_rejected (global, question, answer, created_by, rejected_by, reason) VALUES (?, ?, ?, ?, ?, ?)", (faq[0], faq[1], faq[2], faq[3], payload["user"]["id"], rejection_reason))
-                rejected_faq_id = cursor.lastrowid
-
-                # Map channels to the new FAQ
-                for (channel_id,) in channel_ids:
-                    cursor.execute("INSERT INTO faq_rejected_channels (faq_id, channel_id) VALUES (?, ?)", (rejected_faq_id, channel_id))
-
-                cursor.execute("DELETE FROM faq_pending WHERE id = ?", (payload["actions"][0]["value"],))
-            conn.commit()
-            conn.close()
-
+    elif payload.get("type") == "block_actions":
+        actions = payload.get("actions")
+        if actions and actions[0]["action_id"] in ("approve_faq", "reject_faq"):
+            approved = actions[0]["action_id"] == "approve_faq"
             reviewer_id = payload["user"]["id"]
-            is_global = faq[0]
-            question = faq[1]
-            answer = faq[2]
-            user_id = faq[3]
-            channels = [channel_id for (channel_id,) in channel_ids]
+            rejection_reason = None if approved else "PLACEHOLDER REASON CHANGE THIS LATER WHEN ADDING REASON POPUP" # Change this later when adding reason popup
 
+            reviewed = review_faqs([actions[0]["value"]], reviewer_id, approved, rejection_reason)
+            if not reviewed:
+                return "", 200 # Already approved or rejected
 
-            slack_client.chat_update(
-                channel=review_channel_id,
-                ts=payload["message"]["ts"],
-                text="New FAQ submitted.",
-                blocks=[
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": (
-                                f"New FAQ submitted by <@{user_id}>.\n"
-                                f"Global: `{is_global}`"
-                                + (
-                                    f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
-                                    if not is_global else ""
-                                )
-                                + f"\n*Question:*\n```{question}```\n*Answer:*\n```{answer}```"
-                            )
-                        }
-                    },
-                    {
-                        "type": "context",
-                        "elements": [
-                            {
-                                "type": "mrkdwn",
-                                "text": f":x: Rejected by <@{reviewer_id}>"
-                            }
-                        ]
-                    }
-                ]
-            )
+            # Review messages posted before their ts was stored are updated through the click
+            reviewed[0]["review_message_ts"] = payload["message"]["ts"]
+            notify_reviewed(reviewed, reviewer_id, approved, rejection_reason)
+            return "", 200
 
-            # Notify the user
-            slack_client.chat_postMessage(
-                channel=user_id,
-                text="Your FAQ submission has been rejected.",
-                blocks=[
-                    {
-                        "type": "section",
-                        "text": {
-                            "type": "mrkdwn",
-                            "text": (
-                                f"Your FAQ submission has been rejected.\n"
-                                f"Global: `{is_global}`"
-                                + (
-                                    f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
-                                    if not is_global else ""
-                                )
-                                + f"\n*Question:*\n```{question}```\n*Answer:*\n```{answer}```\n*Reason:*\n```{rejection_reason}```"
-                            )
-                        }
-                    }
-                ]
+        # Next/first page of the review queue modal
+        elif actions and actions[0]["action_id"] == "review_queue_page":
+            slack_api.call(
+                "views_update",
+                priority=PRIORITY_HIGH,
+                team_id=team_id,
+                view_id=payload["view"]["id"],
+                hash=payload["view"]["hash"],
+                view=review_queue_view(int(actions[0]["value"]))
             )
-
             return "", 200
 
         
@@ -603,52 +624,290 @@ def slack_interactions():
 @app.route("/slack/external_options_load", methods=["POST"])
 def slack_external_options_load():
     payload = json.loads(request.form["payload"])
-    channel_id = json.loads(payload["view"]["private_metadata"])["channel_id"]
+    g.interaction = interaction_label(payload)
+    return handle_options_load(payload)
 
-    options = get_faq_options(channel_id)
-    return options, 200
 
+def handle_options_load(payload):
+    channel_id = json.loads(payload["view"]["private_metadata"])["channel_id"]
+    query = payload.get("value", "")
+    if settings.snapshot_only and get_current_snapshot() is None:
+        # Slack shows the menu as failed to load, an empty list would look like there are no FAQs
+        metrics.inc("faq_snapshot_unavailable_total")
+        return "No FAQ snapshot has been loaded yet.", 503
+    return get_faq_options(channel_id, query), 200
 
 
-@slack_events_adapter.on("app_mention")
+
+# Registered on the events adapter by create_app()
 def handle_app_mention(event_data):
-    channel_id = event_data["event"]["channel"]
-    timestamp = event_data["event"]["ts"]
+    # Slack keeps the event_id when it retries (X-Slack-Retry-Num) a delivery we were slow to acknowledge
+    if not idempotency.claim("event", event_data["event_id"]):
+        return "", 200
+
+    try:
+        channel_id = event_data["event"]["channel"]
+        timestamp = event_data["event"]["ts"]
+        thread_ts = event_data["event"].get("thread_ts", timestamp)
+        text = event_data["event"].get("text", "")
+        team_id = event_data.get("team_id")
+
+        slack_api.call(
+            "reactions_add",
+            priority=PRIORITY_LOW,
+            team_id=team_id,
+            channel=channel_id,
+            name="hyper-dino-wave",
+            timestamp=timestamp
+        )
+
+        if settings.faq_suggestions_enabled:
+            slack_jobs.submit(suggest_faq, channel_id, thread_ts, text, team_id)
+    except Exception:
+        # Slack's retry of this event has to be handled instead of dropped
+        idempotency.release("event", event_data["event_id"])
+        raise
+
+    return "", 200
+
+
+
+# Registered for app_uninstalled and tokens_revoked, the workspace's token no longer works
+def handle_uninstall(event_data):
+    event = event_data["event"]
+    if event["type"] == "tokens_revoked" and not event.get("tokens", {}).get("bot"):
+        return "", 200 # Only user tokens were revoked
+
+    installations.delete(event_data["team_id"])
+    return "", 200
 
-    slack_client.reactions_add(
+
+
+def suggest_faq(channel_id, thread_ts, text, team_id=None):
+    # Drop the mention of the bot itself
+    text = re.sub(r"<[@#!][^>]*>", " ", text)
+
+    matches = faq_matcher.match(text, channel_id, k=1)
+    if not matches or matches[0][0] < settings.faq_suggestion_min_score:
+        return
+
+    section = get_answer_section(matches[0][1])
+    if section is None:
+        return
+
+    slack_api.call_now(
+        "chat_postMessage",
+        team_id=team_id,
         channel=channel_id,
-        name="hyper-dino-wave",
-        timestamp=timestamp
+        thread_ts=thread_ts,
+        text="This FAQ might answer your question.",
+        blocks=blocks.suggested_response(section)
     )
 
-    return "", 200
+
+
+def post_submission_for_review(pending_faq_id, user_id, is_global, channels, question, answer):
+    with metrics.timer("duplicate_lookup_seconds"):
+        duplicates = duplicate_index.find(question, exclude=("pending", pending_faq_id))
+    duplicate_index.add("pending", pending_faq_id, question)
+
+    response = slack_api.call_now(
+        "chat_postMessage",
+        channel=settings.review_channel_id,
+        text="New FAQ submitted.",
+        blocks=blocks.review_message(user_id, is_global, channels, question, answer, pending_faq_id=pending_faq_id, duplicates=duplicates)
+    )
+    db.execute(queries.SET_REVIEW_MESSAGE_TS, (response["ts"], pending_faq_id))
 
 
 
+def review_faqs(pending_ids, reviewer_id, approved, rejection_reason=None):
+    reviewed = review.approve_or_reject(db, pending_ids, reviewer_id, approved, rejection_reason)
 
-def generate_faq_form(channel_id, message_ts):
-    form = copy.deepcopy(faq_trigger_form)
-    form["private_metadata"] = json.dumps({
-        "channel_id": channel_id,
-        "message_ts": message_ts
-    })
-    return form
+    for item in reviewed:
+        duplicate_index.remove("pending", item["pending_id"])
+        if approved:
+            duplicate_index.add("faq", item["id"], item["question"])
 
+    if approved and reviewed:
+        invalidate_faq_options(any(item["global"] for item in reviewed), {channel_id for item in reviewed for channel_id in item["channels"]})
+        faq_matcher.mark_stale()
+        corpus_version_cache.clear()
 
+    return reviewed
 
-def get_faq_options(channel_id):
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    cursor.execute("""
-        SELECT faqs.id, faqs.question 
-        FROM faqs 
-        LEFT JOIN faq_channels ON faqs.id = faq_channels.faq_id
-        WHERE faqs.global = 1
-        OR faq_channels.channel_id = ?
-    """, (channel_id,))
 
-    faqs = cursor.fetchall()
 
+def notify_reviewed(reviewed, reviewer_id, approved, rejection_reason=None):
+    if not reviewed:
+        return
+
+    # chat.update is limited to about 50 calls a minute. The review messages are updated one after
+    # another by a single job, so a large batch trickles out without tying up every Slack worker.
+    slack_jobs.submit(update_review_messages, reviewed, reviewer_id, approved, priority=PRIORITY_NORMAL if len(reviewed) == 1 else PRIORITY_LOW)
+
+    if len(reviewed) > 1:
+        slack_api.call(
+            "chat_postMessage",
+            channel=settings.review_channel_id,
+            text=f"<@{reviewer_id}> {'approved' if approved else 'rejected'} {len(reviewed)} FAQs from the review queue."
+        )
+
+    # One DM per submitter, however many of their FAQs were reviewed, sent in the workspace they submitted from
+    by_submitter = defaultdict(list)
+    for item in reviewed:
+        by_submitter[item["team_id"], item["created_by"]].append(item)
+
+    for (team_id, user_id), items in by_submitter.items():
+        text, message_blocks = blocks.submitter_message(items, approved, rejection_reason)
+        slack_api.call(
+            "chat_postMessage",
+            priority=PRIORITY_LOW,
+            team_id=team_id,
+            channel=user_id,
+            text=text,
+            blocks=message_blocks
+        )
+
+
+
+def update_review_messages(reviewed, reviewer_id, approved):
+    status = (blocks.APPROVED_STATUS if approved else blocks.REJECTED_STATUS).format(reviewer_id)
+    for item in reviewed:
+        # FAQs imported straight into the queue never had a review message
+        if not item["review_message_ts"]:
+            continue
+        try:
+            slack_api.call_now(
+                "chat_update",
+                channel=settings.review_channel_id,
+                ts=item["review_message_ts"],
+                text="New FAQ submitted.",
+                blocks=blocks.review_message(item["created_by"], item["global"], item["channels"], item["question"], item["answer"], status=status)
+            )
+        except Exception as e:
+            # One deleted message shouldn't stop the rest of the batch
+            print(f"Failed to update review message {item['review_message_ts']}: {e}")
+
+
+
+def review_queue_view(after=0):
+    faqs, next_after = review.pending_page(db, after, settings.review_queue_page_size)
+    if not faqs and after:
+        # Everything after the cursor was reviewed, start over
+        after = 0
+        faqs, next_after = review.pending_page(db, 0, settings.review_queue_page_size)
+
+    return blocks.review_queue(faqs, review.count_pending(db), after, next_after)
+
+
+
+def interaction_label(payload):
+    # (type, callback_id or action_id) used to label interaction metrics
+    interaction_type = payload.get("type", "unknown")
+    if interaction_type in ("view_submission", "view_closed"):
+        return interaction_type, payload.get("view", {}).get("callback_id", "")
+    if interaction_type == "block_actions":
+        actions = payload.get("actions") or [{}]
+        return interaction_type, actions[0].get("action_id", "")
+    if interaction_type == "block_suggestion":
+        return interaction_type, payload.get("action_id", "")
+    return interaction_type, payload.get("callback_id", "")
+
+
+
+def interaction_dedupe_key(payload):
+    # (kind, key) identifying a click or submission, so repeats of it can be dropped
+    interaction_type = payload.get("type")
+    if interaction_type == "block_actions":
+        actions = payload.get("actions")
+        message_ts = payload.get("message", {}).get("ts")
+        if actions and message_ts:
+            return "action", f"{actions[0].get('action_id', '')}:{message_ts}"
+    elif interaction_type == "view_submission":
+        # A view that was updated in place (the review queue) keeps its id but gets a new hash
+        view = payload.get("view", {})
+        if view.get("id"):
+            return "view", f"{view['id']}:{view.get('hash', '')}"
+    return None
+
+
+
+def invalidate_faq_options(is_global, channels):
+    # A global FAQ shows up in every channel's options
+    if is_global:
+        faq_options_cache.clear()
+    else:
+        faq_options_cache.invalidate_where(lambda key: key[0] in channels)
+
+
+
+def get_current_snapshot():
+    return faq_snapshot.current() if faq_snapshot is not None else None
+
+
+def get_answer_section(faq_id):
+    # Rendered answers are keyed by the corpus (or snapshot) version, so an edited FAQ is never
+    # served from the cache, and a hit doesn't need a query at all
+    snapshot = get_current_snapshot()
+    key = (int(faq_id), ("snapshot", snapshot.version) if snapshot is not None else get_corpus_version()[0])
+    section = answer_cache.get(key)
+    if section is None:
+        faq = snapshot.faq(int(faq_id)) if snapshot is not None else db.query_one(queries.FAQ_BY_ID, (faq_id,))
+        if faq is None:
+            return None
+        section = blocks.answer_section(*faq)
+        answer_cache.set(key, section)
+    return section
+
+
+
+def get_corpus_version():
+    cached = corpus_version_cache.get("version")
+    if cached is None:
+        cached = tuple(db.query_one(queries.CORPUS_VERSION))
+        corpus_version_cache.set("version", cached)
+    return cached
+
+
+
+def build_faq_search_query(query):
+    # Turn the typed text into an FTS5 prefix query, e.g. "reset pass" -> "reset"* "pass"*
+    terms = re.findall(r"\w+", query.lower())
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+
+def get_faq_options(channel_id, query=""):
+    search_query = build_faq_search_query(query)
+
+    # The snapshot answers without a query, so its results aren't cached
+    snapshot = get_current_snapshot()
+    if snapshot is not None:
+        if search_query:
+            faqs = snapshot.search(channel_id, query, settings.faq_options_limit)
+        else:
+            faqs = snapshot.options(channel_id, settings.faq_options_limit)
+        return {"options": build_faq_options(faqs)}
+
+    cache_key = (channel_id, search_query)
+    options = faq_options_cache.get(cache_key)
+    if options is not None:
+        return {"options": options}
+
+    if search_query:
+        faqs = db.query(queries.FAQ_OPTIONS_SEARCH, (search_query, channel_id, settings.faq_options_limit))
+    else:
+        since = (datetime.now(timezone.utc) - timedelta(days=settings.popularity_days)).strftime("%Y-%m-%d")
+        faqs = db.query(queries.FAQ_OPTIONS_LIST, {"channel": channel_id, "since": since, "limit": settings.faq_options_limit})
+
+    options = build_faq_options(faqs)
+    faq_options_cache.set(cache_key, options)
+
+    return {"options": options}
+
+
+def build_faq_options(faqs):
     options = []
 
     for row in faqs:
@@ -659,8 +918,7 @@ def get_faq_options(channel_id):
             },
             "value": str(row[0])
         })
-
-    return jsonify({"options": options})
+    return options
 
 
 
@@ -673,4 +931,7 @@ def get_faq_options(channel_id):
 
 
 if __name__ == "__main__":
+    import manage
+    create_app()
+    manage.init(db, settings.admin)
     app.run(port=os.getenv("PORT", 5000), debug=True)
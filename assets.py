@@ -0,0 +1,118 @@
+import gzip
+import hashlib
+import json
+import os
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Static asset build (`manage.py assets`). Every file in website/static is copied to
+# website/static/dist under a name with a hash of its content (css/style.css -> css/style.3f2a9c1d0b7e.css),
+# next to gzip and (if the brotli package is installed) brotli compressed copies. manifest.json maps
+# the original names to the hashed ones for asset_url() in the templates. A hashed file never
+# changes, so browsers and proxies can cache it for a year without revalidating.
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "website", "static")
+DIST = "dist"
+MANIFEST = "manifest.json"
+HASH_LENGTH = 12
+
+# Already compressed or too small to be worth it
+COMPRESS_EXTENSIONS = (".css", ".js", ".svg", ".json", ".txt", ".html", ".map", ".xml", ".ico")
+MIN_COMPRESS_SIZE = 256
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def hashed_name(name, content):
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def build(static_dir=STATIC_DIR, report=print):
+    # Returns the manifest. Files from earlier builds that aren't in the new manifest are removed.
+    dist_dir = os.path.join(static_dir, DIST)
+    manifest = {}
+    written = set()
+
+    for root, dirs, files in os.walk(static_dir):
+        if os.path.abspath(root) == os.path.abspath(static_dir) and DIST in dirs:
+            dirs.remove(DIST)
+        for filename in sorted(files):
+            path = os.path.join(root, filename)
+            name = os.path.relpath(path, static_dir).replace(os.sep, "/")
+            with open(path, "rb") as f:
+                content = f.read()
+
+            output_name = hashed_name(name, content)
+            output_path = os.path.join(dist_dir, output_name)
+            manifest[name] = output_name
+            outputs = [(output_path, content)]
+
+            if filename.endswith(COMPRESS_EXTENSIONS) and len(content) >= MIN_COMPRESS_SIZE:
+                # mtime=0 so the same input always builds the same bytes
+                outputs.append((f"{output_path}.gz", gzip.compress(content, compresslevel=9, mtime=0)))
+                if brotli is not None:
+                    outputs.append((f"{output_path}.br", brotli.compress(content, quality=11)))
+
+            sizes = []
+            for target, data in outputs:
+                written.add(os.path.abspath(target))
+                if not os.path.exists(target):
+                    _write(target, data)
+                sizes.append(f"{os.path.splitext(target)[1] if target != output_path else 'raw'} {len(data)}")
+            report(f"{name} -> {output_name} ({', '.join(sizes)} bytes)")
+
+    # Drop outputs of older builds
+    for root, _, files in os.walk(dist_dir):
+        for filename in files:
+            path = os.path.abspath(os.path.join(root, filename))
+            if path not in written and filename != MANIFEST:
+                os.remove(path)
+
+    _write(os.path.join(dist_dir, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    if brotli is None:
+        report("brotli isn't installed, only gzip copies were written (pip install brotli).")
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    # {} without a build, asset_url() then falls back to the plain files
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def negotiate(accept_encoding, path):
+    # Returns (encoding, suffix) of the best precompressed copy of `path` the client accepts, or (None, "")
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    for encoding, suffix in ENCODINGS:
+        quality = accepted.get(encoding, accepted.get("*", 0.0))
+        if quality > 0 and os.path.isfile(f"{path}{suffix}"):
+            return encoding, suffix
+    return None, ""
@@ -0,0 +1,240 @@
+import aiohttp
+from aiohttp import web
+import app
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from installations import ClientPool
+from jobs import PRIORITY_NORMAL
+import json
+import manage
+import metrics
+import os
+import profiling
+from settings import Settings
+from slack_dispatch import SlackDispatcher
+from slack_sdk.signature import SignatureVerifier
+from slack_sdk.web.async_client import AsyncWebClient
+import time
+import traceback
+
+
+# Optional asyncio server for the Slack endpoints (pip install -r requirements-async.txt).
+# It runs the same handle_* functions as the Flask app, in a thread pool so SQLite queries don't
+# block the event loop, while every outbound Slack call is a task on the loop. A worker isn't tied
+# up for the length of a Slack round trip, so one process can have hundreds of interactions in flight.
+#
+#   gunicorn -c gunicorn.conf.py --worker-class aiohttp.GunicornWebWorker "async_app:create_async_app()"
+#
+# The website (login, /faqs) is only served by the Flask app.
+
+
+# Same token buckets and retries as SlackDispatcher, awaited on the event loop instead of sleeping in a thread
+class AsyncSlackDispatcher(SlackDispatcher):
+    retry_errors = SlackDispatcher.retry_errors + (aiohttp.ClientError,)
+
+    def __init__(self, client=None, max_retries=3, backoff_base=1.0, backoff_max=30.0, clients=None):
+        super().__init__(client, None, max_retries=max_retries, backoff_base=backoff_base, backoff_max=backoff_max, clients=clients)
+        self.loop = None
+
+    async def call_async(self, method, team_id=None, **kwargs):
+        client = self.client_for(team_id)
+        wait = self._bucket(method, kwargs, team_id).reserve()
+        if wait:
+            self.delayed += 1
+            metrics.inc("slack_api_delayed_total", method=method)
+            await asyncio.sleep(wait)
+
+        attempt = 0
+        while True:
+            self.calls += 1
+            started = time.perf_counter()
+            try:
+                return await getattr(client, method)(**kwargs)
+            except self.retry_errors as e:
+                delay = self._retry_delay(method, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                metrics.observe("slack_api_duration_seconds", time.perf_counter() - started, method=method)
+
+            attempt += 1
+            self.retried += 1
+            metrics.inc("slack_api_retries_total", method=method)
+            await asyncio.sleep(delay)
+
+    def call(self, method, priority=PRIORITY_NORMAL, **kwargs):
+        # Called from handler threads. Calls don't wait for a free worker here, so there is nothing to prioritize.
+        future = asyncio.run_coroutine_threadsafe(self.call_async(method, **kwargs), self.loop)
+        future.add_done_callback(lambda future: self._finished(method, future))
+        return True
+
+    def call_now(self, method, **kwargs):
+        # Blocks the calling handler thread, never call it from the event loop itself
+        return asyncio.run_coroutine_threadsafe(self.call_async(method, **kwargs), self.loop).result()
+
+    def _finished(self, method, future):
+        if future.cancelled():
+            return
+        error = future.exception()
+        metrics.inc("jobs_total", queue="slack-async", outcome="failed" if error else "completed")
+        if error:
+            print(f"Slack call {method} failed:")
+            traceback.print_exception(error)
+
+
+def respond(result):
+    # Turns a handler's Flask-style return value into an aiohttp response
+    body, status = result if isinstance(result, tuple) else (result, 200)
+    if isinstance(body, dict):
+        return web.json_response(body, status=status)
+    return web.Response(text=body, status=status)
+
+
+async def slack_command(request):
+    data = await request.post()
+    return respond(await asyncio.to_thread(profiling.call, request.path, app.handle_command, data))
+
+
+async def slack_interactions(request):
+    data = await request.post()
+    payload = json.loads(data["payload"])
+    request["interaction"] = app.interaction_label(payload)
+    return respond(await asyncio.to_thread(profiling.call, request.path, app.handle_interaction, payload))
+
+
+async def slack_external_options_load(request):
+    data = await request.post()
+    payload = json.loads(data["payload"])
+    request["interaction"] = app.interaction_label(payload)
+    return respond(await asyncio.to_thread(profiling.call, request.path, app.handle_options_load, payload))
+
+
+async def slack_events(request):
+    # Mirrors slackeventsapi's Flask endpoint
+    if request.method == "GET":
+        return web.Response(text="These are not the slackbots you're looking for.", status=404)
+
+    body = await request.read()
+    timestamp = request.headers.get("X-Slack-Request-Timestamp")
+    signature = request.headers.get("X-Slack-Signature")
+    if not timestamp or not timestamp.isdigit() or not request.app["signature_verifier"].is_valid(body, timestamp, signature):
+        return web.Response(text="", status=403)
+
+    event_data = json.loads(body.decode("utf-8"))
+    if "challenge" in event_data:
+        return web.Response(text=event_data["challenge"], status=200)
+
+    event_type = event_data.get("event", {}).get("type")
+    if event_type == "app_mention":
+        await asyncio.to_thread(profiling.call, request.path, app.handle_app_mention, event_data)
+    elif event_type in ("app_uninstalled", "tokens_revoked"):
+        await asyncio.to_thread(app.handle_uninstall, event_data)
+    return web.Response(text="", status=200)
+
+
+async def prometheus_metrics(request):
+    text = await asyncio.to_thread(metrics.render)
+    return web.Response(text=text, headers={"Content-Type": "text/plain; version=0.0.4"})
+
+
+@web.middleware
+async def record_request_metrics(request, handler):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        route = request.match_info.route.resource
+        route = route.canonical if route is not None else "unmatched"
+        metrics.observe("http_request_duration_seconds", elapsed, route=route, method=request.method, status=status)
+
+        interaction = request.get("interaction")
+        if interaction:
+            metrics.observe("slack_interaction_duration_seconds", elapsed, type=interaction[0], id=interaction[1])
+
+        metrics.flush()
+
+
+@web.middleware
+async def record_traffic(request, handler):
+    recorder = app.traffic_recorder
+    if recorder is None or request.method != "POST" or not recorder.sampled(request.path):
+        return await handler(request)
+
+    arrived_at = time.time()
+    started = time.perf_counter()
+    # Cached by aiohttp, the handler's request.post() parses the same bytes
+    body = await request.read()
+    status = 500
+    try:
+        response = await handler(request)
+        status = response.status
+        return response
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        try:
+            recorder.record(arrived_at, request.path, request.headers.get("Content-Type", ""), body, status, time.perf_counter() - started, request.headers.get("X-Slack-Retry-Num"))
+        except Exception as e:
+            print(f"Failed to record request: {e}")
+
+
+async def start_slack_client(web_app):
+    settings = web_app["settings"]
+    loop = asyncio.get_running_loop()
+    # asyncio.to_thread() runs on the default executor
+    loop.set_default_executor(ThreadPoolExecutor(max_workers=settings.async_handler_threads, thread_name_prefix="handler"))
+
+    dispatcher = web_app["slack_dispatcher"]
+    session = web_app["slack_session"] = aiohttp.ClientSession()
+    base_url = settings.slack_api_base_url or AsyncWebClient.BASE_URL
+    dispatcher.client = AsyncWebClient(token=settings.slack_bot_token, base_url=base_url, session=session)
+    # Every workspace's client shares the session's connection pool
+    dispatcher.clients = ClientPool(
+        app.installations,
+        lambda token: AsyncWebClient(token=token, base_url=base_url, session=session),
+        max_size=settings.slack_client_pool_size
+    )
+    dispatcher.loop = loop
+
+
+async def close_slack_client(web_app):
+    await web_app["slack_session"].close()
+
+
+def create_async_app(app_settings=None):
+    app_settings = app_settings or Settings.load()
+    dispatcher = AsyncSlackDispatcher(max_retries=app_settings.slack_api_max_retries)
+    app.create_app(app_settings, slack_dispatcher=dispatcher)
+
+    web_app = web.Application(middlewares=[record_request_metrics, record_traffic])
+    web_app["settings"] = app_settings
+    web_app["slack_dispatcher"] = dispatcher
+    web_app["signature_verifier"] = SignatureVerifier(app_settings.slack_signing_secret)
+
+    # An options-load replica only serves the options menu, everything else needs the database
+    if not app_settings.snapshot_only:
+        web_app.router.add_post("/slack/command", slack_command)
+        web_app.router.add_post("/slack/interactions", slack_interactions)
+        web_app.router.add_route("*", "/slack/events", slack_events)
+    web_app.router.add_post("/slack/external_options_load", slack_external_options_load)
+    web_app.router.add_get("/metrics", prometheus_metrics)
+
+    # The client session belongs to the worker's event loop, so it's created on startup
+    web_app.on_startup.append(start_slack_client)
+    web_app.on_cleanup.append(close_slack_client)
+    return web_app
+
+
+if __name__ == "__main__":
+    web_app = create_async_app()
+    if not app.settings.snapshot_only:
+        manage.init(app.db, app.settings.admin)
+    web.run_app(web_app, host="127.0.0.1", port=int(os.getenv("PORT", 5000)))
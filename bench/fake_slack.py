@@ -0,0 +1,77 @@
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import time
+
+
+# Minimal stand-in for the Slack Web API. Point WebClient(base_url=...) at http://host:port/api/
+# and every method answers {"ok": true, ...} after an optional simulated round trip.
+class FakeSlackHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        method = self.path.rsplit("/", 1)[-1]
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.calls[method] += 1
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        body = {"ok": True}
+        if method == "chat.postMessage":
+            body.update({"channel": "C0000000000", "ts": f"{time.time():.6f}"})
+        elif method in ("views.open", "views.update"):
+            body.update({"view": {"id": "V0000000000"}})
+        elif method == "oauth.v2.access":
+            body.update({
+                "access_token": "xoxb-fake",
+                "team": {"id": "T0000000000"},
+                "authed_user": {"id": "U0000000000", "access_token": "xoxp-fake"}
+            })
+
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        # Call counts, handy to check the bot actually did its Slack work
+        data = json.dumps(self.server.calls).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start(port=0, latency=0.0):
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeSlackHandler)
+    server.daemon_threads = True
+    server.calls = Counter()
+    server.latency = latency
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def base_url(server):
+    return f"http://127.0.0.1:{server.server_address[1]}/api/"
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake Slack Web API server.")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds to wait before answering each call.")
+    args = parser.parse_args()
+
+    server = start(args.port, args.latency)
+    print(f"Fake Slack API listening on {base_url(server)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
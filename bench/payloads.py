@@ -0,0 +1,192 @@
+from db import Database
+import hashlib
+import hmac
+import itertools
+import json
+import migrations
+import random
+import time
+from urllib.parse import urlencode
+
+
+WORDS = """
+account access admin api app approve badge billing bot build calendar channel code config
+deploy desk docs email error event expense guest holiday invite laptop leave login lunch
+meeting office onboarding parking password payroll permission printer project reset
+review room schedule security server setup slack support team ticket token travel vacation
+vpn wiki wifi workspace
+""".split()
+
+APP_ID = "A0BENCHAPP"
+TEAM_ID = "T0BENCHTEAM"
+REVIEW_CHANNEL = "C0REVIEW"
+
+
+def channel_ids(count):
+    return [f"C{i:09d}" for i in range(count)]
+
+
+def sentence(rng, low, high):
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def seed_database(path, faqs=1000, channels=50, pending=5000, global_ratio=0.2, seed=1):
+    # Fills a fresh database with approved FAQs (some global, the rest mapped to 1-3 channels)
+    # and pending submissions for the approve/reject clicks to work through.
+    rng = random.Random(seed)
+    db = Database(path)
+    migrations.migrate(db)
+    channel_list = channel_ids(channels)
+
+    with db.transaction() as cursor:
+        faq_rows = []
+        channel_rows = []
+        for faq_id in range(1, faqs + 1):
+            is_global = rng.random() < global_ratio
+            faq_rows.append((faq_id, is_global, sentence(rng, 4, 12) + "?", sentence(rng, 15, 60), "U0BENCH"))
+            if not is_global:
+                for channel_id in rng.sample(channel_list, rng.randint(1, 3)):
+                    channel_rows.append((faq_id, channel_id))
+        cursor.executemany("INSERT INTO faqs (id, global, question, answer, created_by) VALUES (?, ?, ?, ?, ?)", faq_rows)
+        cursor.executemany("INSERT INTO faq_channels (faq_id, channel_id) VALUES (?, ?)", channel_rows)
+
+        pending_rows = []
+        pending_channel_rows = []
+        for pending_id in range(1, pending + 1):
+            is_global = rng.random() < global_ratio
+            pending_rows.append((pending_id, is_global, sentence(rng, 4, 12) + "?", sentence(rng, 15, 60), "U0BENCH"))
+            if not is_global:
+                pending_channel_rows.append((pending_id, rng.choice(channel_list)))
+        cursor.executemany("INSERT INTO faq_pending (id, global, question, answer, created_by) VALUES (?, ?, ?, ?, ?)", pending_rows)
+        cursor.executemany("INSERT INTO faq_pending_channels (faq_id, channel_id) VALUES (?, ?)", pending_channel_rows)
+
+    db.close()
+
+
+def sign(signing_secret, body, timestamp=None):
+    timestamp = str(int(timestamp or time.time()))
+    basestring = f"v0:{timestamp}:".encode() + body
+    signature = "v0=" + hmac.new(signing_secret.encode(), basestring, hashlib.sha256).hexdigest()
+    return {"X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": signature}
+
+
+# Each generator method returns (name, path, body, headers) for one request.
+class PayloadGenerator:
+    def __init__(self, signing_secret, channels=50, pending=5000, seed=1):
+        self.signing_secret = signing_secret
+        self.rng = random.Random(seed)
+        self.channels = channel_ids(channels)
+        self._pending_ids = itertools.count(1)
+        self.pending = pending
+        self._event_ids = itertools.count(1)
+
+    def _form(self, name, path, fields):
+        body = urlencode(fields).encode()
+        headers = {"Content-Type": "application/x-www-form-urlencoded"}
+        headers.update(sign(self.signing_secret, body))
+        return name, path, body, headers
+
+    def _interaction(self, name, payload, path="/slack/interactions"):
+        return self._form(name, path, {"payload": json.dumps(payload)})
+
+    def _user(self):
+        return f"U{self.rng.randint(0, 999):09d}"
+
+    def options_load(self):
+        # Simulates someone typing: an empty query or a prefix of one or two words
+        words = self.rng.sample(WORDS, self.rng.randint(0, 2))
+        query = " ".join(word[:self.rng.randint(2, len(word))] for word in words)
+        return self._interaction("options_load", {
+            "type": "block_suggestion",
+            "action_id": "faq_selection",
+            "value": query,
+            "team": {"id": TEAM_ID},
+            "user": {"id": self._user()},
+            "view": {"private_metadata": json.dumps({"channel_id": self.rng.choice(self.channels), "message_ts": "1700000000.000100"})}
+        }, path="/slack/external_options_load")
+
+    def slash_command(self):
+        return self._form("slash_command", "/slack/command", {
+            "command": "/add-faq",
+            "text": "",
+            "team_id": TEAM_ID,
+            "user_id": self._user(),
+            "channel_id": self.rng.choice(self.channels),
+            "trigger_id": f"{self.rng.randint(1, 10 ** 9)}.trigger"
+        })
+
+    def faq_submission(self):
+        is_global = self.rng.random() < 0.2
+        return self._interaction("faq_submission", {
+            "type": "view_submission",
+            "team": {"id": TEAM_ID},
+            "user": {"id": self._user()},
+            "view": {
+                "callback_id": "faq_submission",
+                "state": {"values": {
+                    "global_block": {"global": {"selected_option": {"value": "1" if is_global else "0"}}},
+                    "channel_block": {"channels": {"selected_channels": [] if is_global else self.rng.sample(self.channels, 2)}},
+                    "question_block": {"question": {"value": sentence(self.rng, 4, 12) + "?"}},
+                    "answer_block": {"answer": {"value": sentence(self.rng, 15, 60)}}
+                }}
+            }
+        })
+
+    def trigger_faq(self, faqs=1000):
+        return self._interaction("trigger_faq", {
+            "type": "view_submission",
+            "team": {"id": TEAM_ID},
+            "user": {"id": self._user()},
+            "view": {
+                "callback_id": "faq_trigger_form_submitted",
+                "private_metadata": json.dumps({"channel_id": self.rng.choice(self.channels), "message_ts": "1700000000.000100"}),
+                "state": {"values": {"faq_selection_block": {"faq_selection": {"selected_option": {"value": str(self.rng.randint(1, faqs))}}}}}
+            }
+        })
+
+    def review_click(self):
+        # Every click uses a fresh pending FAQ, like reviewers working through the queue
+        pending_id = next(self._pending_ids)
+        if pending_id > self.pending:
+            return self.options_load()
+        action_id = "approve_faq" if self.rng.random() < 0.7 else "reject_faq"
+        return self._interaction(action_id, {
+            "type": "block_actions",
+            "api_app_id": APP_ID,
+            "team": {"id": TEAM_ID},
+            "user": {"id": self._user()},
+            "message": {"ts": f"1700000000.{pending_id:06d}"},
+            "actions": [{"action_id": action_id, "value": str(pending_id)}]
+        })
+
+    def app_mention(self):
+        event_id = next(self._event_ids)
+        body = json.dumps({
+            "token": "bench",
+            "team_id": TEAM_ID,
+            "api_app_id": APP_ID,
+            "type": "event_callback",
+            "event_id": f"Ev{event_id:010d}",
+            "event_time": int(time.time()),
+            "event": {
+                "type": "app_mention",
+                "user": self._user(),
+                "text": f"<@U0BOT> {sentence(self.rng, 5, 20)}?",
+                "ts": f"{time.time():.6f}",
+                "channel": self.rng.choice(self.channels)
+            }
+        }).encode()
+        headers = {"Content-Type": "application/json"}
+        headers.update(sign(self.signing_secret, body))
+        return "app_mention", "/slack/events", body, headers
+
+
+# Rough mix of real traffic: mostly typeahead keystrokes
+DEFAULT_MIX = {
+    "options_load": 60,
+    "trigger_faq": 10,
+    "app_mention": 10,
+    "review_click": 8,
+    "faq_submission": 6,
+    "slash_command": 6,
+}
@@ -0,0 +1,156 @@
+import argparse
+import blocks
+from cache import LRUCache
+import copy
+import json
+import os
+import sqlite3
+import time
+import tracemalloc
+
+
+# Micro-benchmarks for building the Slack payloads of the busiest interactions. Each case is run
+# the way app.py used to build it (a deepcopy of the view, nested dicts written out inline) and
+# with blocks.py, and timed including the json.dumps the Slack client does before sending. The FAQ
+# response includes reading the FAQ from an in-memory database, which a cached answer skips.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTION = "How do I reset my password if I no longer have access to the email on my account?"
+ANSWER = "Open the login page, choose 'Forgot password' and follow the steps. " * 4
+
+
+def before_trigger_form(view):
+    form = copy.deepcopy(view)
+    form["private_metadata"] = json.dumps({"channel_id": "C0000000001", "message_ts": "1700000000.000100"})
+    return form
+
+
+def after_trigger_form(view):
+    return blocks.trigger_form("C0000000001", "1700000000.000100")
+
+
+def before_faq_response(conn):
+    faq = conn.execute("SELECT question, answer FROM faqs WHERE id = ?", (1,)).fetchone()
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": f"*Question:*\n```{faq[0]}```\n*Answer:*\n```{faq[1]}```"
+            }
+        },
+        {
+            "type": "context",
+            "elements": [
+                {
+                    "type": "mrkdwn",
+                    "text": "I am a bot. This response triggered by <@U0000000001>"
+                }
+            ]
+        }
+    ]
+
+
+def after_faq_response(state):
+    # What a repeat trigger of the same FAQ does in app.get_answer_section()
+    conn, cache = state
+    section = cache.get((1, 1))
+    if section is None:
+        section = blocks.answer_section(*conn.execute("SELECT question, answer FROM faqs WHERE id = ?", (1,)).fetchone())
+        cache.set((1, 1), section)
+    return blocks.triggered_response(section, "U0000000001")
+
+
+def before_review_message(_):
+    channels = ["C0000000001", "C0000000002"]
+    return [
+        {
+            "type": "section",
+            "text": {
+                "type": "mrkdwn",
+                "text": (
+                    f"New FAQ submitted by <@U0000000001>.\n"
+                    f"Global: `{False}`"
+                    + f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
+                    + f"\n*Question:*\n```{QUESTION}```\n*Answer:*\n```{ANSWER}```"
+                )
+            }
+        },
+        {
+            "type": "actions",
+            "elements": [
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": ":white_check_mark: Approve"},
+                    "value": "42",
+                    "action_id": "approve_faq"
+                },
+                {
+                    "type": "button",
+                    "text": {"type": "plain_text", "text": ":x: Reject"},
+                    "value": "42",
+                    "action_id": "reject_faq"
+                }
+            ]
+        }
+    ]
+
+
+def after_review_message(_):
+    return blocks.review_message("U0000000001", False, ["C0000000001", "C0000000002"], QUESTION, ANSWER, pending_faq_id=42)
+
+
+def measure(build, arg, iterations, repeat=5):
+    # Returns (CPU microseconds per build + json.dumps, best of `repeat` runs, and bytes allocated per build)
+    cpu = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        for _ in range(iterations):
+            json.dumps(build(arg))
+        cpu = min(cpu, (time.process_time() - started) / iterations * 1e6)
+
+    # Keep what was built, so what's allocated per build shows up in the traced memory
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = [build(arg) for _ in range(1000)]
+    allocated = (tracemalloc.get_traced_memory()[0] - before) / len(kept)
+    tracemalloc.stop()
+    return cpu, allocated
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time and measure the allocations of building Slack payloads before and after blocks.py.")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case, the fastest counts.")
+    parser.add_argument("--json", help="Also write the results to this file.")
+    args = parser.parse_args()
+
+    with open(os.path.join(REPO_ROOT, "faq-trigger-form.json")) as f:
+        view = json.load(f)
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE faqs (id INTEGER PRIMARY KEY, question TEXT, answer TEXT)")
+    conn.execute("INSERT INTO faqs VALUES (1, ?, ?)", (QUESTION, ANSWER))
+
+    cases = {
+        "trigger_form": (before_trigger_form, view, after_trigger_form, view),
+        "faq_response": (before_faq_response, conn, after_faq_response, (conn, LRUCache(ttl=3600))),
+        "review_message": (before_review_message, None, after_review_message, None),
+    }
+
+    results = {}
+    print(f"{'case':<16}{'before us':>11}{'after us':>10}{'before B':>10}{'after B':>9}")
+    for name, (before, before_arg, after, after_arg) in cases.items():
+        before_cpu, before_bytes = measure(before, before_arg, args.iterations, args.repeat)
+        after_cpu, after_bytes = measure(after, after_arg, args.iterations, args.repeat)
+        results[name] = {"before_us": before_cpu, "after_us": after_cpu, "before_bytes": before_bytes, "after_bytes": after_bytes}
+        print(f"{name:<16}{before_cpu:>11.2f}{after_cpu:>10.2f}{before_bytes:>10.0f}{after_bytes:>9.0f}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import argparse
+from bench import fake_slack
+from bench.payloads import APP_ID, seed_database, sign
+from bench.run import print_report, send, SIGNING_SECRET, start_server, summarize, wait_for_server
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import http.client
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import traffic
+from urllib.parse import parse_qs
+
+
+# Replays a recording made with TRAFFIC_RECORD_DIR (see traffic.py) against a local bot and fake
+# Slack API, in the recorded order and at the recorded pace (or --speed times faster, 0 for as
+# fast as possible). Requests are signed again with the local secret. The report has the same
+# columns as bench/run.py for the replay and, for comparison, for the recorded production latency.
+#
+# Replay against a copy of the production database from when the recording started
+# (`sqlite3 database.db ".backup copy.db"`), so ids in the requests exist. The copy is never changed.
+
+
+def parse(entry):
+    # The JSON body of an event, the payload of an interaction or the form fields of a command
+    try:
+        if entry["path"] == "/slack/events":
+            return json.loads(entry["body"])
+        fields = parse_qs(entry["body"])
+        if entry["path"] == "/slack/command":
+            return {key: values[0] for key, values in fields.items()}
+        return json.loads(fields.get("payload", ["{}"])[0])
+    except ValueError:
+        return {}
+
+
+def request_name(entry):
+    # Groups requests like the interaction metrics do
+    path = entry["path"]
+    payload = parse(entry)
+    if path == "/slack/events":
+        return f"event:{payload.get('event', {}).get('type', 'other')}"
+    if path == "/slack/command":
+        return f"command:{payload.get('command', '?')}"
+    if path == "/slack/external_options_load":
+        return "options_load"
+    if payload.get("type") == "view_submission":
+        return f"submit:{payload.get('view', {}).get('callback_id', '')}"
+    if payload.get("type") == "block_actions":
+        return f"click:{(payload.get('actions') or [{}])[0].get('action_id', '')}"
+    return payload.get("type", "interaction")
+
+
+def app_id_of(entries):
+    # The bot checks api_app_id of shortcuts against SLACK_API_APP_ID, so the replay uses the recorded one
+    for entry in entries:
+        app_id = parse(entry).get("api_app_id")
+        if app_id:
+            return app_id
+    return APP_ID
+
+
+def replay(host, port, entries, speed, concurrency):
+    # Sends each request at its recorded offset (divided by speed) from a pool of connections.
+    # Returns ({name: [(latency, status)]}, elapsed, how late requests were sent behind schedule).
+    results = defaultdict(list)
+    lateness = []
+    lock = threading.Lock()
+    local = threading.local()
+
+    def run(entry, due):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection(host, port, timeout=30)
+        late = max(0.0, time.monotonic() - due)
+        body = entry["body"].encode()
+        headers = {"Content-Type": entry["content_type"] or "application/x-www-form-urlencoded"}
+        headers.update(sign(SIGNING_SECRET, body))
+        if entry.get("retry"):
+            headers["X-Slack-Retry-Num"] = str(entry["retry"])
+        sample = send(conn, entry["path"], body, headers)
+        with lock:
+            results[request_name(entry)].append(sample)
+            lateness.append(late)
+
+    started = time.monotonic()
+    first = entries[0]["t"] if entries else 0
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for entry in entries:
+            due = started + (entry["t"] - first) / speed if speed else started
+            wait = due - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            pool.submit(run, entry, due)
+    return results, time.monotonic() - started, sorted(lateness)
+
+
+def recorded(entries):
+    # The production numbers of the same requests, in the shape summarize() takes
+    results = defaultdict(list)
+    for entry in entries:
+        results[request_name(entry)].append((entry["duration_ms"] / 1000, entry["status"]))
+    elapsed = entries[-1]["t"] - entries[0]["t"] if len(entries) > 1 else 0.0
+    return results, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded Slack traffic against a local bot and fake Slack API.")
+    parser.add_argument("recording", nargs="+", help="traffic.*.ndjson.gz files, or directories with them.")
+    parser.add_argument("--database", help="Copy of the production database to replay against (copied again, never changed). Seeds a synthetic one without it.")
+    parser.add_argument("--faqs", type=int, default=1000, help="Approved FAQs to seed without --database.")
+    parser.add_argument("--speed", type=float, default=1.0, help="1 replays at the recorded pace, 10 ten times faster, 0 as fast as possible.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Connections requests can be in flight on at once.")
+    parser.add_argument("--limit", type=int, help="Only the first N requests.")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers.")
+    parser.add_argument("--server", choices=("flask", "async"), default="flask", help="Serve with the Flask app or async_app.py.")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="Simulated Slack API round trip in seconds.")
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    paths = []
+    for path in args.recording:
+        paths.extend(sorted(glob.glob(os.path.join(path, "traffic.*.ndjson.gz"))) if os.path.isdir(path) else [path])
+    # Workers write separate files, their requests are merged by arrival time
+    entries = sorted(traffic.read(paths), key=lambda entry: entry["t"])[:args.limit]
+    if not entries:
+        sys.exit("No recorded requests found.")
+    print(f"Replaying {len(entries)} requests recorded over {entries[-1]['t'] - entries[0]['t']:.0f}s from {len(paths)} files...")
+
+    with tempfile.TemporaryDirectory(prefix="faq-bot-replay-") as workdir:
+        database_path = os.path.join(workdir, "replay.db")
+        if args.database:
+            # The backup API gives a consistent copy even of a database in WAL mode
+            source = sqlite3.connect(args.database)
+            target = sqlite3.connect(database_path)
+            source.backup(target)
+            # Events and clicks claimed in production would be dropped as duplicates
+            target.execute("DELETE FROM idempotency_keys")
+            target.commit()
+            source.close()
+            target.close()
+        else:
+            seed_database(database_path, faqs=args.faqs)
+
+        slack = fake_slack.start(latency=args.slack_latency)
+        server = start_server(args.port, database_path, fake_slack.base_url(slack), workdir, args.workers, args.server, extra_env={
+            "SLACK_API_APP_ID": app_id_of(entries),
+            "TRAFFIC_RECORD_DIR": "",
+        })
+        try:
+            wait_for_server("127.0.0.1", args.port)
+            results, elapsed, lateness = replay("127.0.0.1", args.port, entries, args.speed, args.concurrency)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            slack.shutdown()
+
+    report = summarize(results, elapsed)
+    recorded_report = summarize(*recorded(entries))
+    print("Replay:")
+    print_report(report)
+    print("Recorded:")
+    print_report(recorded_report)
+    late_p99 = lateness[min(int(len(lateness) * 0.99), len(lateness) - 1)] * 1000
+    print(f"Sent behind schedule: p99 {late_p99:.1f} ms (raise --concurrency if this grows)")
+    print(f"Slack API calls: {dict(slack.calls)}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": {k: v for k, v in vars(args).items() if k != "json"}, "report": report, "recorded": recorded_report, "late_p99_ms": late_p99}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
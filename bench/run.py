@@ -0,0 +1,208 @@
+import argparse
+from bench import fake_slack
+from bench.payloads import APP_ID, DEFAULT_MIX, PayloadGenerator, REVIEW_CHANNEL, seed_database
+from collections import defaultdict
+import http.client
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIGNING_SECRET = "bench-signing-secret"
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(int(len(sorted_samples) * fraction), len(sorted_samples) - 1)]
+
+
+def summarize(results, elapsed):
+    # results: {name: [(latency seconds, status), ...]}
+    report = {}
+    everything = []
+    for name, samples in sorted(results.items()):
+        latencies = sorted(latency for latency, _ in samples)
+        everything.extend(latencies)
+        report[name] = {
+            "requests": len(samples),
+            "errors": sum(1 for _, status in samples if status >= 400 or status == 0),
+            "rps": len(samples) / elapsed if elapsed else 0.0,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+        }
+    everything.sort()
+    report["total"] = {
+        "requests": len(everything),
+        "errors": sum(entry["errors"] for entry in report.values()),
+        "rps": len(everything) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(everything, 0.50) * 1000,
+        "p95_ms": percentile(everything, 0.95) * 1000,
+        "p99_ms": percentile(everything, 0.99) * 1000,
+    }
+    return report
+
+
+def print_report(report):
+    print(f"{'endpoint':<16}{'requests':>10}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, entry in report.items():
+        print(f"{name:<16}{entry['requests']:>10}{entry['errors']:>8}{entry['rps']:>10.1f}{entry['p50_ms']:>10.2f}{entry['p95_ms']:>10.2f}{entry['p99_ms']:>10.2f}")
+
+
+def send(conn, path, body, headers):
+    started = time.perf_counter()
+    try:
+        conn.request("POST", path, body=body, headers=headers)
+        response = conn.getresponse()
+        response.read()
+        status = response.status
+    except (OSError, http.client.HTTPException):
+        conn.close()
+        status = 0
+    return time.perf_counter() - started, status
+
+
+def wait_for_server(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/metrics")
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on {host}:{port} did not come up within {timeout} seconds.")
+
+
+def start_server(port, database_path, slack_base_url, workdir, workers, server="flask", extra_env=None):
+    env = dict(os.environ)
+    env.update({
+        "PORT": str(port),
+        "GUNICORN_WORKERS": str(workers),
+        "DATABASE_PATH": database_path,
+        "METRICS_DIR": os.path.join(workdir, "metrics"),
+        "SLACK_API_BASE_URL": slack_base_url,
+        "SLACK_BOT_TOKEN": "xoxb-bench",
+        "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+        "SLACK_API_APP_ID": APP_ID,
+        "SLACK_CLIENT_ID": "bench",
+        "SLACK_CLIENT_SECRET": "bench",
+        "SLACK_OAUTH_REDIRECT_URL": f"http://127.0.0.1:{port}/slack/oauth_redirect",
+        "FLASK_SECRET_KEY": "bench",
+        "ADMIN_ID": "U0BENCHADMIN",
+        "FAQ_SUBMISSION_REVIEW_CHANNEL": REVIEW_CHANNEL,
+    })
+    env.update(extra_env or {})
+    # Same gunicorn config as run.sh, only the address and log files are changed
+    if server == "async":
+        app_args = ["--worker-class", "aiohttp.GunicornWebWorker", "async_app:create_async_app()"]
+    else:
+        app_args = ["app:create_app()"]
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "gunicorn",
+            "-c", "gunicorn.conf.py",
+            "--bind", f"127.0.0.1:{port}",
+            "--access-logfile", os.path.join(workdir, "access.log"),
+            "--error-logfile", os.path.join(workdir, "error.log"),
+        ] + app_args,
+        cwd=REPO_ROOT,
+        env=env,
+    )
+
+
+def run_load(host, port, generator, mix, duration, concurrency, faqs):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    results = defaultdict(list)
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(seed):
+        rng = random.Random(seed)
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        local = defaultdict(list)
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            with lock:
+                # The generator isn't thread-safe, and each review click must use a new pending id
+                if name == "trigger_faq":
+                    request = generator.trigger_faq(faqs)
+                else:
+                    request = getattr(generator, name)()
+            request_name, path, body, headers = request
+            local[request_name].append(send(conn, path, body, headers))
+        conn.close()
+        with lock:
+            for name, samples in local.items():
+                results[name].extend(samples)
+
+    started = time.monotonic()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.monotonic() - started
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(","):
+        name, weight = part.split("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the bot's Slack endpoints against a local fake Slack API.")
+    parser.add_argument("--faqs", type=int, default=1000, help="Approved FAQs to seed.")
+    parser.add_argument("--channels", type=int, default=50, help="Channels to spread channel-specific FAQs over.")
+    parser.add_argument("--pending", type=int, default=5000, help="Pending submissions to seed for review clicks.")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds to generate load for.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent client connections.")
+    parser.add_argument("--workers", type=int, default=2, help="Gunicorn workers.")
+    parser.add_argument("--server", choices=("flask", "async"), default="flask", help="Serve with the Flask app or async_app.py.")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--slack-latency", type=float, default=0.05, help="Simulated Slack API round trip in seconds.")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX, help="Request mix, e.g. options_load=80,app_mention=20.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="faq-bot-bench-") as workdir:
+        database_path = os.path.join(workdir, "bench.db")
+        print(f"Seeding {args.faqs} FAQs and {args.pending} pending submissions...")
+        seed_database(database_path, faqs=args.faqs, channels=args.channels, pending=args.pending, seed=args.seed)
+
+        slack = fake_slack.start(latency=args.slack_latency)
+        server = start_server(args.port, database_path, fake_slack.base_url(slack), workdir, args.workers, args.server)
+        try:
+            wait_for_server("127.0.0.1", args.port)
+            generator = PayloadGenerator(SIGNING_SECRET, channels=args.channels, pending=args.pending, seed=args.seed)
+            print(f"Running for {args.duration:.0f}s with {args.concurrency} connections...")
+            results, elapsed = run_load("127.0.0.1", args.port, generator, args.mix, args.duration, args.concurrency, args.faqs)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+            slack.shutdown()
+
+        report = summarize(results, elapsed)
+        print_report(report)
+        print(f"Slack API calls: {dict(slack.calls)}")
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"args": {k: v for k, v in vars(args).items() if k != "json"}, "report": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
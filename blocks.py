@@ -0,0 +1,214 @@
+from functools import cache
+import json
+import os
+
+
+# Block Kit messages and views sent by the bot. The parts that never change are built once at
+# import and shared between requests, a render only creates the few dicts that hold variable
+# fields. Templates must not be changed, their lists are tuples so an accidental append fails.
+
+VIEWS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DIVIDER = {"type": "divider"}
+
+
+def freeze(value):
+    if isinstance(value, dict):
+        return {key: freeze(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+@cache
+def load_view(name):
+    # Views are read on first use and shared, callers swap fields in with a shallow copy
+    with open(os.path.join(VIEWS_DIR, name), "r") as f:
+        return freeze(json.load(f))
+
+
+def plain_text(text):
+    return {"type": "plain_text", "text": text}
+
+
+def mrkdwn_section(text):
+    return {"type": "section", "text": {"type": "mrkdwn", "text": text}}
+
+
+def context(text):
+    return {"type": "context", "elements": ({"type": "mrkdwn", "text": text},)}
+
+
+def trigger_form(channel_id, message_ts):
+    return {
+        **load_view("faq-trigger-form.json"),
+        "private_metadata": json.dumps({
+            "channel_id": channel_id,
+            "message_ts": message_ts
+        })
+    }
+
+
+
+# FAQ responses
+
+SUGGESTION_FOOTER = context("I am a bot. This response was suggested automatically and might not be what you were looking for.")
+
+
+def answer_section(question, answer):
+    # The same for every response with this FAQ, app.py caches it per (faq_id, corpus version)
+    return mrkdwn_section(f"*Question:*\n```{question}```\n*Answer:*\n```{answer}```")
+
+
+def triggered_response(section, user_id):
+    return (section, context(f"I am a bot. This response triggered by <@{user_id}>"))
+
+
+def suggested_response(section):
+    return (section, SUGGESTION_FOOTER)
+
+
+
+# Review
+
+APPROVE_TEXT = plain_text(":white_check_mark: Approve")
+REJECT_TEXT = plain_text(":x: Reject")
+APPROVED_STATUS = ":white_check_mark: Approved by <@{}>"
+REJECTED_STATUS = ":x: Rejected by <@{}>"
+
+
+def faq_summary_text(is_global, channels, question, answer):
+    return (
+        f"Global: `{is_global}`"
+        + (
+            f"\nFor the following channels:\n{', '.join(f'<#{channel_id}>' for channel_id in channels)}."
+            if not is_global else ""
+        )
+        + f"\n*Question:*\n```{question}```\n*Answer:*\n```{answer}```"
+    )
+
+
+def review_message(user_id, is_global, channels, question, answer, pending_faq_id=None, duplicates=(), status=None):
+    # A pending submission gets Approve/Reject buttons, a reviewed one the status line instead
+    blocks = [mrkdwn_section(f"New FAQ submitted by <@{user_id}>.\n" + faq_summary_text(is_global, channels, question, answer))]
+
+    # Point reviewers at approved or pending FAQs that ask nearly the same thing
+    if duplicates:
+        blocks.append(context("Possible duplicates:\n" + "\n".join(
+            f"• {'FAQ' if kind == 'faq' else 'Pending'} #{item_id} ({similarity:.0%} similar): {duplicate_question[:150]}"
+            for similarity, kind, item_id, duplicate_question in duplicates
+        )))
+
+    if status:
+        blocks.append(context(status))
+    else:
+        value = str(pending_faq_id)
+        blocks.append({
+            "type": "actions",
+            "elements": (
+                {"type": "button", "text": APPROVE_TEXT, "value": value, "action_id": "approve_faq"},
+                {"type": "button", "text": REJECT_TEXT, "value": value, "action_id": "reject_faq"},
+            )
+        })
+    return blocks
+
+
+def submitter_message(items, approved, rejection_reason=None):
+    # One DM for all of a submitter's FAQs in a review batch, returns (text, blocks).
+    # A message holds at most 50 blocks.
+    outcome = "approved!" if approved else "rejected."
+    reason_text = f"\n*Reason:*\n```{rejection_reason}```" if rejection_reason else ""
+
+    if len(items) == 1:
+        item = items[0]
+        text = f"Your FAQ submission has been {outcome}"
+        return text, (mrkdwn_section(f"{text}\n" + faq_summary_text(item["global"], item["channels"], item["question"], item["answer"]) + reason_text),)
+
+    text = f"{len(items)} of your FAQ submissions have been {outcome}"
+    blocks = [mrkdwn_section(text + reason_text)]
+    blocks.extend(mrkdwn_section(faq_summary_text(item["global"], item["channels"], item["question"], item["answer"])) for item in items[:49])
+    if len(items) > 49:
+        blocks[-1] = context(f"...and {len(items) - 48} more.")
+    return text, blocks
+
+
+
+# Review queue (/review-faqs)
+
+REVIEW_QUEUE_INPUTS = freeze([
+    {
+        "type": "input",
+        "block_id": "decision_block",
+        "label": plain_text("Decision"),
+        "element": {
+            "type": "radio_buttons",
+            "action_id": "decision",
+            "options": [
+                {"text": APPROVE_TEXT, "value": "approve"},
+                {"text": REJECT_TEXT, "value": "reject"}
+            ]
+        }
+    },
+    {
+        "type": "input",
+        "block_id": "reason_block",
+        "optional": True,
+        "label": plain_text("Rejection reason"),
+        "element": {"type": "plain_text_input", "action_id": "reason", "multiline": True}
+    }
+])
+
+REVIEW_QUEUE_VIEW = freeze({
+    "type": "modal",
+    "callback_id": "faq_review_queue",
+    "title": plain_text("Review FAQs"),
+    "submit": plain_text("Apply"),
+    "close": plain_text("Close"),
+})
+
+FIRST_PAGE_BUTTON = {"type": "button", "text": plain_text("First page"), "value": "0", "action_id": "review_queue_page"}
+
+
+def review_queue(faqs, pending_count, after, next_after):
+    # faqs: [(id, global, question, answer, created_by, channels)] of the current page
+    blocks = [context(f"{pending_count} FAQs waiting for review.")]
+    # Option labels are limited to 75 characters
+    options = []
+    for faq_id, is_global, question, answer, created_by, channels in faqs:
+        blocks.append(mrkdwn_section(
+            f"*#{faq_id}* by <@{created_by}>, "
+            + ("global" if is_global else ", ".join(f"<#{channel_id}>" for channel_id in channels))
+            + f"\n*Question:* {question[:500]}\n*Answer:* {answer[:1000]}"
+        ))
+        label = f"#{faq_id} {question}"
+        options.append({"text": plain_text((label[:72] + "...") if len(label) > 75 else label), "value": str(faq_id)})
+
+    navigation = []
+    if after:
+        navigation.append(FIRST_PAGE_BUTTON)
+    if next_after:
+        navigation.append({"type": "button", "text": plain_text("Next page"), "value": str(next_after), "action_id": "review_queue_page"})
+    if navigation:
+        blocks.append({"type": "actions", "elements": navigation})
+
+    blocks.append(DIVIDER)
+    blocks.append({
+        "type": "input",
+        "block_id": "selection_block",
+        "optional": True,
+        "label": plain_text("FAQs"),
+        "hint": plain_text("Leave empty to apply the decision to every FAQ on this page."),
+        "element": {
+            "type": "multi_static_select",
+            "action_id": "selection",
+            "placeholder": plain_text("Select FAQs"),
+            "options": options
+        }
+    })
+    blocks.extend(REVIEW_QUEUE_INPUTS)
+
+    return {
+        **REVIEW_QUEUE_VIEW,
+        "private_metadata": json.dumps({"after": after, "ids": [faq[0] for faq in faqs]}),
+        "blocks": blocks
+    }
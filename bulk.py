@@ -0,0 +1,193 @@
+import csv
+import json
+import os
+import time
+
+
+# Streaming import/export of FAQs as JSONL or CSV, used by `manage.py import` and `manage.py export`.
+# Records look like {"question": ..., "answer": ..., "global": true, "channels": ["C123"], "created_by": "U123"},
+# in CSV the channels are separated by spaces.
+
+FORMATS = ("jsonl", "csv")
+CSV_FIELDS = ["id", "global", "question", "answer", "channels", "created_by"]
+
+# (faq table, channel table)
+TABLES = {
+    False: ("faqs", "faq_channels"),
+    True: ("faq_pending", "faq_pending_channels"),
+}
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+def read_records(f, fmt):
+    # Yields (line number, record) without reading the whole file. A line that isn't valid JSON
+    # is yielded as (line number, None), so it's skipped and counted like any other invalid record.
+    if fmt == "csv":
+        reader = csv.DictReader(f)
+        for record in reader:
+            yield reader.line_num, record
+    else:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if line:
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError:
+                    yield line_number, None
+
+
+def parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "y")
+    return bool(value)
+
+
+def normalize(record, default_created_by):
+    # Returns (global, question, answer, created_by, channels) or raises ValueError
+    question = (record.get("question") or "").strip()
+    answer = (record.get("answer") or "").strip()
+    if not question or not answer:
+        raise ValueError("question and answer are required")
+
+    channels = record.get("channels") or []
+    if isinstance(channels, str):
+        channels = channels.replace(",", " ").split()
+
+    # Without channels an FAQ can only be global
+    is_global = parse_bool(record["global"]) if record.get("global") not in (None, "") else not channels
+    if is_global:
+        channels = []
+    elif not channels:
+        raise ValueError("a non-global FAQ needs at least one channel")
+
+    return is_global, question, answer, record.get("created_by") or default_created_by, list(dict.fromkeys(channels))
+
+
+def next_id(cursor, table):
+    # AUTOINCREMENT never reuses ids, so start after both the largest id and the recorded sequence
+    max_id = cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}").fetchone()[0]
+    seq = cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (table,)).fetchone()
+    return max(max_id, seq[0] if seq else 0) + 1
+
+
+def write_batch(db, batch, pending=False):
+    # Writes one batch of normalized records in a single transaction. Ids are assigned up front
+    # so the channel rows can be inserted with executemany too.
+    faq_table, channel_table = TABLES[pending]
+    with db.transaction("import_batch") as cursor:
+        first_id = next_id(cursor, faq_table)
+        faq_rows = []
+        channel_rows = []
+        for faq_id, (is_global, question, answer, created_by, channels) in enumerate(batch, first_id):
+            faq_rows.append((faq_id, is_global, question, answer, created_by))
+            channel_rows.extend((faq_id, channel_id) for channel_id in channels)
+
+        cursor.executemany(f"INSERT INTO {faq_table} (id, global, question, answer, created_by) VALUES (?, ?, ?, ?, ?)", faq_rows)
+        cursor.executemany(f"INSERT INTO {channel_table} (faq_id, channel_id) VALUES (?, ?)", channel_rows)
+
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)["records"]
+    except (OSError, ValueError, KeyError):
+        return 0
+
+
+def save_checkpoint(path, records):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"records": records}, f)
+    os.replace(tmp_path, path)
+
+
+def import_records(db, records, pending=False, batch_size=5000, skip=0, created_by="import", checkpoint=None, report=print):
+    # records is an iterator of (line number, record). The first `skip` records were imported by an
+    # earlier run. After every committed batch the number of records read so far goes to the checkpoint file.
+    stats = {"read": 0, "imported": 0, "invalid": 0}
+    started = time.perf_counter()
+    batch = []
+    flushed_at = skip
+
+    def flush():
+        nonlocal flushed_at
+        if not batch and stats["read"] == flushed_at:
+            return
+        flushed_at = stats["read"]
+        if batch:
+            write_batch(db, batch, pending)
+            stats["imported"] += len(batch)
+            batch.clear()
+        if checkpoint:
+            save_checkpoint(checkpoint, stats["read"])
+        elapsed = time.perf_counter() - started
+        report(f"{stats['read']} records read, {stats['imported']} imported, {stats['invalid']} invalid ({stats['imported'] / elapsed if elapsed else 0:.0f} records/s)")
+
+    for line_number, record in records:
+        stats["read"] += 1
+        if stats["read"] <= skip:
+            continue
+        if record is None:
+            stats["invalid"] += 1
+            report(f"Skipping line {line_number}: not valid JSON")
+            continue
+        try:
+            batch.append(normalize(record, created_by))
+        except (ValueError, KeyError, AttributeError) as e:
+            stats["invalid"] += 1
+            report(f"Skipping line {line_number}: {e}")
+            continue
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def export_records(db, pending=False, batch_size=5000):
+    # Yields records in id order, reading one keyset page at a time
+    faq_table, channel_table = TABLES[pending]
+    sql = f"""
+        SELECT id, global, question, answer, created_by,
+            (SELECT GROUP_CONCAT(channel_id, ' ') FROM {channel_table} WHERE {channel_table}.faq_id = {faq_table}.id)
+        FROM {faq_table}
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    """
+    after = 0
+    while True:
+        rows = db.query(sql, (after, batch_size), name="export_batch")
+        for faq_id, is_global, question, answer, created_by, channels in rows:
+            yield {
+                "id": faq_id,
+                "global": bool(is_global),
+                "question": question,
+                "answer": answer,
+                "channels": channels.split() if channels else [],
+                "created_by": created_by,
+            }
+        if len(rows) < batch_size:
+            return
+        after = rows[-1][0]
+
+
+def write_records(f, records, fmt):
+    count = 0
+    if fmt == "csv":
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for record in records:
+            writer.writerow(dict(record, channels=" ".join(record["channels"]), **{"global": int(record["global"])}))
+            count += 1
+    else:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+            count += 1
+    return count
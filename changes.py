@@ -0,0 +1,37 @@
+import json
+import queries
+import time
+
+
+# Reads the change log that the triggers from migration 5 fill. Every approval, rejection, edit,
+# delete and reviewer change gets an increasing id, so consumers only pull what is newer than
+# the last id they saw instead of re-reading the faqs tables. SQLite has one writer at a time, so
+# ids become visible in order and a cursor never skips a change.
+
+def to_dict(row):
+    change_id, entity, entity_id, action, data, created_at = row
+    return {
+        "id": change_id,
+        "entity": entity,
+        "entity_id": entity_id,
+        "action": action,
+        "data": json.loads(data) if data else None,
+        "created_at": created_at,
+    }
+
+
+def read(db, since=0, limit=1000):
+    return [to_dict(row) for row in db.query(queries.CHANGES_SINCE, (since, limit))]
+
+
+def stream(db, since=0, batch_size=1000, follow=False, poll_interval=1.0):
+    # Yields changes in id order, one batch at a time. With follow it keeps polling for new ones.
+    while True:
+        batch = read(db, since, batch_size)
+        yield from batch
+        if batch:
+            since = batch[-1]["id"]
+        if len(batch) < batch_size:
+            if not follow:
+                return
+            time.sleep(poll_interval)
@@ -0,0 +1,88 @@
+from contextlib import contextmanager
+import metrics
+import os
+from queries import QUERY_NAMES
+import sqlite3
+import threading
+import time
+
+
+# Keeps one long-lived SQLite connection per thread (and per gunicorn worker process)
+# instead of opening a new connection for every query.
+class Database:
+    def __init__(self, path, busy_timeout=5000, cache_size=-16000, mmap_size=64 * 1024 * 1024, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+
+    def connect(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout / 1000,
+            isolation_level=None, # Autocommit, transactions are started explicitly in transaction()
+            cached_statements=self.cached_statements
+        )
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        # Only takes effect for a new database file (existing ones switch with `manage.py maintenance --full-vacuum`),
+        # it lets maintenance give freed pages back to the filesystem without rewriting the whole file
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    @property
+    def conn(self):
+        # Connections can't be shared with a forked process, so they are keyed by pid as well
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = self.connect()
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # Queries are timed under `name`, or their name in queries.py, or "other"
+    def query(self, sql, params=(), name=None):
+        with metrics.timer("db_query_duration_seconds", query=name or QUERY_NAMES.get(sql, "other")):
+            return self.conn.execute(sql, params).fetchall()
+
+    def query_one(self, sql, params=(), name=None):
+        with metrics.timer("db_query_duration_seconds", query=name or QUERY_NAMES.get(sql, "other")):
+            return self.conn.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=(), name=None):
+        with metrics.timer("db_query_duration_seconds", query=name or QUERY_NAMES.get(sql, "other")):
+            return self.conn.execute(sql, params)
+
+    @contextmanager
+    def transaction(self, name="transaction"):
+        conn = self.conn
+        # Nested use joins the outer transaction
+        if conn.in_transaction:
+            yield conn.cursor()
+            return
+
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+        finally:
+            cursor.close()
+            metrics.observe("db_query_duration_seconds", time.perf_counter() - started, query=name)
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            conn.close()
+        self._local.conn = None
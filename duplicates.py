@@ -0,0 +1,134 @@
+from collections import defaultdict
+import hashlib
+from matcher import tokenize
+import random
+import threading
+import time
+
+
+# MinHash signature size and LSH banding. Two questions land in the same bucket in at least one
+# band with a probability of about 1 - (1 - J^ROWS)^BANDS, which is ~50% at a Jaccard similarity
+# of 0.5 and over 95% at 0.7.
+BANDS = 8
+ROWS = 4
+_rng = random.Random(20020)
+MASKS = tuple(_rng.getrandbits(64) for _ in range(BANDS * ROWS))
+
+# Candidates below this word overlap (Jaccard) aren't reported
+MIN_SIMILARITY = 0.5
+
+
+_token_hashes = {}
+
+
+def _token_hash(token):
+    value = _token_hashes.get(token)
+    if value is None:
+        value = _token_hashes[token] = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+    return value
+
+
+def signature(tokens):
+    hashes = [_token_hash(token) for token in tokens]
+    return tuple(min(value ^ mask for value in hashes) for mask in MASKS)
+
+
+# MinHash/LSH index over the questions of approved and pending FAQs, used to point reviewers at
+# likely duplicates of a new submission. A lookup only compares against the questions that share
+# an LSH bucket with it instead of the whole corpus. Like FaqMatcher it loads new rows by id.
+class DuplicateIndex:
+    def __init__(self, db, refresh_interval=5, min_similarity=MIN_SIMILARITY):
+        self.db = db
+        self.refresh_interval = refresh_interval
+        self.min_similarity = min_similarity
+
+        self._lock = threading.Lock()
+        self._buckets = defaultdict(set)
+        # ("faq" or "pending", id) -> (tokens, band keys, question)
+        self._entries = {}
+        self._last_ids = {"faq": 0, "pending": 0}
+        self._last_refresh = 0
+
+    def _add(self, key, question):
+        tokens = frozenset(tokenize(question))
+        if not tokens:
+            return
+        sig = signature(tokens)
+        bands = [hash((band, sig[band * ROWS:(band + 1) * ROWS])) for band in range(BANDS)]
+        for band_key in bands:
+            self._buckets[band_key].add(key)
+        self._entries[key] = (tokens, bands, question)
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band_key in entry[1]:
+            bucket = self._buckets[band_key]
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[band_key]
+
+    def add(self, kind, item_id, question):
+        # For rows this process just inserted, so it doesn't wait for the next refresh. The refresh
+        # cursor isn't moved, rows with lower ids from other workers may not have been loaded yet.
+        with self._lock:
+            self._add((kind, item_id), question)
+
+    def remove(self, kind, item_id):
+        with self._lock:
+            self._remove((kind, item_id))
+
+    def _load_new(self, kind, table):
+        rows = self.db.query(f"SELECT id, question FROM {table} WHERE id > ? ORDER BY id", (self._last_ids[kind],))
+        for item_id, question in rows:
+            # Rows added with add() are already indexed
+            if (kind, item_id) not in self._entries:
+                self._add((kind, item_id), question)
+        if rows:
+            self._last_ids[kind] = rows[-1][0]
+
+    def mark_stale(self):
+        self._last_refresh = 0
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        self._last_refresh = time.monotonic()
+
+        with self._lock:
+            for kind, table in (("faq", "faqs"), ("pending", "faq_pending")):
+                self._load_new(kind, table)
+
+            # Pending submissions leave the queue when they are reviewed, and approved FAQs can be
+            # deleted. Drop whatever isn't in the database any more. The ids are compared rather than
+            # the row counts, which stay the same when one submission is reviewed and another comes in.
+            for kind, table in (("faq", "faqs"), ("pending", "faq_pending")):
+                existing = {row[0] for row in self.db.query(f"SELECT id FROM {table}")}
+                for key in [key for key in self._entries if key[0] == kind and key[1] not in existing]:
+                    self._remove(key)
+
+    def find(self, question, exclude=None, k=3):
+        # Returns up to k [(similarity, kind, id, question)] sorted by similarity
+        self.refresh()
+
+        tokens = frozenset(tokenize(question))
+        if not tokens:
+            return []
+        sig = signature(tokens)
+
+        with self._lock:
+            candidates = set()
+            for band in range(BANDS):
+                candidates.update(self._buckets.get(hash((band, sig[band * ROWS:(band + 1) * ROWS])), ()))
+            candidates.discard(exclude)
+
+            results = []
+            for key in candidates:
+                other_tokens, _, other_question = self._entries[key]
+                similarity = len(tokens & other_tokens) / len(tokens | other_tokens)
+                if similarity >= self.min_similarity:
+                    results.append((similarity, key[0], key[1], other_question))
+
+        results.sort(reverse=True)
+        return results[:k]
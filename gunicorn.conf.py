@@ -0,0 +1,33 @@
+from db import Database
+import manage
+import metrics
+import os
+from settings import Settings
+
+
+# Used by run.sh and the benchmarks in bench/, so both run the same server setup
+bind = f"127.0.0.1:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv("GUNICORN_WORKERS", 2))
+accesslog = "./logs/access.log"
+errorlog = "./logs/error.log"
+
+# create_app() runs once in the master and workers are forked from it, so they start in milliseconds.
+# Code changes need a full restart instead of a HUP.
+preload_app = True
+
+
+def on_starting(server):
+    metrics.reset_directory()
+
+    settings = Settings.load()
+    if settings.snapshot_only:
+        return # No database to set up on an options-load replica
+    db = Database(settings.db_path)
+    try:
+        manage.init(db, settings.admin)
+    finally:
+        db.close()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
@@ -0,0 +1,60 @@
+from cache import LRUCache
+import metrics
+import queries
+import time
+
+
+# Remembers Slack events and clicks that were already handled so retries (X-Slack-Retry-Num) and
+# double-clicks can be dropped. Keys live in SQLite so every worker sees them, with a small
+# per-process LRU in front so repeats that land on the worker that claimed a key don't touch the
+# database. Only this worker's own claims go in the LRU: a duplicate seen here is checked in the
+# database every time, so a key released by the worker that claimed it can be claimed again anywhere.
+class IdempotencyStore:
+    def __init__(self, db, ttl=900, local_size=4096, purge_interval=60):
+        self.db = db
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._local = LRUCache(max_size=local_size, ttl=ttl)
+        self._last_purge = 0
+
+        self.new = 0
+        self.duplicates = 0
+
+    def claim(self, kind, key):
+        # True the first time a key is seen within the TTL, False for duplicates
+        full_key = f"{kind}:{key}"
+        if self._local.get(full_key) is not None:
+            self.duplicates += 1
+            metrics.inc("idempotency_checks_total", kind=kind, result="duplicate", source="local")
+            return False
+
+        now = time.time()
+        claimed = self.db.execute(queries.CLAIM_IDEMPOTENCY_KEY, (full_key, now + self.ttl, now)).rowcount == 1
+
+        if claimed:
+            self._local.set(full_key, True)
+            self.new += 1
+            metrics.inc("idempotency_checks_total", kind=kind, result="new", source="db")
+        else:
+            self.duplicates += 1
+            metrics.inc("idempotency_checks_total", kind=kind, result="duplicate", source="db")
+
+        if now - self._last_purge > self.purge_interval:
+            self._last_purge = now
+            self.db.execute(queries.PURGE_IDEMPOTENCY_KEYS, (now,))
+
+        return claimed
+
+    def release(self, kind, key):
+        # Forgets a claim whose handler failed, so a retry of the same event or click runs it again
+        full_key = f"{kind}:{key}"
+        self._local.invalidate(full_key)
+        self.db.execute(queries.RELEASE_IDEMPOTENCY_KEY, (full_key,))
+        metrics.inc("idempotency_releases_total", kind=kind)
+
+    def stats(self):
+        return {
+            "new": self.new,
+            "duplicates": self.duplicates,
+            "local_size": len(self._local),
+        }
@@ -0,0 +1,71 @@
+from cache import LRUCache
+from collections import OrderedDict
+import queries
+import threading
+import time
+
+
+_MISSING = object()
+
+
+# Bot tokens of the workspaces (teams) the app is installed in, saved by the OAuth redirect.
+# Lookups happen on every outbound Slack call, so tokens are kept in an LRU cache. Teams without
+# an installation are cached too (as None) so they don't query the database each time.
+class InstallationStore:
+    def __init__(self, db, cache_size=1000, ttl=300):
+        self.db = db
+        self._cache = LRUCache(max_size=cache_size, ttl=ttl)
+
+    def save(self, team_id, bot_token, bot_user_id=None, installed_by=None):
+        self.db.execute(queries.UPSERT_INSTALLATION, (team_id, bot_token, bot_user_id, installed_by, int(time.time())))
+        self._cache.set(team_id, bot_token)
+
+    def delete(self, team_id):
+        self.db.execute(queries.DELETE_INSTALLATION, (team_id,))
+        self._cache.set(team_id, None)
+
+    def bot_token(self, team_id):
+        token = self._cache.get(team_id, _MISSING)
+        if token is _MISSING:
+            row = self.db.query_one(queries.INSTALLATION_TOKEN, (team_id,))
+            token = row[0] if row else None
+            self._cache.set(team_id, token)
+        return token
+
+
+# One Slack client per team, reused by every request for that team instead of building a client
+# per call. `factory(token)` makes a client, the least recently used ones are dropped past max_size.
+# A reinstall that changes the token replaces the team's client.
+class ClientPool:
+    def __init__(self, installations, factory, max_size=256):
+        self.installations = installations
+        self.factory = factory
+        self.max_size = max_size
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, team_id):
+        # None when the app isn't installed in the team
+        token = self.installations.bot_token(team_id)
+        if token is None:
+            return None
+
+        with self._lock:
+            entry = self._clients.get(team_id)
+            if entry is not None and entry[0] == token:
+                self._clients.move_to_end(team_id)
+                return entry[1]
+
+            client = self.factory(token)
+            self._clients[team_id] = (token, client)
+            self._clients.move_to_end(team_id)
+            while len(self._clients) > self.max_size:
+                self._clients.popitem(last=False)
+            return client
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
@@ -0,0 +1,139 @@
+from collections import deque
+import itertools
+import metrics
+import os
+import queue
+import threading
+import time
+import traceback
+
+
+# Lower numbers run first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+_PRIORITY_SHUTDOWN = 10
+
+
+# Bounded priority queue + thread pool for work that should happen after the HTTP response
+# (mostly outbound Slack API calls). When the queue is full the caller runs the
+# job itself, which slows down intake instead of dropping work.
+class JobQueue:
+    def __init__(self, name, workers=4, max_size=1000, put_timeout=0.5):
+        self.name = name
+        self.workers = workers
+        self.max_size = max_size
+        self.put_timeout = put_timeout
+
+        self._queue = queue.PriorityQueue(maxsize=max_size)
+        self._sequence = itertools.count()
+        self._threads = []
+        self._pid = None
+        self._lock = threading.Lock()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.ran_inline = 0
+        self._wait_times = deque(maxlen=1000)
+        self._run_times = deque(maxlen=1000)
+
+    def _ensure_started(self):
+        # Threads don't survive a fork, so start them lazily in each gunicorn worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.PriorityQueue(maxsize=self.max_size)
+            self._threads = []
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._pid = os.getpid()
+
+    def submit(self, fn, *args, priority=PRIORITY_NORMAL, **kwargs):
+        self._ensure_started()
+        job = (time.monotonic(), fn, args, kwargs)
+        self.submitted += 1
+        try:
+            # The sequence number keeps jobs of the same priority in FIFO order
+            self._queue.put((priority, next(self._sequence), job), timeout=self.put_timeout)
+            return True
+        except queue.Full:
+            self.ran_inline += 1
+            metrics.inc("jobs_total", queue=self.name, outcome="ran_inline")
+            self._run(job)
+            return False
+
+    def _worker(self):
+        while True:
+            _, _, job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        enqueued_at, fn, args, kwargs = job
+        started_at = time.monotonic()
+        self._wait_times.append(started_at - enqueued_at)
+        metrics.observe("job_wait_seconds", started_at - enqueued_at, queue=self.name)
+        outcome = "completed"
+        try:
+            fn(*args, **kwargs)
+            self.completed += 1
+        except Exception:
+            self.failed += 1
+            outcome = "failed"
+            print(f"Job {getattr(fn, '__name__', fn)} failed in {self.name}:")
+            traceback.print_exc()
+        finally:
+            run_time = time.monotonic() - started_at
+            self._run_times.append(run_time)
+            metrics.observe("job_run_seconds", run_time, queue=self.name)
+            metrics.inc("jobs_total", queue=self.name, outcome=outcome)
+            metrics.set_gauge("job_queue_depth", self._queue.qsize(), queue=self.name)
+
+    def shutdown(self, timeout=10):
+        # Give queued jobs a chance to finish when the worker exits
+        if self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put((_PRIORITY_SHUTDOWN, next(self._sequence), None), timeout=max(deadline - time.monotonic(), 0))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(deadline - time.monotonic(), 0))
+
+    def stats(self):
+        return {
+            "name": self.name,
+            "workers": self.workers,
+            "queue_depth": self._queue.qsize(),
+            "queue_max_size": self.max_size,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "ran_inline": self.ran_inline,
+            "wait_seconds": _summarize(self._wait_times),
+            "run_seconds": _summarize(self._run_times),
+        }
+
+
+def _summarize(samples):
+    samples = sorted(samples)
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "p50": samples[int(len(samples) * 0.50)],
+        "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)],
+        "max": samples[-1],
+    }
@@ -0,0 +1,151 @@
+import json
+import os
+import time
+
+
+# Housekeeping for the database, meant to run from cron (`manage.py maintenance`):
+#
+#   - Rejected FAQs older than a cutoff are moved to a separate archive database in batches, so
+#     the tables the bot reads stay small. Each batch is written to the archive before it's
+#     deleted here, a run that stops halfway copies the same rows again next time.
+#   - Rows pointing at FAQs that no longer exist are deleted (channel mappings left behind by the
+#     old reject path and by deleted FAQs, usage of deleted FAQs).
+#   - Site user tokens that haven't been refreshed by a login in a while are dropped.
+#   - Freed pages are given back with an incremental VACUUM, statistics are refreshed with ANALYZE
+#     and the WAL is truncated, so the file (and the pages worth caching) shrinks with the data.
+
+ARCHIVE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS faq_rejected (
+        id INTEGER PRIMARY KEY,
+        global BOOLEAN NOT NULL,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        created_by TEXT NOT NULL,
+        rejected_by TEXT NOT NULL,
+        reason TEXT,
+        rejected_at INTEGER,
+        archived_at INTEGER NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS faq_rejected_channels (
+        faq_id INTEGER NOT NULL,
+        channel_id INTEGER NOT NULL,
+        PRIMARY KEY (faq_id, channel_id)
+    ) WITHOUT ROWID
+    """,
+]
+
+ORPHANS = {
+    "faq_pending_channels": "DELETE FROM faq_pending_channels WHERE faq_id NOT IN (SELECT id FROM faq_pending)",
+    "faq_rejected_channels": "DELETE FROM faq_rejected_channels WHERE faq_id NOT IN (SELECT id FROM faq_rejected)",
+    "faq_channels": "DELETE FROM faq_channels WHERE faq_id NOT IN (SELECT id FROM faqs)",
+    "faq_usage_daily": "DELETE FROM faq_usage_daily WHERE faq_id NOT IN (SELECT id FROM faqs)",
+    "faq_usage_events": "DELETE FROM faq_usage_events WHERE faq_id NOT IN (SELECT id FROM faqs)",
+}
+
+
+def file_size(path):
+    # The database and its WAL, which holds pages that haven't been checkpointed yet
+    return sum(os.path.getsize(p) for p in (path, f"{path}-wal") if os.path.exists(p))
+
+
+def archive_rejected(db, archive, before, batch_size=500):
+    # Moves rejections from before the `before` timestamp to the `archive` database, returns how many
+    for statement in ARCHIVE_SCHEMA:
+        archive.execute(statement)
+
+    archived = 0
+    while True:
+        rows = db.query(
+            "SELECT id, global, question, answer, created_by, rejected_by, reason, rejected_at FROM faq_rejected WHERE rejected_at < ? LIMIT ?",
+            (before, batch_size),
+            name="archive_rejected_select"
+        )
+        if not rows:
+            return archived
+
+        ids = json.dumps([row[0] for row in rows])
+        channels = db.query("SELECT faq_id, channel_id FROM faq_rejected_channels WHERE faq_id IN (SELECT value FROM json_each(?))", (ids,), name="archive_rejected_channels")
+        now = int(time.time())
+
+        with archive.transaction("archive_rejected_insert") as cursor:
+            cursor.executemany("INSERT OR REPLACE INTO faq_rejected VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", [row + (now,) for row in rows])
+            cursor.executemany("INSERT OR IGNORE INTO faq_rejected_channels (faq_id, channel_id) VALUES (?, ?)", channels)
+        with db.transaction("archive_rejected_delete") as cursor:
+            cursor.execute("DELETE FROM faq_rejected_channels WHERE faq_id IN (SELECT value FROM json_each(?))", (ids,))
+            cursor.execute("DELETE FROM faq_rejected WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+        archived += len(rows)
+
+
+def delete_orphans(db):
+    # Returns {table: rows deleted}
+    deleted = {}
+    with db.transaction("delete_orphans") as cursor:
+        for table, sql in ORPHANS.items():
+            deleted[table] = cursor.execute(sql).rowcount
+    return deleted
+
+
+def delete_stale_tokens(db, before):
+    return db.execute("DELETE FROM site_users WHERE updated_at < ?", (before,), name="delete_stale_tokens").rowcount
+
+
+def prune(db, usage_before=None):
+    # Expired idempotency keys always, raw usage events (the daily counts stay) only when asked
+    pruned = {"idempotency_keys": db.execute("DELETE FROM idempotency_keys WHERE expires_at < ?", (time.time(),), name="prune_idempotency_keys").rowcount}
+    if usage_before is not None:
+        pruned["faq_usage_events"] = db.execute("DELETE FROM faq_usage_events WHERE created_at < ?", (usage_before,), name="prune_usage_events").rowcount
+    return pruned
+
+
+def auto_vacuum_mode(db):
+    # 0 none, 1 full, 2 incremental
+    return db.query_one("PRAGMA auto_vacuum")[0]
+
+
+def compact(db, full_vacuum=False):
+    # Gives free pages back to the filesystem, refreshes the planner statistics and truncates the WAL.
+    # Without incremental auto_vacuum (databases created before it was turned on) only a full VACUUM
+    # can do that, which rewrites the file and blocks writers while it runs, so it has to be asked for.
+    page_size = db.query_one("PRAGMA page_size")[0]
+    free_pages = db.query_one("PRAGMA freelist_count")[0]
+    mode = auto_vacuum_mode(db)
+
+    if full_vacuum:
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        db.execute("VACUUM", name="vacuum")
+        vacuum = "full"
+    elif mode == 2:
+        db.execute("PRAGMA incremental_vacuum", name="incremental_vacuum")
+        vacuum = "incremental"
+    else:
+        vacuum = None
+
+    db.execute("PRAGMA analysis_limit = 1000")
+    db.execute("ANALYZE", name="analyze")
+    db.execute("PRAGMA optimize", name="optimize")
+    db.query_one("PRAGMA wal_checkpoint(TRUNCATE)", name="wal_checkpoint")
+
+    return {
+        "vacuum": vacuum,
+        "free_pages_before": free_pages,
+        "free_pages_after": db.query_one("PRAGMA freelist_count")[0],
+        "page_size": page_size,
+    }
+
+
+def run(db, archive=None, rejected_before=None, tokens_before=None, usage_before=None, batch_size=500, full_vacuum=False):
+    # Runs every step and returns what each did, with the size of the database file before and after
+    report = {"size_before": file_size(db.path)}
+    if archive is not None and rejected_before is not None:
+        report["archived_rejections"] = archive_rejected(db, archive, rejected_before, batch_size)
+    report["orphans"] = delete_orphans(db)
+    if tokens_before is not None:
+        report["stale_tokens"] = delete_stale_tokens(db, tokens_before)
+    report["pruned"] = prune(db, usage_before)
+    report.update(compact(db, full_vacuum))
+    report["size_after"] = file_size(db.path)
+    report["reclaimed"] = report["size_before"] - report["size_after"]
+    return report
@@ -0,0 +1,331 @@
+import argparse
+import assets
+import bulk
+import changes
+from datetime import datetime, timedelta, timezone
+from db import Database
+from dotenv import load_dotenv
+import json
+import maintenance
+import migrations
+import os
+import profiling
+import queries
+from settings import Settings
+import snapshot
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+
+# Times `import app` and create_app() in a fresh interpreter, which is what every server start pays
+BOOT_TIME_SCRIPT = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.create_app()
+created = time.perf_counter()
+print(json.dumps({"import_ms": (imported - started) * 1000, "create_app_ms": (created - imported) * 1000}))
+"""
+
+
+def cmd_migrate(db, args):
+    before = migrations.get_version(db)
+    applied = migrations.migrate(db)
+    if applied:
+        print(f"Migrated database from version {before} to {applied[-1]}.")
+    else:
+        print(f"Database is up to date (version {before}).")
+
+
+def init(db, admin):
+    # One-time setup before serving. gunicorn runs this from on_starting, before any worker starts.
+    try:
+        applied = migrations.migrate(db)
+        if applied:
+            print(f"Applied database migrations: {applied}")
+
+        if db.execute(queries.UPSERT_REVIEWER, (admin, True)).rowcount:
+            print(f"Admin user {admin} added to reviewers table.")
+    except sqlite3.Error as e:
+        raise ValueError(f"Failed to set up database: {e}")
+
+
+def cmd_init(db, args):
+    settings = Settings.load()
+    init(db, settings.admin)
+    print("Settings are valid and the database is ready.")
+
+
+def cmd_boot_time(db, args):
+    samples = []
+    with tempfile.TemporaryDirectory(prefix="faq-bot-boot-") as metrics_dir:
+        env = dict(os.environ, DATABASE_PATH=db.path, METRICS_DIR=metrics_dir)
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-c", BOOT_TIME_SCRIPT],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=env,
+                capture_output=True,
+                text=True,
+                check=True
+            ).stdout
+            samples.append(json.loads(output.strip().splitlines()[-1]))
+
+    import_ms = statistics.median(sample["import_ms"] for sample in samples)
+    create_app_ms = statistics.median(sample["create_app_ms"] for sample in samples)
+    total_ms = import_ms + create_app_ms
+    print(f"import app:   {import_ms:8.1f} ms")
+    print(f"create_app(): {create_app_ms:8.1f} ms")
+    print(f"total:        {total_ms:8.1f} ms (median of {args.runs}, budget {args.budget_ms} ms)")
+
+    if total_ms > args.budget_ms:
+        sys.exit(1)
+
+
+def cmd_changes(db, args):
+    # NDJSON, one change per line, so consumers can pipe it into their own tools
+    try:
+        for change in changes.stream(db, since=args.since, batch_size=args.batch_size, follow=args.follow):
+            sys.stdout.write(json.dumps(change) + "\n")
+            if args.follow:
+                sys.stdout.flush()
+    except KeyboardInterrupt:
+        pass
+
+
+def cmd_import(db, args):
+    fmt = bulk.detect_format(args.file, args.format)
+    checkpoint = args.checkpoint or f"{args.file}.checkpoint"
+    skip = 0 if args.restart else bulk.load_checkpoint(checkpoint)
+    if skip:
+        print(f"Resuming after {skip} records (from {checkpoint}).")
+
+    with open(args.file, newline="", encoding="utf-8") as f:
+        stats = bulk.import_records(
+            db,
+            bulk.read_records(f, fmt),
+            pending=args.pending,
+            batch_size=args.batch_size,
+            skip=skip,
+            created_by=args.created_by,
+            checkpoint=checkpoint
+        )
+
+    # Only written once a batch is committed, an empty file never gets one
+    if os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    target = "pending review" if args.pending else "approved"
+    print(f"Imported {stats['imported']} FAQs as {target} in {stats['seconds']:.1f}s ({stats['imported'] / stats['seconds'] if stats['seconds'] else 0:.0f} records/s), skipped {stats['invalid']} invalid records.")
+
+
+def cmd_export(db, args):
+    fmt = bulk.detect_format(args.file, args.format)
+    started = time.perf_counter()
+    records = bulk.export_records(db, pending=args.pending, batch_size=args.batch_size)
+    if args.file == "-":
+        count = bulk.write_records(sys.stdout, records, fmt)
+    else:
+        with open(args.file, "w", newline="", encoding="utf-8") as f:
+            count = bulk.write_records(f, records, fmt)
+
+    elapsed = time.perf_counter() - started
+    print(f"Exported {count} FAQs in {elapsed:.1f}s ({count / elapsed if elapsed else 0:.0f} records/s).", file=sys.stderr)
+
+
+def cmd_usage(db, args):
+    since = (datetime.now(timezone.utc) - timedelta(days=args.days)).strftime("%Y-%m-%d")
+    current_channel = None
+    for channel_id, faq_id, uses, question in db.query(queries.USAGE_REPORT, {"since": since, "channel": args.channel, "limit": args.limit}):
+        if channel_id != current_channel:
+            print(f"{channel_id}:")
+            current_channel = channel_id
+        print(f"    {uses:>6}  #{faq_id}  {question[:80]}")
+
+    if current_channel is None:
+        print(f"No FAQs were triggered in the last {args.days} days.")
+
+
+def cmd_explain(db, args):
+    full_scans = 0
+    tables = migrations.table_names(db)
+    for name, plan in migrations.explain(db).items():
+        print(f"{name}:")
+        for detail in plan:
+            flag = ""
+            if migrations.is_full_scan(detail, tables):
+                flag = "  <-- full scan"
+                full_scans += 1
+            print(f"    {detail}{flag}")
+
+    if full_scans and args.strict:
+        sys.exit(1)
+
+
+def cmd_assets(db, args):
+    manifest = assets.build(report=print if args.verbose else lambda message: None)
+    print(f"Built {len(manifest)} static files into {os.path.join(assets.STATIC_DIR, assets.DIST)}.")
+
+
+def cmd_maintenance(db, args):
+    migrations.migrate(db)
+    now = time.time()
+    archive = Database(args.archive or f"{os.path.splitext(db.path)[0]}-archive.db")
+    try:
+        report = maintenance.run(
+            db,
+            archive=archive,
+            rejected_before=now - args.rejected_days * 86400,
+            tokens_before=now - args.token_days * 86400,
+            usage_before=now - args.usage_days * 86400 if args.usage_days is not None else None,
+            batch_size=args.batch_size,
+            full_vacuum=args.full_vacuum
+        )
+    finally:
+        archive.close()
+
+    print(f"Archived {report['archived_rejections']} rejected FAQs to {archive.path}.")
+    print(f"Deleted {report['stale_tokens']} stale site user tokens.")
+    for table, count in {**report["orphans"], **report["pruned"]}.items():
+        if count:
+            print(f"Deleted {count} rows from {table}.")
+    if report["vacuum"] is None and report["free_pages_after"]:
+        print(f"{report['free_pages_after']} free pages can't be released without incremental auto_vacuum, run once with --full-vacuum to switch to it.")
+    print(f"Database: {report['size_before'] / 1024:.0f} KB -> {report['size_after'] / 1024:.0f} KB ({report['reclaimed'] / 1024:.0f} KB reclaimed).")
+
+
+def cmd_snapshot(db, args):
+    path = args.output or os.getenv("SNAPSHOT_PATH")
+    if not path:
+        sys.exit("No snapshot path given. Set SNAPSHOT_PATH or pass --output.")
+
+    if args.action == "info":
+        bundle = snapshot.Snapshot(path)
+        created_at = datetime.fromtimestamp(bundle.created_at, timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        print(f"Corpus version {bundle.version}, exported {created_at} UTC: {bundle.faq_count} FAQs, {bundle.channel_count} channels, {bundle.term_count} terms, {os.path.getsize(path) / 1024:.0f} KB.")
+        return
+
+    # With --watch, a new snapshot is written whenever the corpus version changes (and at least every --max-age seconds for the usage ranking)
+    exported_version = None
+    exported_at = 0
+    while True:
+        version = db.query_one(queries.CORPUS_VERSION)[0]
+        if version != exported_version or time.time() - exported_at >= args.max_age:
+            info = snapshot.export(db, path, popularity_days=args.popularity_days)
+            exported_version = info["version"]
+            exported_at = time.time()
+            print(f"Wrote corpus version {info['version']} to {path}: {info['faqs']} FAQs, {info['channels']} channels, {info['terms']} terms, {info['size'] / 1024:.0f} KB.", flush=True)
+        if not args.watch:
+            return
+        time.sleep(args.watch)
+
+
+def cmd_profile(db, args):
+    if args.action == "on":
+        control = profiling.write_control(args.rate, args.tracemalloc, args.snapshot_interval, minutes=args.minutes)
+        print(f"Profiling {control['sample_rate']:.1%} of requests" + (" with tracemalloc" if control["tracemalloc"] else "") + (f" for {args.minutes:g} minutes." if args.minutes else " until turned off."))
+    elif args.action == "off":
+        profiling.write_control()
+        print("Profiling is off. Workers write their remaining stats within a second.")
+    elif args.action == "report":
+        if not profiling.report(args.route, sort=args.sort, limit=args.limit):
+            print(f"No profiles in {profiling.PROFILE_DIR}.")
+    else:
+        print(json.dumps(profiling.status(), indent=2))
+
+
+def main():
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="FAQ Bot management commands.")
+    parser.add_argument("--database", default=os.getenv("DATABASE_PATH"), help="Path to the SQLite database (defaults to DATABASE_PATH).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    subparsers.add_parser("migrate", help="Create or upgrade the database schema.").set_defaults(func=cmd_migrate)
+
+    explain_parser = subparsers.add_parser("explain", help="Show EXPLAIN QUERY PLAN for the hot queries.")
+    explain_parser.add_argument("--strict", action="store_true", help="Exit with an error if any query does a full table scan.")
+    explain_parser.set_defaults(func=cmd_explain)
+
+    changes_parser = subparsers.add_parser("changes", help="Stream the change log as NDJSON.")
+    changes_parser.add_argument("--since", type=int, default=0, help="Only changes with a larger id (the last id you saw).")
+    changes_parser.add_argument("--batch-size", type=int, default=1000, help="Changes read per query.")
+    changes_parser.add_argument("--follow", action="store_true", help="Keep running and print new changes as they happen.")
+    changes_parser.set_defaults(func=cmd_changes)
+
+    import_parser = subparsers.add_parser("import", help="Import FAQs from a JSONL or CSV file.")
+    import_parser.add_argument("file")
+    import_parser.add_argument("--format", choices=bulk.FORMATS, help="Defaults to csv for .csv files, jsonl otherwise.")
+    import_parser.add_argument("--pending", action="store_true", help="Import into the review queue instead of as approved FAQs.")
+    import_parser.add_argument("--batch-size", type=int, default=5000, help="Records written per transaction.")
+    import_parser.add_argument("--created-by", default="import", help="created_by for records that don't have one.")
+    import_parser.add_argument("--checkpoint", help="Progress file for resuming (defaults to FILE.checkpoint).")
+    import_parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start from the first record.")
+    import_parser.set_defaults(func=cmd_import)
+
+    export_parser = subparsers.add_parser("export", help="Export FAQs to a JSONL or CSV file.")
+    export_parser.add_argument("file", help="Output file, or - for stdout.")
+    export_parser.add_argument("--format", choices=bulk.FORMATS, help="Defaults to csv for .csv files, jsonl otherwise.")
+    export_parser.add_argument("--pending", action="store_true", help="Export the review queue instead of approved FAQs.")
+    export_parser.add_argument("--batch-size", type=int, default=5000, help="Records read per query.")
+    export_parser.set_defaults(func=cmd_export)
+
+    usage_parser = subparsers.add_parser("usage", help="Show the most triggered FAQs per channel.")
+    usage_parser.add_argument("--channel", help="Only this channel.")
+    usage_parser.add_argument("--days", type=int, default=30, help="How many days back to count.")
+    usage_parser.add_argument("--limit", type=int, default=10, help="FAQs per channel.")
+    usage_parser.set_defaults(func=cmd_usage)
+
+    subparsers.add_parser("init", help="Check the settings, migrate the database and add the admin as a reviewer.").set_defaults(func=cmd_init)
+
+    boot_time_parser = subparsers.add_parser("boot-time", help="Measure how long importing and creating the app takes.")
+    boot_time_parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to time.")
+    boot_time_parser.add_argument("--budget-ms", type=float, default=750, help="Exit with an error if the median is slower than this.")
+    boot_time_parser.set_defaults(func=cmd_boot_time)
+
+    assets_parser = subparsers.add_parser("assets", help="Build content-hashed, precompressed copies of the static files.")
+    assets_parser.add_argument("--verbose", action="store_true", help="List every file.")
+    assets_parser.set_defaults(func=cmd_assets)
+
+    maintenance_parser = subparsers.add_parser("maintenance", help="Archive old rejections, delete orphaned rows and stale tokens, and compact the database.")
+    maintenance_parser.add_argument("--archive", help="Archive database for rejected FAQs (defaults to <database>-archive.db).")
+    maintenance_parser.add_argument("--rejected-days", type=int, default=90, help="Archive rejections older than this.")
+    maintenance_parser.add_argument("--token-days", type=int, default=180, help="Delete site user tokens not refreshed by a login for this long.")
+    maintenance_parser.add_argument("--usage-days", type=int, help="Also delete raw usage events older than this (the daily counts are kept).")
+    maintenance_parser.add_argument("--batch-size", type=int, default=500, help="Rejections archived per transaction.")
+    maintenance_parser.add_argument("--full-vacuum", action="store_true", help="Rewrite the file with VACUUM and switch it to incremental auto_vacuum. Blocks writers while it runs.")
+    maintenance_parser.set_defaults(func=cmd_maintenance)
+
+    snapshot_parser = subparsers.add_parser("snapshot", help="Export the approved FAQs to a memory-mapped snapshot, or describe one.")
+    snapshot_parser.add_argument("action", choices=("export", "info"))
+    snapshot_parser.add_argument("--output", help="Snapshot file (defaults to SNAPSHOT_PATH).")
+    snapshot_parser.add_argument("--popularity-days", type=int, default=int(os.getenv("POPULARITY_DAYS", 30)), help="Days of usage to rank the options by (export).")
+    snapshot_parser.add_argument("--watch", type=float, help="Keep running and check for changes every this many seconds (export).")
+    snapshot_parser.add_argument("--max-age", type=float, default=3600, help="With --watch, also re-export after this many seconds so the usage ranking stays current (export).")
+    snapshot_parser.set_defaults(func=cmd_snapshot)
+
+    profile_parser = subparsers.add_parser("profile", help="Turn profiling of the running bot on or off, or show the results.")
+    profile_parser.add_argument("action", choices=("on", "off", "status", "report"))
+    profile_parser.add_argument("--rate", type=float, default=0.01, help="Fraction of requests to profile (on).")
+    profile_parser.add_argument("--tracemalloc", action="store_true", help="Also trace allocations and write snapshots and diffs (on).")
+    profile_parser.add_argument("--snapshot-interval", type=int, default=60, help="Seconds between tracemalloc snapshots (on).")
+    profile_parser.add_argument("--minutes", type=float, default=15, help="Turn off again after this long, 0 to keep it on (on).")
+    profile_parser.add_argument("--route", help="Only this route, e.g. /slack/interactions (report).")
+    profile_parser.add_argument("--sort", default="cumulative", help="pstats sort key (report).")
+    profile_parser.add_argument("--limit", type=int, default=30, help="Functions to show (report).")
+    profile_parser.set_defaults(func=cmd_profile)
+
+    args = parser.parse_args()
+    if not args.database:
+        parser.error("No database given. Set DATABASE_PATH or pass --database.")
+
+    db = Database(args.database)
+    args.func(db, args)
+
+
+if __name__ == "__main__":
+    main()
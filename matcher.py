@@ -0,0 +1,134 @@
+from collections import Counter, defaultdict
+import heapq
+import math
+import re
+import threading
+import time
+
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+STOPWORDS = frozenset("""
+a about an and are as at be but by can could do does for from get has have how i if in is it its me my
+of on or our so that the their them there this to was we what when where which who why will with you your
+""".split())
+
+# Words in the question count more than words in the answer
+QUESTION_WEIGHT = 2
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if len(token) > 1 and token not in STOPWORDS]
+
+
+# TF-IDF index over the approved FAQs, used to suggest an answer when the bot is mentioned.
+# Stored as an inverted index (term -> {faq_id: term weight}) so scoring a message only
+# touches the FAQs that share a word with it.
+class FaqMatcher:
+    def __init__(self, db, refresh_interval=5):
+        self.db = db
+        self.refresh_interval = refresh_interval
+
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)
+        self._terms = {}
+        self._scopes = {}
+        self._norms = {}
+        self._normalized_count = 0
+        self._last_id = 0
+        self._last_refresh = 0
+
+    def _idf(self, term):
+        return math.log((len(self._scopes) + 1) / (len(self._postings.get(term, ())) + 1)) + 1
+
+    def _add(self, faq_id, is_global, channels, question, answer):
+        term_counts = Counter(tokenize(question) * QUESTION_WEIGHT + tokenize(answer))
+        weights = {term: 1 + math.log(tf) for term, tf in term_counts.items()}
+        for term, weight in weights.items():
+            self._postings[term][faq_id] = weight
+        self._terms[faq_id] = weights
+        self._scopes[faq_id] = (bool(is_global), frozenset(channels))
+
+    def _normalize(self, faq_ids):
+        idf = {term: math.log((len(self._scopes) + 1) / (len(postings) + 1)) + 1 for term, postings in self._postings.items()}
+        for faq_id in faq_ids:
+            self._norms[faq_id] = math.sqrt(sum((weight * idf[term]) ** 2 for term, weight in self._terms[faq_id].items())) or 1
+
+    def _load_new(self):
+        rows = self.db.query("SELECT id, global, question, answer FROM faqs WHERE id > ? ORDER BY id", (self._last_id,))
+        if not rows:
+            return
+
+        channels = defaultdict(list)
+        for faq_id, channel_id in self.db.query("SELECT faq_id, channel_id FROM faq_channels WHERE faq_id > ?", (self._last_id,)):
+            channels[faq_id].append(channel_id)
+
+        for faq_id, is_global, question, answer in rows:
+            self._add(faq_id, is_global, channels[faq_id], question, answer)
+        self._last_id = rows[-1][0]
+
+        # Document norms depend on the idf of every term, so they are all recomputed once the corpus has
+        # grown noticeably. Until then only the new FAQs get one.
+        if len(self._scopes) > self._normalized_count * 1.2:
+            self._normalize(self._terms)
+            self._normalized_count = len(self._scopes)
+        else:
+            self._normalize([row[0] for row in rows])
+
+    def rebuild(self):
+        with self._lock:
+            self._postings = defaultdict(dict)
+            self._terms = {}
+            self._scopes = {}
+            self._norms = {}
+            self._normalized_count = 0
+            self._last_id = 0
+            self._load_new()
+
+    def mark_stale(self):
+        self._last_refresh = 0
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+
+        max_id, count = self.db.query_one("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM faqs")
+        self._last_refresh = time.monotonic()
+
+        # FAQs were deleted since the last load, start over
+        if max_id < self._last_id or count < len(self._scopes):
+            self.rebuild()
+            return
+
+        # Only load the FAQs approved since the last refresh
+        if max_id > self._last_id:
+            with self._lock:
+                self._load_new()
+
+    def match(self, text, channel_id=None, k=3):
+        self.refresh()
+
+        query_counts = Counter(tokenize(text))
+        if not query_counts:
+            return []
+
+        with self._lock:
+            query_weights = {term: (1 + math.log(tf)) * self._idf(term) for term, tf in query_counts.items() if term in self._postings}
+            if not query_weights:
+                return []
+            query_norm = math.sqrt(sum(weight ** 2 for weight in query_weights.values()))
+
+            scores = defaultdict(float)
+            for term, query_weight in query_weights.items():
+                idf = self._idf(term)
+                for faq_id, weight in self._postings[term].items():
+                    scores[faq_id] += query_weight * weight * idf
+
+            results = []
+            for faq_id, score in scores.items():
+                is_global, channels = self._scopes[faq_id]
+                if not is_global and channel_id not in channels:
+                    continue
+                results.append((score / (self._norms[faq_id] * query_norm), faq_id))
+
+        return heapq.nlargest(k, results)
@@ -0,0 +1,243 @@
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+
+
+# Prometheus-style metrics that work across gunicorn workers. Each process keeps its numbers in
+# memory and regularly writes them to METRICS_DIR/<pid>.json, /metrics adds up every file.
+
+METRICS_DIR = os.getenv("METRICS_DIR", "logs/metrics")
+FLUSH_INTERVAL = 1.0
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+DEFINITIONS = {
+    "http_request_duration_seconds": ("histogram", "Flask request latency by route."),
+    "slack_interaction_duration_seconds": ("histogram", "Slack interaction handling latency by type and callback/action id."),
+    "db_query_duration_seconds": ("histogram", "SQLite query and transaction latency by query name."),
+    "slack_api_duration_seconds": ("histogram", "Slack Web API call latency by method."),
+    "slack_api_errors_total": ("counter", "Failed Slack Web API calls by method and error."),
+    "slack_api_throttled_total": ("counter", "Slack Web API calls answered with HTTP 429, by method."),
+    "slack_api_retries_total": ("counter", "Retried Slack Web API calls by method."),
+    "slack_api_delayed_total": ("counter", "Slack Web API calls delayed by the local rate limiter, by method."),
+    "job_wait_seconds": ("histogram", "Time jobs spend in the background queue."),
+    "job_run_seconds": ("histogram", "Time spent running background jobs."),
+    "jobs_total": ("counter", "Finished background jobs by queue and outcome."),
+    "job_queue_depth": ("gauge", "Jobs waiting in the background queue, per worker process."),
+    "duplicate_lookup_seconds": ("histogram", "Time to find likely duplicates of a new FAQ submission."),
+    "faq_usage_events_total": ("counter", "FAQ trigger events written to the usage tables."),
+    "faq_snapshot_loads_total": ("counter", "FAQ snapshot files mapped by the bot, by result (ok or error)."),
+    "faq_snapshot_unavailable_total": ("counter", "Options loads refused by an options-load replica (SNAPSHOT_ONLY) without a snapshot."),
+    "recorded_requests_total": ("counter", "Slack requests written to the traffic recording, by path."),
+    "profiled_requests_total": ("counter", "Requests sampled by the profiler, by route."),
+    "idempotency_checks_total": ("counter", "Slack event/click deduplication checks by kind, result (new or duplicate) and where the key was found."),
+    "idempotency_releases_total": ("counter", "Idempotency keys given back by kind because the handler failed."),
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+_gauges = {}
+_last_flush = 0.0
+_pid = os.getpid()
+_enabled = False
+
+
+def enable():
+    # Only processes that serve /metrics (the bot) write their numbers to METRICS_DIR, not CLI tools
+    global _enabled
+    _enabled = True
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _check_fork():
+    # Numbers recorded before a fork belong to the parent
+    global _pid
+    if _pid != os.getpid():
+        _counters.clear()
+        _histograms.clear()
+        _gauges.clear()
+        _pid = os.getpid()
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _check_fork()
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _check_fork()
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += value
+        histogram[2] += 1
+
+
+def set_gauge(name, value, **labels):
+    with _lock:
+        _check_fork()
+        _gauges[_key(name, labels)] = value
+
+
+class timer:
+    # with metrics.timer("db_query_duration_seconds", query="faq_by_id"): ...
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.started, **self.labels)
+
+
+def _snapshot():
+    with _lock:
+        _check_fork()
+        return {
+            "counters": [[name, labels, value] for (name, labels), value in _counters.items()],
+            "histograms": [[name, labels, list(h[0]), h[1], h[2]] for (name, labels), h in _histograms.items()],
+            "gauges": [[name, labels, value] for (name, labels), value in _gauges.items()],
+        }
+
+
+def flush(force=False):
+    global _last_flush
+    if not _enabled:
+        return
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    _last_flush = now
+
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(_snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+atexit.register(flush, True)
+
+
+def _merge(total, data, keep_gauges=True):
+    for name, labels, value in data["counters"]:
+        key = (name, tuple(map(tuple, labels)))
+        total["counters"][key] = total["counters"].get(key, 0) + value
+    for name, labels, buckets, total_sum, count in data["histograms"]:
+        key = (name, tuple(map(tuple, labels)))
+        merged = total["histograms"].setdefault(key, [[0] * len(BUCKETS), 0.0, 0])
+        merged[0] = [a + b for a, b in zip(merged[0], buckets)]
+        merged[1] += total_sum
+        merged[2] += count
+    if keep_gauges:
+        for name, labels, value in data["gauges"]:
+            total["gauges"][(name, tuple(map(tuple, labels)))] = value
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def mark_process_dead(pid):
+    # Called from gunicorn's child_exit hook. Folds the dead worker's counters into archived.json
+    # so totals don't go backwards, and drops its gauges.
+    path = os.path.join(METRICS_DIR, f"{pid}.json")
+    data = _read(path)
+    if data is None:
+        return
+
+    archive_path = os.path.join(METRICS_DIR, "archived.json")
+    total = {"counters": {}, "histograms": {}, "gauges": {}}
+    archived = _read(archive_path)
+    if archived:
+        _merge(total, archived, keep_gauges=False)
+    _merge(total, data, keep_gauges=False)
+
+    tmp_path = f"{archive_path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({
+            "counters": [[name, labels, value] for (name, labels), value in total["counters"].items()],
+            "histograms": [[name, labels, h[0], h[1], h[2]] for (name, labels), h in total["histograms"].items()],
+            "gauges": [],
+        }, f)
+    os.replace(tmp_path, archive_path)
+    os.remove(path)
+
+
+def reset_directory():
+    # Called once when gunicorn starts so numbers from a previous run aren't added in
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        os.remove(path)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+
+def render():
+    flush(force=True)
+
+    total = {"counters": {}, "histograms": {}, "gauges": {}}
+    for path in glob.glob(os.path.join(METRICS_DIR, "*.json")):
+        data = _read(path)
+        if data is None:
+            continue
+        pid = os.path.basename(path)[:-5]
+        # Gauges are per process, so they get a pid label instead of being added up
+        for gauge in data["gauges"]:
+            gauge[1] = list(gauge[1]) + [["pid", pid]]
+        _merge(total, data)
+
+    by_name = {}
+    for kind in ("counters", "histograms", "gauges"):
+        for (name, labels), value in total[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(by_name):
+        kind, help_text = DEFINITIONS.get(name, ("untyped", ""))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(by_name[name]):
+            if kind == "histogram":
+                buckets, total_sum, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS, buckets):
+                    cumulative += bucket_count
+                    lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total_sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,283 @@
+from queries import HOT_QUERIES
+
+
+# Each migration is a list of statements. The schema version is stored in PRAGMA user_version,
+# migration N brings the database to version N.
+MIGRATIONS = [
+    # 1: Initial schema (previously created by setup.sh)
+    [
+        """
+        CREATE TABLE IF NOT EXISTS faqs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            global BOOLEAN NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_by TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS faqs_fts USING fts5(
+            question,
+            answer,
+            content='faqs',
+            content_rowid='id',
+            prefix='2 3'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS faqs_fts_insert AFTER INSERT ON faqs BEGIN
+            INSERT INTO faqs_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS faqs_fts_delete AFTER DELETE ON faqs BEGIN
+            INSERT INTO faqs_fts (faqs_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS faqs_fts_update AFTER UPDATE ON faqs BEGIN
+            INSERT INTO faqs_fts (faqs_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+            INSERT INTO faqs_fts (rowid, question, answer) VALUES (new.id, new.question, new.answer);
+        END
+        """,
+        # Index any FAQs that were added before the search index existed
+        "INSERT INTO faqs_fts (faqs_fts) VALUES ('rebuild')",
+        """
+        CREATE TABLE IF NOT EXISTS faq_channels (
+            faq_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (faq_id, channel_id),
+            FOREIGN KEY (faq_id) REFERENCES faqs (id) ON DELETE CASCADE,
+            FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq_pending (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            global BOOLEAN NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_by TEXT NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq_pending_channels (
+            faq_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (faq_id, channel_id),
+            FOREIGN KEY (faq_id) REFERENCES faq_pending (id) ON DELETE CASCADE,
+            FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq_rejected (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            global BOOLEAN NOT NULL,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            created_by TEXT NOT NULL,
+            rejected_by TEXT NOT NULL,
+            reason TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq_rejected_channels (
+            faq_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            PRIMARY KEY (faq_id, channel_id),
+            FOREIGN KEY (faq_id) REFERENCES faq_rejected (id) ON DELETE CASCADE,
+            FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS reviewers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            admin BOOL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS site_users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            slack_user_id TEXT NOT NULL,
+            user_access_token TEXT NOT NULL
+        )
+        """,
+    ],
+
+    # 2: Index the option filters and make reviewers/site users unique so they can be upserted
+    [
+        "CREATE INDEX IF NOT EXISTS faq_channels_channel_id ON faq_channels (channel_id, faq_id)",
+        "CREATE INDEX IF NOT EXISTS faqs_global ON faqs (global)",
+        # Collapse duplicate reviewers, keeping the oldest row and the admin flag if any copy had it
+        "UPDATE reviewers SET admin = (SELECT MAX(r.admin) FROM reviewers r WHERE r.user_id = reviewers.user_id)",
+        "DELETE FROM reviewers WHERE id NOT IN (SELECT MIN(id) FROM reviewers GROUP BY user_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS reviewers_user_id ON reviewers (user_id)",
+        # Keep the most recent token for each site user
+        "DELETE FROM site_users WHERE id NOT IN (SELECT MAX(id) FROM site_users GROUP BY slack_user_id)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS site_users_slack_user_id ON site_users (slack_user_id)",
+    ],
+
+    # 3: Keys of recently handled Slack events and clicks, shared by all workers to drop duplicates
+    [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            key TEXT PRIMARY KEY,
+            expires_at REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idempotency_keys_expires_at ON idempotency_keys (expires_at)",
+    ],
+
+    # 4: Counter bumped on every change to the approved FAQs, used for ETag/Last-Modified on /faqs
+    [
+        """
+        CREATE TABLE IF NOT EXISTS corpus_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+        """,
+        "INSERT OR IGNORE INTO corpus_version (id, version, updated_at) VALUES (1, 1, CAST(strftime('%s', 'now') AS INTEGER))",
+    ] + [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_version_{event} AFTER {event.upper()} ON {table} BEGIN
+            UPDATE corpus_version SET version = version + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE id = 1;
+        END
+        """
+        for table, event in [("faqs", "insert"), ("faqs", "update"), ("faqs", "delete"), ("faq_channels", "insert"), ("faq_channels", "delete")]
+    ],
+
+    # 5: Change log for the change feed (/api/changes, `manage.py changes`), filled by triggers
+    [
+        """
+        CREATE TABLE IF NOT EXISTS changes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            entity_id TEXT NOT NULL,
+            action TEXT NOT NULL,
+            data TEXT,
+            created_at INTEGER NOT NULL
+        )
+        """,
+    ] + [
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table}_changes_{event} AFTER {event.upper()} ON {table} BEGIN
+            INSERT INTO changes (entity, entity_id, action, data, created_at)
+            VALUES ('{entity}', {entity_id}, '{event}', {data}, CAST(strftime('%s', 'now') AS INTEGER));
+        END
+        """
+        for table, entity, entity_id, event, data in [
+            ("faqs", "faq", "new.id", "insert", "json_object('global', new.global, 'question', new.question, 'answer', new.answer, 'created_by', new.created_by)"),
+            ("faqs", "faq", "new.id", "update", "json_object('global', new.global, 'question', new.question, 'answer', new.answer, 'created_by', new.created_by)"),
+            ("faqs", "faq", "old.id", "delete", "NULL"),
+            ("faq_channels", "faq_channel", "new.faq_id", "insert", "json_object('channel_id', new.channel_id)"),
+            ("faq_channels", "faq_channel", "old.faq_id", "delete", "json_object('channel_id', old.channel_id)"),
+            ("faq_rejected", "rejection", "new.id", "insert", "json_object('global', new.global, 'question', new.question, 'answer', new.answer, 'created_by', new.created_by, 'rejected_by', new.rejected_by, 'reason', new.reason)"),
+            ("reviewers", "reviewer", "new.user_id", "insert", "json_object('admin', new.admin)"),
+            ("reviewers", "reviewer", "new.user_id", "update", "json_object('admin', new.admin)"),
+            ("reviewers", "reviewer", "old.user_id", "delete", "NULL"),
+        ]
+    ],
+
+    # 6: FAQ usage, every trigger plus per-channel daily counts used to rank the options menu
+    [
+        """
+        CREATE TABLE IF NOT EXISTS faq_usage_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            faq_id INTEGER NOT NULL,
+            channel_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            created_at INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS faq_usage_daily (
+            channel_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            faq_id INTEGER NOT NULL,
+            uses INTEGER NOT NULL,
+            PRIMARY KEY (channel_id, day, faq_id)
+        ) WITHOUT ROWID
+        """,
+    ],
+
+    # 7: Remember each submission's review message, so reviewing from the queue can update it
+    [
+        "ALTER TABLE faq_pending ADD COLUMN review_message_ts TEXT",
+    ],
+
+    # 8: Bot tokens per workspace, and the workspace a submission came from so its submitter can be notified there
+    [
+        """
+        CREATE TABLE IF NOT EXISTS installations (
+            team_id TEXT PRIMARY KEY,
+            bot_token TEXT NOT NULL,
+            bot_user_id TEXT,
+            installed_by TEXT,
+            installed_at INTEGER NOT NULL
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE faq_pending ADD COLUMN team_id TEXT",
+    ],
+
+    # 9: Timestamps so `manage.py maintenance` can archive old rejections and drop stale site user tokens.
+    # Existing rejections get the time from the change log, existing tokens count from now.
+    [
+        "ALTER TABLE faq_rejected ADD COLUMN rejected_at INTEGER",
+        """
+        UPDATE faq_rejected SET rejected_at = COALESCE(
+            (SELECT MAX(created_at) FROM changes WHERE entity = 'rejection' AND entity_id = faq_rejected.id),
+            CAST(strftime('%s', 'now') AS INTEGER)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS faq_rejected_rejected_at ON faq_rejected (rejected_at)",
+        "ALTER TABLE site_users ADD COLUMN updated_at INTEGER",
+        "UPDATE site_users SET updated_at = CAST(strftime('%s', 'now') AS INTEGER)",
+        "CREATE INDEX IF NOT EXISTS site_users_updated_at ON site_users (updated_at)",
+    ],
+]
+
+LATEST_VERSION = len(MIGRATIONS)
+
+
+def get_version(db):
+    return db.query_one("PRAGMA user_version")[0]
+
+
+def migrate(db, target=LATEST_VERSION):
+    applied = []
+    if get_version(db) >= target:
+        return applied
+
+    # BEGIN IMMEDIATE serializes workers that start at the same time, so re-check the version inside
+    with db.transaction() as cursor:
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        for number in range(version + 1, target + 1):
+            for statement in MIGRATIONS[number - 1]:
+                cursor.execute(statement)
+            cursor.execute(f"PRAGMA user_version = {number}")
+            applied.append(number)
+
+    return applied
+
+
+def explain(db):
+    # Returns {query name: [plan detail, ...]} for every hot query
+    plans = {}
+    for name, (sql, params) in HOT_QUERIES.items():
+        rows = db.query(f"EXPLAIN QUERY PLAN {sql}", params)
+        plans[name] = [row[3] for row in rows]
+    return plans
+
+
+def table_names(db):
+    return {row[0] for row in db.query("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+
+def is_full_scan(detail, tables=None):
+    # "SCAN faqs" is a full table scan, "SCAN faqs_fts VIRTUAL TABLE ..." and covering index scans are not.
+    # With `tables`, scans of subquery results ("SCAN usage", "SCAN (subquery-2)") aren't counted either.
+    if not detail.startswith("SCAN") or "VIRTUAL TABLE" in detail or "INDEX" in detail:
+        return False
+    return tables is None or detail.split()[1] in tables
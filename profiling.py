@@ -0,0 +1,262 @@
+import atexit
+import cProfile
+import glob
+import json
+import metrics
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+
+
+# On-demand profiling of the running workers, switched on and off through a control file in
+# PROFILE_DIR that every worker re-reads about once a second (`manage.py profile`, or POST
+# /admin/profiling as the admin). While it's off a request costs one clock comparison.
+#
+#   - A fraction of requests run under cProfile. Stats are added up per route and written to
+#     PROFILE_DIR/<route>.<pid>.pstats, which `manage.py profile report`, snakeviz or
+#     flameprof can read.
+#   - With tracemalloc on, each worker writes a snapshot every `snapshot_interval` seconds to
+#     PROFILE_DIR/tracemalloc.<pid>.snapshot and the biggest growth since the last one to
+#     PROFILE_DIR/tracemalloc.<pid>.diff.txt.
+#
+# Only one request per process is profiled at a time, cProfile can't nest.
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "logs/profiles")
+CONTROL_FILE = "control.json"
+CHECK_INTERVAL = 1.0
+DUMP_INTERVAL = 10.0
+# Paths past this many (404s, static files) are counted under "other"
+MAX_ROUTES = 50
+
+DEFAULTS = {
+    "sample_rate": 0.0,
+    "tracemalloc": False,
+    "snapshot_interval": 60,
+    "frames": 10,
+    "expires_at": None,
+}
+
+_lock = threading.Lock()
+_profile_lock = threading.Lock()
+_control = dict(DEFAULTS)
+_control_mtime = None
+_next_check = 0.0
+_stats = {}
+_last_dump = 0.0
+_last_snapshot = 0.0
+_previous_snapshot = None
+_pid = os.getpid()
+
+
+def control_path():
+    return os.path.join(PROFILE_DIR, CONTROL_FILE)
+
+
+def read_control():
+    try:
+        with open(control_path()) as f:
+            control = dict(DEFAULTS, **json.load(f))
+    except (OSError, ValueError):
+        return dict(DEFAULTS)
+    if control["expires_at"] and control["expires_at"] < time.time():
+        return dict(DEFAULTS)
+    return control
+
+
+def write_control(sample_rate=0.0, use_tracemalloc=False, snapshot_interval=60, frames=10, minutes=None):
+    # Workers pick this up within CHECK_INTERVAL. `minutes` turns profiling off again by itself.
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    control = {
+        "sample_rate": max(0.0, min(float(sample_rate), 1.0)),
+        "tracemalloc": bool(use_tracemalloc),
+        "snapshot_interval": snapshot_interval,
+        "frames": frames,
+        "expires_at": time.time() + minutes * 60 if minutes else None,
+    }
+    tmp_path = f"{control_path()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(control, f)
+    os.replace(tmp_path, control_path())
+    return control
+
+
+def _check_fork():
+    # Stats and snapshots recorded before a fork belong to the parent
+    global _pid, _stats, _previous_snapshot, _last_snapshot
+    if _pid != os.getpid():
+        _pid = os.getpid()
+        _stats = {}
+        _previous_snapshot = None
+        _last_snapshot = 0.0
+
+
+def _refresh():
+    global _next_check, _control, _control_mtime
+    now = time.monotonic()
+    if now < _next_check:
+        return
+    with _lock:
+        if now < _next_check:
+            return
+        _next_check = now + CHECK_INTERVAL
+        _check_fork()
+
+        try:
+            mtime = os.stat(control_path()).st_mtime
+        except OSError:
+            mtime = None
+        if mtime != _control_mtime or _control["expires_at"]:
+            _control_mtime = mtime
+            _control = read_control()
+
+        if _control["tracemalloc"]:
+            _take_snapshot(now)
+        elif tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+        if _stats and (not _control["sample_rate"] or now - _last_dump >= DUMP_INTERVAL):
+            _dump()
+
+
+def _route_name(route):
+    return re.sub(r"[^A-Za-z0-9_-]+", "_", route).strip("_") or "root"
+
+
+def _dump():
+    # Called with _lock held. Each route's stats since profiling was turned on go to one file per worker.
+    global _last_dump, _stats
+    _last_dump = time.monotonic()
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    for route, stats in _stats.items():
+        path = os.path.join(PROFILE_DIR, f"{_route_name(route)}.{os.getpid()}.pstats")
+        stats.dump_stats(f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+    if not _control["sample_rate"]:
+        _stats = {}
+
+
+def _take_snapshot(now):
+    # Called with _lock held
+    global _last_snapshot, _previous_snapshot
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(_control["frames"])
+        _last_snapshot = now
+        return
+    if now - _last_snapshot < _control["snapshot_interval"]:
+        return
+    _last_snapshot = now
+
+    snapshot = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ))
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    prefix = os.path.join(PROFILE_DIR, f"tracemalloc.{os.getpid()}")
+    snapshot.dump(f"{prefix}.snapshot")
+
+    if _previous_snapshot is not None:
+        with open(f"{prefix}.diff.txt", "w") as f:
+            f.write(f"# Growth over the last {_control['snapshot_interval']}s, {time.strftime('%Y-%m-%d %H:%M:%S')}\n")
+            for stat in snapshot.compare_to(_previous_snapshot, "lineno")[:50]:
+                f.write(f"{stat}\n")
+    _previous_snapshot = snapshot
+
+
+def start(route):
+    # Returns a running profiler if this request was sampled, otherwise None
+    _refresh()
+    rate = _control["sample_rate"]
+    if not rate or random.random() >= rate or not _profile_lock.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiler (a debugger, a manual cProfile run) is active
+        _profile_lock.release()
+        return None
+    profile.route = route
+    return profile
+
+
+def stop(profile):
+    if profile is None:
+        return
+    profile.disable()
+    _profile_lock.release()
+
+    with _lock:
+        _check_fork()
+        route = profile.route if profile.route in _stats or len(_stats) < MAX_ROUTES else "other"
+        stats = _stats.get(route)
+        if stats is None:
+            _stats[route] = pstats.Stats(profile)
+        else:
+            stats.add(profile)
+    metrics.inc("profiled_requests_total", route=route)
+
+
+def call(route, fn, *args, **kwargs):
+    # Runs fn, profiled if the call is sampled (used by async_app.py for its handler threads)
+    profile = start(route)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        stop(profile)
+
+
+class ProfilerMiddleware:
+    # WSGI middleware, so a sampled request is profiled until its (possibly streamed) body is sent,
+    # which includes rendering templates with stream_template
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        profile = start(environ.get("PATH_INFO", ""))
+        if profile is None:
+            return self.wsgi_app(environ, start_response)
+
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            stop(profile)
+            raise
+        return self._iterate(profile, body)
+
+    def _iterate(self, profile, body):
+        try:
+            yield from body
+        finally:
+            if hasattr(body, "close"):
+                body.close()
+            stop(profile)
+
+
+def flush():
+    with _lock:
+        if _stats and _pid == os.getpid():
+            _dump()
+
+
+atexit.register(flush)
+
+
+def status():
+    control = read_control()
+    files = sorted(os.path.basename(path) for path in glob.glob(os.path.join(PROFILE_DIR, "*")) if not path.endswith((CONTROL_FILE, ".tmp")))
+    return {"control": control, "files": files}
+
+
+def report(route=None, sort="cumulative", limit=30, stream=None):
+    # Adds up the pstats files of every worker (for one route, or all of them) and prints the top functions
+    pattern = f"{_route_name(route)}.*.pstats" if route else "*.pstats"
+    paths = sorted(glob.glob(os.path.join(PROFILE_DIR, pattern)))
+    if not paths:
+        return None
+    stats = pstats.Stats(*paths, stream=stream)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return paths
@@ -0,0 +1,207 @@
+# SQL for the hot paths. Kept in one place so `manage.py explain` can check their query plans.
+
+FAQ_OPTIONS_SEARCH = """
+    SELECT faqs.id, faqs.question
+    FROM faqs_fts
+    JOIN faqs ON faqs.id = faqs_fts.rowid
+    WHERE faqs_fts MATCH ?
+    AND (
+        faqs.global = 1
+        OR EXISTS (SELECT 1 FROM faq_channels WHERE faq_channels.faq_id = faqs.id AND faq_channels.channel_id = ?)
+    )
+    ORDER BY bm25(faqs_fts, 10.0, 1.0)
+    LIMIT ?
+"""
+
+# Most used in the channel over the last days first, then oldest first. Only the used FAQs and the
+# first page by id are sorted, not every FAQ the channel can see.
+FAQ_OPTIONS_LIST = """
+    SELECT id, question FROM (
+        SELECT faqs.id, faqs.question, usage.uses
+        FROM (
+            SELECT faq_id, SUM(uses) AS uses
+            FROM faq_usage_daily
+            WHERE channel_id = :channel AND day >= :since
+            GROUP BY faq_id
+        ) AS usage
+        JOIN faqs ON faqs.id = usage.faq_id
+        WHERE faqs.global = 1
+        OR EXISTS (SELECT 1 FROM faq_channels WHERE faq_channels.faq_id = faqs.id AND faq_channels.channel_id = :channel)
+        UNION ALL
+        SELECT id, question, 0 FROM (
+            SELECT id, question FROM faqs WHERE global = 1
+            UNION
+            SELECT faqs.id, faqs.question
+            FROM faq_channels
+            JOIN faqs ON faqs.id = faq_channels.faq_id
+            WHERE faq_channels.channel_id = :channel
+            ORDER BY 1
+            LIMIT :limit
+        )
+    )
+    GROUP BY id
+    ORDER BY MAX(uses) DESC, id
+    LIMIT :limit
+"""
+
+FAQ_BY_ID = "SELECT question, answer FROM faqs WHERE id = ?"
+
+# Review queue. Batches of ids are passed as one JSON array, so the statements stay the same
+# (and cached) whatever the batch size.
+PENDING_PAGE = """
+    SELECT id, global, question, answer, created_by,
+        (SELECT GROUP_CONCAT(channel_id, ',') FROM faq_pending_channels WHERE faq_pending_channels.faq_id = faq_pending.id)
+    FROM faq_pending
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+PENDING_COUNT = "SELECT COUNT(*) FROM faq_pending"
+
+PENDING_FAQS_BY_IDS = """
+    SELECT id, global, question, answer, created_by, review_message_ts, team_id FROM faq_pending
+    WHERE id IN (SELECT value FROM json_each(?))
+    ORDER BY id
+"""
+
+PENDING_FAQS_CHANNELS = """
+    SELECT faq_id, channel_id FROM faq_pending_channels
+    WHERE faq_id IN (SELECT value FROM json_each(?))
+    ORDER BY faq_id, channel_id
+"""
+
+DELETE_PENDING_FAQS = "DELETE FROM faq_pending WHERE id IN (SELECT value FROM json_each(?))"
+
+DELETE_PENDING_FAQS_CHANNELS = "DELETE FROM faq_pending_channels WHERE faq_id IN (SELECT value FROM json_each(?))"
+
+SET_REVIEW_MESSAGE_TS = "UPDATE faq_pending SET review_message_ts = ? WHERE id = ?"
+
+IS_REVIEWER = "SELECT 1 FROM reviewers WHERE user_id = ?"
+
+UPSERT_REVIEWER = """
+    INSERT INTO reviewers (user_id, admin) VALUES (?, ?)
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+UPSERT_SITE_USER = """
+    INSERT INTO site_users (slack_user_id, user_access_token, updated_at) VALUES (?, ?, CAST(strftime('%s', 'now') AS INTEGER))
+    ON CONFLICT (slack_user_id) DO UPDATE SET user_access_token = excluded.user_access_token, updated_at = excluded.updated_at
+"""
+# Installations (one bot token per workspace)
+INSTALLATION_TOKEN = "SELECT bot_token FROM installations WHERE team_id = ?"
+
+UPSERT_INSTALLATION = """
+    INSERT INTO installations (team_id, bot_token, bot_user_id, installed_by, installed_at) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (team_id) DO UPDATE SET
+        bot_token = excluded.bot_token,
+        bot_user_id = excluded.bot_user_id,
+        installed_by = excluded.installed_by,
+        installed_at = excluded.installed_at
+"""
+
+DELETE_INSTALLATION = "DELETE FROM installations WHERE team_id = ?"
+
+# /faqs pages, keyset paginated by id. :channel limits the list to FAQs shown in that channel.
+FAQ_PAGE = """
+    SELECT faqs.id, faqs.global, faqs.question, faqs.answer,
+        (SELECT GROUP_CONCAT(channel_id, ',') FROM faq_channels WHERE faq_channels.faq_id = faqs.id)
+    FROM faqs
+    WHERE faqs.id > :after
+    AND (
+        :channel IS NULL
+        OR faqs.global = 1
+        OR EXISTS (SELECT 1 FROM faq_channels WHERE faq_channels.faq_id = faqs.id AND faq_channels.channel_id = :channel)
+    )
+    ORDER BY faqs.id
+    LIMIT :limit
+"""
+
+FAQ_PAGE_SEARCH = """
+    SELECT faqs.id, faqs.global, faqs.question, faqs.answer,
+        (SELECT GROUP_CONCAT(channel_id, ',') FROM faq_channels WHERE faq_channels.faq_id = faqs.id)
+    FROM faqs_fts
+    JOIN faqs ON faqs.id = faqs_fts.rowid
+    WHERE faqs_fts MATCH :query
+    AND faqs_fts.rowid > :after
+    AND (
+        :channel IS NULL
+        OR faqs.global = 1
+        OR EXISTS (SELECT 1 FROM faq_channels WHERE faq_channels.faq_id = faqs.id AND faq_channels.channel_id = :channel)
+    )
+    ORDER BY faqs_fts.rowid
+    LIMIT :limit
+"""
+
+CORPUS_VERSION = "SELECT version, updated_at FROM corpus_version WHERE id = 1"
+
+INSERT_USAGE_EVENT = "INSERT INTO faq_usage_events (faq_id, channel_id, user_id, created_at) VALUES (?, ?, ?, ?)"
+
+UPSERT_USAGE_DAILY = """
+    INSERT INTO faq_usage_daily (faq_id, channel_id, day, uses) VALUES (?, ?, ?, ?)
+    ON CONFLICT (channel_id, day, faq_id) DO UPDATE SET uses = uses + excluded.uses
+"""
+
+# Top FAQs per channel for `manage.py usage`
+USAGE_REPORT = """
+    SELECT channel_id, faq_id, uses, question FROM (
+        SELECT usage.channel_id, usage.faq_id, usage.uses, faqs.question,
+            ROW_NUMBER() OVER (PARTITION BY usage.channel_id ORDER BY usage.uses DESC, usage.faq_id) AS rank
+        FROM (
+            SELECT channel_id, faq_id, SUM(uses) AS uses
+            FROM faq_usage_daily
+            WHERE day >= :since AND (:channel IS NULL OR channel_id = :channel)
+            GROUP BY channel_id, faq_id
+        ) AS usage
+        JOIN faqs ON faqs.id = usage.faq_id
+    )
+    WHERE rank <= :limit
+    ORDER BY channel_id, uses DESC, faq_id
+"""
+
+# Change feed, keyset paginated by changes.id
+CHANGES_SINCE = """
+    SELECT id, entity, entity_id, action, data, created_at FROM changes
+    WHERE id > ?
+    ORDER BY id
+    LIMIT ?
+"""
+
+# Claims a key unless another request claimed it and it hasn't expired yet. rowcount is 1 for the first claim.
+CLAIM_IDEMPOTENCY_KEY = """
+    INSERT INTO idempotency_keys (key, expires_at) VALUES (?, ?)
+    ON CONFLICT (key) DO UPDATE SET expires_at = excluded.expires_at
+    WHERE idempotency_keys.expires_at < ?
+"""
+
+PURGE_IDEMPOTENCY_KEYS = "DELETE FROM idempotency_keys WHERE expires_at < ?"
+
+RELEASE_IDEMPOTENCY_KEY = "DELETE FROM idempotency_keys WHERE key = ?"
+
+
+# name -> (sql, example parameters)
+HOT_QUERIES = {
+    "faq_options_search": (FAQ_OPTIONS_SEARCH, ('"example"*', "C0000000000", 100)),
+    "faq_options_list": (FAQ_OPTIONS_LIST, {"channel": "C0000000000", "since": "2000-01-01", "limit": 100}),
+    "faq_by_id": (FAQ_BY_ID, (1,)),
+    "pending_page": (PENDING_PAGE, (0, 21)),
+    "pending_faqs_by_ids": (PENDING_FAQS_BY_IDS, ("[1, 2]",)),
+    "pending_faqs_channels": (PENDING_FAQS_CHANNELS, ("[1, 2]",)),
+    "delete_pending_faqs": (DELETE_PENDING_FAQS, ("[1, 2]",)),
+    "delete_pending_faqs_channels": (DELETE_PENDING_FAQS_CHANNELS, ("[1, 2]",)),
+    "set_review_message_ts": (SET_REVIEW_MESSAGE_TS, ("1700000000.000100", 1)),
+    "is_reviewer": (IS_REVIEWER, ("U0000000000",)),
+    "installation_token": (INSTALLATION_TOKEN, ("T0000000000",)),
+    "upsert_reviewer": (UPSERT_REVIEWER, ("U0000000000", False)),
+    "upsert_site_user": (UPSERT_SITE_USER, ("U0000000000", "xoxp-example")),
+    "faq_page": (FAQ_PAGE, {"after": 0, "channel": "C0000000000", "limit": 51}),
+    "faq_page_search": (FAQ_PAGE_SEARCH, {"query": '"example"*', "after": 0, "channel": "C0000000000", "limit": 51}),
+    "corpus_version": (CORPUS_VERSION, ()),
+    "upsert_usage_daily": (UPSERT_USAGE_DAILY, (1, "C0000000000", "2000-01-01", 1)),
+    "changes_since": (CHANGES_SINCE, (0, 1000)),
+    "claim_idempotency_key": (CLAIM_IDEMPOTENCY_KEY, ("event:Ev0000000000", 0.0, 0.0)),
+    "purge_idempotency_keys": (PURGE_IDEMPOTENCY_KEYS, (0.0,)),
+    "release_idempotency_key": (RELEASE_IDEMPOTENCY_KEY, ("event:Ev0000000000",)),
+}
+
+QUERY_NAMES = {sql: name for name, (sql, _) in HOT_QUERIES.items()}
@@ -0,0 +1,85 @@
+from bulk import next_id
+from collections import defaultdict
+import json
+import queries
+import time
+
+
+# Approving and rejecting pending FAQs, one at a time from the buttons on a review message or many
+# at once from the review queue (/review-faqs). A batch is moved in a single transaction with
+# executemany, so the number of statements doesn't grow with the number of FAQs.
+
+# (faq table, channel table)
+TABLES = {
+    True: ("faqs", "faq_channels"),
+    False: ("faq_rejected", "faq_rejected_channels"),
+}
+
+
+def pending_page(db, after=0, limit=20):
+    # Returns ([(id, global, question, answer, created_by, channels)], next_after or None)
+    rows = db.query(queries.PENDING_PAGE, (after, limit + 1))
+    next_after = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_after = rows[-1][0]
+    return [(faq_id, bool(is_global), question, answer, created_by, channels.split(",") if channels else []) for faq_id, is_global, question, answer, created_by, channels in rows], next_after
+
+
+def count_pending(db):
+    return db.query_one(queries.PENDING_COUNT)[0]
+
+
+def is_reviewer(db, user_id):
+    return db.query_one(queries.IS_REVIEWER, (user_id,)) is not None
+
+
+def approve_or_reject(db, pending_ids, reviewer_id, approve, reason=None):
+    # Moves the pending FAQs to the approved (or rejected) tables and returns what was moved.
+    # Ids that are no longer pending (reviewed by someone else in the meantime) are skipped.
+    ids = json.dumps(sorted({int(pending_id) for pending_id in pending_ids}))
+    faq_table, channel_table = TABLES[approve]
+
+    with db.transaction("approve_faqs" if approve else "reject_faqs") as cursor:
+        rows = cursor.execute(queries.PENDING_FAQS_BY_IDS, (ids,)).fetchall()
+        if not rows:
+            return []
+
+        channels = defaultdict(list)
+        for pending_id, channel_id in cursor.execute(queries.PENDING_FAQS_CHANNELS, (ids,)).fetchall():
+            channels[pending_id].append(channel_id)
+
+        # Ids are assigned up front (like bulk imports) so the channel rows can be inserted with executemany too
+        first_id = next_id(cursor, faq_table)
+        now = int(time.time())
+        reviewed = []
+        faq_rows = []
+        channel_rows = []
+        for new_id, (pending_id, is_global, question, answer, created_by, review_message_ts, team_id) in enumerate(rows, first_id):
+            reviewed.append({
+                "pending_id": pending_id,
+                "id": new_id,
+                "global": bool(is_global),
+                "question": question,
+                "answer": answer,
+                "created_by": created_by,
+                "channels": channels[pending_id],
+                "review_message_ts": review_message_ts,
+                "team_id": team_id,
+            })
+            if approve:
+                faq_rows.append((new_id, is_global, question, answer, created_by))
+            else:
+                faq_rows.append((new_id, is_global, question, answer, created_by, reviewer_id, reason, now))
+            channel_rows.extend((new_id, channel_id) for channel_id in channels[pending_id])
+
+        if approve:
+            cursor.executemany("INSERT INTO faqs (id, global, question, answer, created_by) VALUES (?, ?, ?, ?, ?)", faq_rows)
+        else:
+            cursor.executemany("INSERT INTO faq_rejected (id, global, question, answer, created_by, rejected_by, reason, rejected_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", faq_rows)
+        cursor.executemany(f"INSERT INTO {channel_table} (faq_id, channel_id) VALUES (?, ?)", channel_rows)
+
+        cursor.execute(queries.DELETE_PENDING_FAQS_CHANNELS, (ids,))
+        cursor.execute(queries.DELETE_PENDING_FAQS, (ids,))
+
+    return reviewed
@@ -9,8 +9,7 @@ fi
 
 source ./venv/bin/activate
 
-gunicorn -w 2 \
-    -b 127.0.0.1:"$PORT" \
-    --access-logfile ./logs/access.log \
-    --error-logfile ./logs/error.log \
-    app:app 
\ No newline at end of file
+# Before gunicorn, create_app() reads the manifest while it is preloaded
+python manage.py assets
+
+gunicorn -c gunicorn.conf.py "app:create_app()" 
\ No newline at end of file
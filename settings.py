@@ -0,0 +1,113 @@
+from dotenv import load_dotenv
+import os
+import warnings
+
+
+REQUIRED = (
+    "SLACK_BOT_TOKEN",
+    "SLACK_SIGNING_SECRET",
+    "SLACK_CLIENT_ID",
+    "SLACK_OAUTH_REDIRECT_URL",
+    "SLACK_CLIENT_SECRET",
+    "DATABASE_PATH",
+    "ADMIN_ID",
+    "FAQ_SUBMISSION_REVIEW_CHANNEL",
+)
+
+
+# Everything the bot reads from the environment (and .env). Building one only reads variables,
+# it doesn't open the database or talk to Slack, so it's cheap enough for tools and hooks too.
+class Settings:
+    def __init__(self, environ=None):
+        env = os.environ if environ is None else environ
+        self.env = env
+
+        self.flask_secret_key = env.get("FLASK_SECRET_KEY")
+
+        # Slack credentials/config
+        self.slack_bot_token = env.get("SLACK_BOT_TOKEN")
+        self.slack_signing_secret = env.get("SLACK_SIGNING_SECRET")
+        # SLACK_API_BASE_URL lets the benchmarks point the bot at a local stand-in for the Slack API
+        self.slack_api_base_url = env.get("SLACK_API_BASE_URL")
+        self.slack_api_app_id = env.get("SLACK_API_APP_ID")
+        self.slack_client_id = env.get("SLACK_CLIENT_ID")
+        self.slack_oauth_redirect_url = env.get("SLACK_OAUTH_REDIRECT_URL")
+        self.slack_client_secret = env.get("SLACK_CLIENT_SECRET")
+        self.slack_job_workers = int(env.get("SLACK_JOB_WORKERS", 4))
+        self.slack_job_queue_size = int(env.get("SLACK_JOB_QUEUE_SIZE", 1000))
+        self.slack_api_max_retries = int(env.get("SLACK_API_MAX_RETRIES", 3))
+        # Workspaces' bot tokens are cached for INSTALLATION_CACHE_TTL seconds, one reusable client is kept per workspace
+        self.installation_cache_size = int(env.get("INSTALLATION_CACHE_SIZE", 1000))
+        self.installation_cache_ttl = int(env.get("INSTALLATION_CACHE_TTL", 300))
+        self.slack_client_pool_size = int(env.get("SLACK_CLIENT_POOL_SIZE", 256))
+
+        # Database
+        self.db_path = env.get("DATABASE_PATH")
+        self.db_busy_timeout = int(env.get("DATABASE_BUSY_TIMEOUT_MS", 5000))
+        self.db_cache_size = int(env.get("DATABASE_CACHE_SIZE", -16000))
+        self.db_mmap_size = int(env.get("DATABASE_MMAP_SIZE", 64 * 1024 * 1024))
+
+        self.admin = env.get("ADMIN_ID")
+        self.review_channel_id = env.get("FAQ_SUBMISSION_REVIEW_CHANNEL")
+        # Pending FAQs per page of the /review-faqs queue, a modal holds at most 100 blocks
+        self.review_queue_page_size = max(1, min(int(env.get("REVIEW_QUEUE_PAGE_SIZE", 20)), 50))
+
+        # Slack only shows the first 100 options of an external select
+        self.faq_options_limit = min(int(env.get("FAQ_OPTIONS_LIMIT", 100)), 100)
+        self.faq_options_cache_size = int(env.get("FAQ_OPTIONS_CACHE_SIZE", 512))
+        self.faq_options_cache_ttl = int(env.get("FAQ_OPTIONS_CACHE_TTL", 60))
+        self.answer_cache_size = int(env.get("ANSWER_CACHE_SIZE", 1024))
+        # With SNAPSHOT_PATH the options menu and the trigger form read the FAQ snapshot from `manage.py snapshot export`
+        self.snapshot_path = env.get("SNAPSHOT_PATH")
+        self.snapshot_check_interval = float(env.get("SNAPSHOT_CHECK_INTERVAL", 1))
+        # An options-load replica: no database, only the options menu is served, from the snapshot
+        self.snapshot_only = env.get("SNAPSHOT_ONLY", "0") == "1"
+
+        self.faq_suggestions_enabled = env.get("FAQ_SUGGESTIONS_ENABLED", "1") == "1"
+        self.faq_suggestion_min_score = float(env.get("FAQ_SUGGESTION_MIN_SCORE", 0.35))
+
+        # FAQ usage is written in batches, options are ranked by uses in the last POPULARITY_DAYS
+        self.usage_flush_interval = float(env.get("USAGE_FLUSH_INTERVAL", 5))
+        self.usage_batch_size = int(env.get("USAGE_BATCH_SIZE", 500))
+        self.popularity_days = int(env.get("POPULARITY_DAYS", 30))
+
+        # /faqs
+        self.faqs_page_size = int(env.get("FAQS_PAGE_SIZE", 50))
+        # Other workers see a newly approved FAQ on /faqs after at most this many seconds
+        self.corpus_version_ttl = float(env.get("CORPUS_VERSION_TTL", 2))
+
+        # Bearer token for /api/changes, the endpoint is off without one
+        self.changes_api_token = env.get("CHANGES_API_TOKEN")
+
+        # Slack retries events for up to about 5 minutes
+        self.idempotency_ttl = int(env.get("IDEMPOTENCY_TTL", 900))
+
+        # Opt-in recording of the Slack requests for `python -m bench.replay`, see traffic.py
+        self.traffic_record_dir = env.get("TRAFFIC_RECORD_DIR")
+        self.traffic_record_sample_rate = float(env.get("TRAFFIC_RECORD_SAMPLE_RATE", 1))
+        self.traffic_record_keep_text = env.get("TRAFFIC_RECORD_KEEP_TEXT", "0") == "1"
+
+        # Threads async_app.py runs the (blocking) handlers and database queries in
+        self.async_handler_threads = int(env.get("ASYNC_HANDLER_THREADS", 32))
+
+    def validate(self):
+        for name in REQUIRED:
+            if name == "DATABASE_PATH" and self.snapshot_only:
+                continue
+            if not self.env.get(name):
+                raise ValueError(f"{name} environment variable is not set.")
+        if self.snapshot_only and not self.snapshot_path:
+            raise ValueError("SNAPSHOT_ONLY needs the SNAPSHOT_PATH environment variable.")
+
+        if not self.slack_api_app_id:
+            warnings.warn("SLACK_API_APP_ID environment variable is not set.")
+        if not self.flask_secret_key:
+            warnings.warn("FLASK_SECRET_KEY environment variable is not set. A random key will be used, which will invalidate sessions on server restart.")
+
+    @classmethod
+    def load(cls, validate=True):
+        load_dotenv()
+        settings = cls()
+        if validate:
+            settings.validate()
+        return settings
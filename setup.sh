@@ -26,71 +26,7 @@ echo -e "${GREEN}Installing npm packages...${NC}"
 npm install
 
 echo -e "${GREEN}Setting up database...${NC}"
-sqlite3 database.db <<EOF
-CREATE TABLE IF NOT EXISTS faqs (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    global BOOLEAN NOT NULL,
-    question TEXT NOT NULL,
-    answer TEXT NOT NULL,
-    created_by TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS faq_channels (
-    faq_id INTEGER NOT NULL,
-    channel_id INTEGER NOT NULL,
-    PRIMARY KEY (faq_id, channel_id),
-    FOREIGN KEY (faq_id) REFERENCES faqs (id) ON DELETE CASCADE,
-    FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
-);
-
-CREATE TABLE IF NOT EXISTS faq_pending (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    global BOOLEAN NOT NULL,
-    question TEXT NOT NULL,
-    answer TEXT NOT NULL,
-    created_by TEXT NOT NULL
-);
-
-CREATE TABLE IF NOT EXISTS faq_pending_channels (
-    faq_id INTEGER NOT NULL,
-    channel_id INTEGER NOT NULL,
-    PRIMARY KEY (faq_id, channel_id),
-    FOREIGN KEY (faq_id) REFERENCES faq_pending (id) ON DELETE CASCADE,
-    FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
-);
-
-CREATE TABLE IF NOT EXISTS faq_rejected (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    global BOOLEAN NOT NULL,
-    question TEXT NOT NULL,
-    answer TEXT NOT NULL,
-    created_by TEXT NOT NULL,
-    rejected_by TEXT NOT NULL,
-    reason TEXT
-);
-
-CREATE TABLE IF NOT EXISTS faq_rejected_channels (
-    faq_id INTEGER NOT NULL,
-    channel_id INTEGER NOT NULL,
-    PRIMARY KEY (faq_id, channel_id),
-    FOREIGN KEY (faq_id) REFERENCES faq_rejected (id) ON DELETE CASCADE,
-    FOREIGN KEY (channel_id) REFERENCES channels (id) ON DELETE CASCADE
-);
-
-
-CREATE TABLE IF NOT EXISTS reviewers (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    user_id TEXT NOT NULL,
-    admin BOOL NOT NULL
-);
-
-
-CREATE TABLE IF NOT EXISTS site_users (
-    id INTEGER PRIMARY KEY AUTOINCREMENT,
-    slack_user_id TEXT NOT NULL,
-    user_access_token TEXT NOT NULL
-);
-EOF
+python manage.py --database database.db migrate
 
 if [ ! -d logs ]; then
     echo -e "${GREEN}Creating logs directory...${NC}"
@@ -0,0 +1,157 @@
+from jobs import PRIORITY_NORMAL
+import metrics
+import random
+from slack_sdk.errors import SlackApiError
+import threading
+import time
+
+
+# Requests per minute for each Slack Web API tier (https://api.slack.com/apis/rate-limits)
+TIER_RATES = {
+    1: 1,
+    2: 20,
+    3: 50,
+    4: 100,
+}
+
+# method -> tier. chat.postMessage isn't tiered, Slack allows about one message per second per channel.
+METHOD_TIERS = {
+    "oauth_v2_access": 4,
+    "views_open": 4,
+    "views_update": 4,
+    "views_push": 4,
+    "chat_update": 3,
+    "reactions_add": 3,
+    "conversations_open": 3,
+}
+POST_MESSAGE_RATE = 60
+DEFAULT_TIER = 3
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst or max(1, rate_per_minute // 10)
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        # Takes a token (possibly going into debt) and returns how long to wait before using it
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self.rate
+
+
+# Sends Slack Web API calls through per-method token buckets and retries 429s and transient
+# errors with jittered exponential backoff. call() runs on the job queue, call_now() runs inline.
+# Calls with a team_id go out with that workspace's client from `clients` (an installations.ClientPool),
+# calls without one, or for a team that hasn't installed the app, with `client`.
+class SlackDispatcher:
+    retry_errors = (SlackApiError, ConnectionError, TimeoutError, OSError)
+
+    def __init__(self, client, jobs, max_retries=3, backoff_base=1.0, backoff_max=30.0, clients=None):
+        self.client = client
+        self.clients = clients
+        self.jobs = jobs
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.throttled = 0
+        self.retried = 0
+        self.failed = 0
+        self.delayed = 0
+
+    def client_for(self, team_id):
+        if team_id is None or self.clients is None:
+            return self.client
+        return self.clients.get(team_id) or self.client
+
+    def _bucket(self, method, kwargs, team_id=None):
+        # Slack's limits are per workspace
+        if method == "chat_postMessage":
+            key = (team_id, method, kwargs.get("channel"))
+            rate = POST_MESSAGE_RATE
+        else:
+            key = (team_id, method)
+            rate = TIER_RATES[METHOD_TIERS.get(method, DEFAULT_TIER)]
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._buckets.setdefault(key, TokenBucket(rate))
+        return bucket
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _retry_delay(self, method, error, attempt):
+        # How long to wait before retrying a failed call, or None if it shouldn't be retried
+        if isinstance(error, SlackApiError):
+            status = error.response.status_code
+            metrics.inc("slack_api_errors_total", method=method, error=error.response.get("error") or str(status))
+            if status == 429:
+                self.throttled += 1
+                metrics.inc("slack_api_throttled_total", method=method)
+                delay = float(error.response.headers.get("Retry-After", 1)) + random.uniform(0, 1)
+            elif status >= 500:
+                delay = self._backoff(attempt)
+            else:
+                self.failed += 1
+                return None
+        else:
+            metrics.inc("slack_api_errors_total", method=method, error=type(error).__name__)
+            delay = self._backoff(attempt)
+
+        if attempt >= self.max_retries:
+            self.failed += 1
+            return None
+        return delay
+
+    def call_now(self, method, team_id=None, **kwargs):
+        client = self.client_for(team_id)
+        wait = self._bucket(method, kwargs, team_id).reserve()
+        if wait:
+            self.delayed += 1
+            metrics.inc("slack_api_delayed_total", method=method)
+            time.sleep(wait)
+
+        attempt = 0
+        while True:
+            self.calls += 1
+            started = time.perf_counter()
+            try:
+                return getattr(client, method)(**kwargs)
+            except self.retry_errors as e:
+                delay = self._retry_delay(method, e, attempt)
+                if delay is None:
+                    raise
+            finally:
+                metrics.observe("slack_api_duration_seconds", time.perf_counter() - started, method=method)
+
+            attempt += 1
+            self.retried += 1
+            metrics.inc("slack_api_retries_total", method=method)
+            time.sleep(delay)
+
+    def call(self, method, priority=PRIORITY_NORMAL, **kwargs):
+        return self.jobs.submit(self.call_now, method, priority=priority, **kwargs)
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "retried": self.retried,
+            "failed": self.failed,
+            "delayed_by_rate_limit": self.delayed,
+        }
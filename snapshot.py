@@ -0,0 +1,318 @@
+from array import array
+import bisect
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import heapq
+import metrics
+import mmap
+import os
+import queries
+import re
+import struct
+import sys
+import threading
+import time
+import unicodedata
+import zlib
+
+
+# Read-only snapshots of the approved FAQs for the read-heavy paths (the options menu and the
+# trigger form), so they can be served on hosts without the database. `manage.py snapshot export`
+# writes one file, which is copied to each host and replaced atomically (write then rename). The
+# bot maps it with mmap, so every worker on a host shares the same pages, and swaps to a new file
+# as soon as it shows up. Requests that already have the old one finish with it.
+#
+# Layout (little-endian, sections aligned to 8 bytes):
+#   header     magic, corpus version, created_at, counts, section offsets, size and CRC32 of the rest
+#   faqs       FAQ records sorted by id: id, global, question and answer as (offset, length) in strings
+#   channels   sorted by channel id: the FAQ rows visible in the channel and the most used ones there
+#   terms      sorted search terms, each with a run of postings (row << 1 | in question)
+#   ints       uint32 array the channel and term records point into, starting with the global FAQ rows
+#   strings    UTF-8 text of the questions, answers, channel ids and terms
+
+MAGIC = b"FAQSNAP1"
+HEADER = struct.Struct("<8sQQ12I")
+FAQ = struct.Struct("<qIIIII")
+FAQ_ID = struct.Struct("<q")
+CHANNEL = struct.Struct("<IIIIII")
+TERM = struct.Struct("<IIII")
+
+# Slack shows at most 100 options, more of the most used ones are never needed
+POPULAR_LIMIT = 100
+# Like bm25(faqs_fts, 10.0, 1.0) in FAQ_OPTIONS_SEARCH, a term in the question counts more
+QUESTION_WEIGHT = 10
+
+WORD_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    # Close to FTS5's unicode61 tokenizer: lower case, no diacritics, split on anything but letters and digits
+    text = unicodedata.normalize("NFKD", text.lower())
+    return WORD_RE.findall("".join(c for c in text if not unicodedata.combining(c)))
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+def export(db, path, popularity_days=30):
+    # Writes the approved FAQs to a snapshot at `path` and returns what went into it
+    conn = db.conn
+    # A deferred read transaction, every table is read at the same version without blocking writers
+    conn.execute("BEGIN")
+    try:
+        version = conn.execute(queries.CORPUS_VERSION).fetchone()[0]
+        faqs = conn.execute("SELECT id, global, question, answer FROM faqs ORDER BY id").fetchall()
+        channel_rows = conn.execute("SELECT channel_id, faq_id FROM faq_channels").fetchall()
+        since = (datetime.now(timezone.utc) - timedelta(days=popularity_days)).strftime("%Y-%m-%d")
+        usage = conn.execute("SELECT channel_id, faq_id, SUM(uses) FROM faq_usage_daily WHERE day >= ? GROUP BY channel_id, faq_id", (since,)).fetchall()
+    finally:
+        conn.execute("COMMIT")
+
+    strings = bytearray()
+
+    def add_string(text):
+        data = text.encode()
+        offset = len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    row_of = {}
+    faq_records = bytearray()
+    global_rows = []
+    postings = defaultdict(dict)
+    for row, (faq_id, is_global, question, answer) in enumerate(faqs):
+        row_of[faq_id] = row
+        faq_records += FAQ.pack(faq_id, 1 if is_global else 0, *add_string(question), *add_string(answer))
+        if is_global:
+            global_rows.append(row)
+        for term in set(tokenize(answer)):
+            postings[term][row] = 0
+        for term in set(tokenize(question)):
+            postings[term][row] = 1
+
+    # Rows are in id order, so sorted rows are sorted ids
+    visible = defaultdict(set)
+    for channel_id, faq_id in channel_rows:
+        if faq_id in row_of:
+            visible[str(channel_id)].add(row_of[faq_id])
+    popular = defaultdict(list)
+    for channel_id, faq_id, uses in usage:
+        row = row_of.get(faq_id)
+        if row is not None and (faqs[row][1] or row in visible[channel_id]):
+            popular[channel_id].append((-uses, row))
+
+    ints = array("I", global_rows)
+    channel_records = bytearray()
+    names = sorted(set(visible) | set(popular), key=str.encode)
+    for name in names:
+        rows = sorted(visible.get(name, ()))
+        top = [row for _, row in sorted(popular.get(name, ()))[:POPULAR_LIMIT]]
+        channel_records += CHANNEL.pack(*add_string(name), len(ints), len(rows), len(ints) + len(rows), len(top))
+        ints.extend(rows)
+        ints.extend(top)
+
+    term_records = bytearray()
+    terms = sorted(postings, key=str.encode)
+    for term in terms:
+        rows = postings[term]
+        term_records += TERM.pack(*add_string(term), len(ints), len(rows))
+        ints.extend(row << 1 | in_question for row, in_question in sorted(rows.items()))
+
+    if sys.byteorder != "little":
+        ints.byteswap()
+
+    faqs_offset = _align(HEADER.size)
+    channels_offset = _align(faqs_offset + len(faq_records))
+    terms_offset = _align(channels_offset + len(channel_records))
+    ints_offset = _align(terms_offset + len(term_records))
+    strings_offset = _align(ints_offset + len(ints) * ints.itemsize)
+    size = strings_offset + len(strings)
+
+    body = bytearray(size - HEADER.size)
+    for offset, data in ((faqs_offset, faq_records), (channels_offset, channel_records), (terms_offset, term_records), (ints_offset, ints.tobytes()), (strings_offset, strings)):
+        body[offset - HEADER.size:offset - HEADER.size + len(data)] = data
+    header = HEADER.pack(
+        MAGIC, version, int(time.time()),
+        len(faqs), len(names), len(terms), len(global_rows),
+        faqs_offset, channels_offset, terms_offset, ints_offset, len(ints), strings_offset,
+        size, zlib.crc32(body)
+    )
+
+    # Readers only ever see a complete file
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(header)
+        f.write(body)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+    return {"version": version, "faqs": len(faqs), "channels": len(names), "terms": len(terms), "size": size}
+
+
+# One mapped snapshot file
+class Snapshot:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        if len(self._buf) < HEADER.size:
+            raise ValueError("Not a FAQ snapshot.")
+
+        (magic, self.version, self.created_at,
+            self.faq_count, self.channel_count, self.term_count, self._global_count,
+            self._faqs, self._channels, self._terms, ints_offset, ints_count, self._strings,
+            size, checksum) = HEADER.unpack_from(self._buf)
+        if magic != MAGIC:
+            raise ValueError("Not a FAQ snapshot.")
+        if size != len(self._buf) or zlib.crc32(self._buf[HEADER.size:]) != checksum:
+            raise ValueError("The snapshot is incomplete or damaged.")
+
+        ints = self._buf[ints_offset:ints_offset + ints_count * 4]
+        self._ints = ints.cast("I") if sys.byteorder == "little" else array("I", ints.tobytes())
+        if sys.byteorder != "little":
+            self._ints.byteswap()
+
+    def _string(self, offset, length):
+        start = self._strings + offset
+        return bytes(self._buf[start:start + length])
+
+    def _faq(self, row):
+        return FAQ.unpack_from(self._buf, self._faqs + row * FAQ.size)
+
+    def _lower_bound(self, offset, count, record, key):
+        # Index of the first record whose key (its first string) isn't smaller than `key`
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(*record.unpack_from(self._buf, offset + middle * record.size)[:2]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _channel(self, channel_id):
+        # (visible rows, most used rows) of a channel, both as slices of the ints array
+        key = channel_id.encode()
+        index = self._lower_bound(self._channels, self.channel_count, CHANNEL, key)
+        if index < self.channel_count:
+            name_offset, name_length, start, count, popular_start, popular_count = CHANNEL.unpack_from(self._buf, self._channels + index * CHANNEL.size)
+            if self._string(name_offset, name_length) == key:
+                return self._ints[start:start + count], self._ints[popular_start:popular_start + popular_count]
+        return self._ints[0:0], self._ints[0:0]
+
+    def faq(self, faq_id):
+        # (question, answer), or None if there's no approved FAQ with this id
+        low, high = 0, self.faq_count
+        while low < high:
+            middle = (low + high) // 2
+            if FAQ_ID.unpack_from(self._buf, self._faqs + middle * FAQ.size)[0] < faq_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.faq_count:
+            return None
+        row_id, _, question_offset, question_length, answer_offset, answer_length = self._faq(low)
+        if row_id != faq_id:
+            return None
+        return self._string(question_offset, question_length).decode(), self._string(answer_offset, answer_length).decode()
+
+    def _options(self, rows):
+        options = []
+        for row in rows:
+            faq_id, _, question_offset, question_length, _, _ = self._faq(row)
+            options.append((faq_id, self._string(question_offset, question_length).decode()))
+        return options
+
+    def options(self, channel_id, limit=100):
+        # Like FAQ_OPTIONS_LIST: the most used FAQs in the channel first, then the rest by id
+        visible, popular = self._channel(channel_id)
+        rows = list(popular[:limit])
+        seen = set(rows)
+        for row in heapq.merge(self._ints[:self._global_count], visible):
+            if len(rows) >= limit:
+                break
+            if row not in seen:
+                seen.add(row)
+                rows.append(row)
+        return self._options(rows)
+
+    def search(self, channel_id, query, limit=100):
+        # Like FAQ_OPTIONS_SEARCH: FAQs with every word of the query as a prefix of one of their words,
+        # ranked by how many of them are in the question
+        matches = None
+        for word in set(tokenize(query)):
+            prefix = word.encode()
+            hits = {}
+            index = self._lower_bound(self._terms, self.term_count, TERM, prefix)
+            while index < self.term_count:
+                term_offset, term_length, start, count = TERM.unpack_from(self._buf, self._terms + index * TERM.size)
+                if not self._string(term_offset, term_length).startswith(prefix):
+                    break
+                for posting in self._ints[start:start + count]:
+                    score = QUESTION_WEIGHT if posting & 1 else 1
+                    if hits.get(posting >> 1, 0) < score:
+                        hits[posting >> 1] = score
+                index += 1
+
+            matches = hits if matches is None else {row: score + hits[row] for row, score in matches.items() if row in hits}
+            if not matches:
+                return []
+        if matches is None:
+            return []
+
+        visible, _ = self._channel(channel_id)
+
+        def is_visible(row):
+            if self._faq(row)[1]:
+                return True
+            index = bisect.bisect_left(visible, row)
+            return index < len(visible) and visible[index] == row
+
+        return self._options(heapq.nsmallest(limit, (row for row in matches if is_visible(row)), key=lambda row: (-matches[row], row)))
+
+
+# The current snapshot at `path` for the bot. The file is checked at most once per check_interval,
+# a new one (a different inode, mtime or size) is mapped and replaces the old one in a single
+# assignment. A file that fails to load is logged and the previous snapshot stays in use.
+class SnapshotReader:
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._file_key = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        # None until a snapshot has been exported, callers then read from the database
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._refresh(now)
+        return self._snapshot
+
+    def _refresh(self, now):
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.check_interval
+            try:
+                stat = os.stat(self.path)
+            except OSError:
+                return
+            file_key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if file_key == self._file_key:
+                return
+            self._file_key = file_key
+
+            try:
+                snapshot = Snapshot(self.path)
+            except (OSError, ValueError) as e:
+                print(f"Failed to load FAQ snapshot {self.path}: {e}")
+                metrics.inc("faq_snapshot_loads_total", result="error")
+                return
+            self._snapshot = snapshot
+            metrics.inc("faq_snapshot_loads_total", result="ok")
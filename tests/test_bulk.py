@@ -0,0 +1,82 @@
+import bulk
+from db import Database
+import io
+import migrations
+import os
+import tempfile
+import unittest
+
+
+class ImportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, "test.db"))
+        migrations.migrate(self.db)
+        self.checkpoint = os.path.join(self.tmp.name, "import.checkpoint")
+        self.messages = []
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def run_import(self, text, fmt="jsonl", **kwargs):
+        return bulk.import_records(self.db, bulk.read_records(io.StringIO(text), fmt), checkpoint=self.checkpoint, report=self.messages.append, **kwargs)
+
+    def questions(self):
+        return [row[0] for row in self.db.query("SELECT question FROM faqs ORDER BY id")]
+
+    def test_bad_json_line_is_skipped(self):
+        stats = self.run_import(
+            '{"question": "Q1", "answer": "A1"}\n'
+            "not json\n"
+            '{"question": "Q2", "answer": "A2"}\n',
+            batch_size=1
+        )
+        self.assertEqual((stats["read"], stats["imported"], stats["invalid"]), (3, 2, 1))
+        self.assertEqual(self.questions(), ["Q1", "Q2"])
+        self.assertIn("Skipping line 2: not valid JSON", self.messages)
+        self.assertEqual(bulk.load_checkpoint(self.checkpoint), 3)
+
+    def test_invalid_records_are_skipped(self):
+        stats = self.run_import(
+            '{"question": "Q1"}\n'
+            '{"question": "Q2", "answer": "A2", "global": false}\n'
+            '["not", "an", "object"]\n'
+            '{"question": "Q3", "answer": "A3", "channels": "C1, C2"}\n'
+        )
+        self.assertEqual((stats["read"], stats["imported"], stats["invalid"]), (4, 1, 3))
+        self.assertEqual(self.questions(), ["Q3"])
+        channels = self.db.query("SELECT channel_id FROM faq_channels ORDER BY channel_id")
+        self.assertEqual([row[0] for row in channels], ["C1", "C2"])
+
+    def test_invalid_csv_rows_are_skipped(self):
+        stats = self.run_import(
+            "question,answer,global,channels\n"
+            "Q1,A1,yes,\n"
+            "Q2,,yes,\n"
+            "Q3,A3,no,\n",
+            fmt="csv"
+        )
+        self.assertEqual((stats["imported"], stats["invalid"]), (1, 2))
+        self.assertIn("Skipping line 3: question and answer are required", self.messages)
+
+    def test_resume_skips_imported_records(self):
+        text = '{"question": "Q1", "answer": "A1"}\n{"question": "Q2", "answer": "A2"}\n{"question": "Q3", "answer": "A3"}\n'
+        bulk.save_checkpoint(self.checkpoint, 2)
+        stats = self.run_import(text, skip=bulk.load_checkpoint(self.checkpoint))
+        self.assertEqual(stats["imported"], 1)
+        self.assertEqual(self.questions(), ["Q3"])
+
+    def test_empty_input_writes_no_checkpoint(self):
+        stats = self.run_import("\n")
+        self.assertEqual((stats["read"], stats["imported"]), (0, 0))
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_damaged_checkpoint_starts_over(self):
+        with open(self.checkpoint, "w") as f:
+            f.write("{")
+        self.assertEqual(bulk.load_checkpoint(self.checkpoint), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
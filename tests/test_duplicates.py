@@ -0,0 +1,59 @@
+import duplicates
+from duplicates import DuplicateIndex
+from db import Database
+import migrations
+import os
+import tempfile
+import unittest
+
+
+class DuplicateIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, "test.db"))
+        migrations.migrate(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def insert(self, table, faq_id, question):
+        self.db.execute(f"INSERT INTO {table} (id, global, question, answer, created_by) VALUES (?, 1, ?, 'answer', 'U1')", (faq_id, question))
+
+    def test_masks_are_distinct(self):
+        self.assertEqual(len(set(duplicates.MASKS)), duplicates.BANDS * duplicates.ROWS)
+
+    def test_finds_near_duplicate(self):
+        # Jaccard similarity of the two questions' words is 0.67
+        self.insert("faqs", 1, "How do I reset my expired VPN password on my laptop")
+        self.insert("faqs", 2, "Where can I book a meeting room for the team")
+        index = DuplicateIndex(self.db)
+        results = index.find("How can I reset an expired VPN password in the office")
+        self.assertEqual([(kind, item_id) for _, kind, item_id, _ in results], [("faq", 1)])
+
+    def test_add_does_not_skip_lower_ids(self):
+        index = DuplicateIndex(self.db)
+        index.refresh(force=True)
+        # Another worker inserts id 1 while this one inserts and adds id 2
+        self.insert("faq_pending", 1, "How do I reset my expired VPN password on my laptop")
+        self.insert("faq_pending", 2, "Where can I book a meeting room for the team")
+        index.add("pending", 2, "Where can I book a meeting room for the team")
+        index.refresh(force=True)
+        results = index.find("How can I reset an expired VPN password in the office")
+        self.assertEqual([(kind, item_id) for _, kind, item_id, _ in results], [("pending", 1)])
+
+    def test_reviewed_submission_is_dropped(self):
+        self.insert("faq_pending", 1, "How do I reset my expired VPN password on my laptop")
+        # Has no words to index, but counts as a row
+        self.insert("faq_pending", 2, "???")
+        index = DuplicateIndex(self.db)
+        index.refresh(force=True)
+        # Another worker reviews #1 and a new FAQ is submitted before the next refresh
+        self.db.execute("DELETE FROM faq_pending WHERE id = 1")
+        self.insert("faq_pending", 3, "Where can I book a meeting room for the team")
+        index.refresh(force=True)
+        self.assertEqual(index.find("How can I reset an expired VPN password in the office"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
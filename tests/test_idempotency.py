@@ -0,0 +1,44 @@
+from db import Database
+from idempotency import IdempotencyStore
+import migrations
+import os
+import tempfile
+import unittest
+
+
+class IdempotencyStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, "test.db"))
+        migrations.migrate(self.db)
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def test_duplicate_is_dropped(self):
+        store = IdempotencyStore(self.db)
+        self.assertTrue(store.claim("event", "Ev1"))
+        self.assertFalse(store.claim("event", "Ev1"))
+        # Another worker, without the key in its local cache
+        self.assertFalse(IdempotencyStore(self.db).claim("event", "Ev1"))
+
+    def test_released_key_can_be_claimed_again(self):
+        store = IdempotencyStore(self.db)
+        other = IdempotencyStore(self.db)
+        self.assertTrue(store.claim("event", "Ev1"))
+        store.release("event", "Ev1")
+        self.assertTrue(other.claim("event", "Ev1"))
+        self.assertFalse(store.claim("event", "Ev1"))
+
+    def test_release_reaches_workers_that_saw_a_duplicate(self):
+        store = IdempotencyStore(self.db)
+        other = IdempotencyStore(self.db)
+        self.assertTrue(store.claim("action", "approve_faq:1"))
+        self.assertFalse(other.claim("action", "approve_faq:1"))
+        store.release("action", "approve_faq:1")
+        self.assertTrue(other.claim("action", "approve_faq:1"))
+
+
+if __name__ == "__main__":
+    unittest.main()
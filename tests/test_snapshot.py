@@ -0,0 +1,95 @@
+from db import Database
+import migrations
+import os
+import snapshot
+from snapshot import Snapshot, SnapshotReader
+import tempfile
+import unittest
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = Database(os.path.join(self.tmp.name, "test.db"))
+        migrations.migrate(self.db)
+        self.path = os.path.join(self.tmp.name, "faqs.snapshot")
+
+    def tearDown(self):
+        self.db.close()
+        self.tmp.cleanup()
+
+    def insert(self, faq_id, question, answer, channels=()):
+        self.db.execute("INSERT INTO faqs (id, global, question, answer, created_by) VALUES (?, ?, ?, ?, 'U1')", (faq_id, not channels, question, answer))
+        for channel_id in channels:
+            self.db.execute("INSERT INTO faq_channels (faq_id, channel_id) VALUES (?, ?)", (faq_id, channel_id))
+
+    def export(self):
+        return snapshot.export(self.db, self.path)
+
+    def test_export_and_load(self):
+        self.insert(1, "How do I reset my VPN password?", "Use the self-service portal.")
+        self.insert(2, "Where is the printer?", "Next to the kitchen.", channels=("C1",))
+        info = self.export()
+        self.assertEqual((info["faqs"], info["channels"]), (2, 1))
+
+        loaded = Snapshot(self.path)
+        self.assertEqual(loaded.faq(1), ("How do I reset my VPN password?", "Use the self-service portal."))
+        self.assertIsNone(loaded.faq(3))
+        # The channel FAQ only shows up in its channel
+        self.assertEqual(loaded.options("C1"), [(1, "How do I reset my VPN password?"), (2, "Where is the printer?")])
+        self.assertEqual(loaded.options("C2"), [(1, "How do I reset my VPN password?")])
+        self.assertEqual(loaded.search("C1", "print"), [(2, "Where is the printer?")])
+        self.assertEqual(loaded.search("C2", "print"), [])
+
+    def test_damaged_file_is_rejected(self):
+        self.insert(1, "How do I reset my VPN password?", "Use the self-service portal.")
+        self.export()
+        with open(self.path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+    def test_truncated_file_is_rejected(self):
+        self.insert(1, "How do I reset my VPN password?", "Use the self-service portal.")
+        self.export()
+        with open(self.path, "r+b") as f:
+            f.truncate(os.path.getsize(self.path) - 4)
+        with self.assertRaises(ValueError):
+            Snapshot(self.path)
+
+    def test_reader_swaps_to_new_file(self):
+        reader = SnapshotReader(self.path, check_interval=0)
+        self.assertIsNone(reader.current())
+
+        self.insert(1, "How do I reset my VPN password?", "Use the self-service portal.")
+        self.export()
+        first = reader.current()
+        self.assertIsNotNone(first)
+        self.assertIsNone(first.faq(2))
+
+        self.insert(2, "Where is the printer?", "Next to the kitchen.")
+        self.export()
+        second = reader.current()
+        self.assertIsNot(second, first)
+        self.assertEqual(second.faq(2), ("Where is the printer?", "Next to the kitchen."))
+        # Requests that still hold the old snapshot can finish with it
+        self.assertIsNone(first.faq(2))
+
+    def test_reader_keeps_previous_snapshot_when_new_file_is_damaged(self):
+        reader = SnapshotReader(self.path, check_interval=0)
+        self.insert(1, "How do I reset my VPN password?", "Use the self-service portal.")
+        self.export()
+        good = reader.current()
+
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"not a snapshot")
+        os.replace(tmp_path, self.path)
+        self.assertIs(reader.current(), good)
+
+
+if __name__ == "__main__":
+    unittest.main()
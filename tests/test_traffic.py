@@ -0,0 +1,99 @@
+import json
+import tempfile
+import traffic
+from traffic import TrafficRecorder
+import unittest
+from urllib.parse import parse_qs, urlencode
+
+
+# What Slack sends when someone clicks a button on a message, with the fields that carry PII
+BLOCK_ACTIONS = {
+    "type": "block_actions",
+    "token": "verification-token-123",
+    "api_app_id": "A0123",
+    "trigger_id": "1234.5678.abcdef",
+    "response_url": "https://hooks.slack.com/actions/T0123/1/secret-hook",
+    "team": {"id": "T0123", "domain": "acme-corp"},
+    "enterprise": {"id": "E0123", "name": "Acme Enterprise"},
+    "user": {"id": "U0123", "username": "jane.doe", "name": "jane.doe", "team_id": "T0123"},
+    "container": {"type": "message", "message_ts": "1700000000.000100", "channel_id": "C0123", "is_ephemeral": False},
+    "channel": {"id": "C0123", "name": "it-helpdesk"},
+    "message": {
+        "type": "message",
+        "user": "U0456",
+        "ts": "1700000000.000100",
+        "text": "Jane asked about the VPN",
+        "user_profile": {
+            "avatar_hash": "g1a2b3c4",
+            "image_72": "https://avatars.slack-edge.com/jane-avatar_72.png",
+            "first_name": "Jane",
+            "real_name": "Jane Doe",
+            "display_name": "janed",
+            "name": "jane.doe",
+        },
+        "blocks": [{
+            "type": "rich_text",
+            "block_id": "b1",
+            "elements": [{
+                "type": "rich_text_section",
+                "elements": [
+                    {"type": "text", "text": "See "},
+                    {"type": "link", "url": "https://intranet.acme.example/users/jane-doe", "text": "the wiki"},
+                ],
+            }],
+        }],
+    },
+    "state": {"values": {"faq_selection_block": {"faq_select": {"type": "external_select", "selected_option": {"text": {"type": "plain_text", "text": "How do I reset my VPN password?"}, "value": "42"}}}}},
+    "actions": [{"type": "button", "action_id": "approve_faq", "block_id": "b2", "value": "17", "action_ts": "1700000001.000200", "text": {"type": "plain_text", "text": "Approve"}}],
+}
+
+PII = (
+    "verification-token-123", "secret-hook", "acme-corp", "Acme Enterprise", "jane", "Jane", "Doe", "janed",
+    "avatars.slack-edge.com", "g1a2b3c4", "intranet.acme.example", "it-helpdesk", "VPN",
+)
+
+
+class RedactTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.recorder = TrafficRecorder(self.tmp.name)
+
+    def tearDown(self):
+        self.recorder.close()
+        self.tmp.cleanup()
+
+    def redact_interaction(self, payload):
+        body = urlencode({"payload": json.dumps(payload)}).encode()
+        redacted = self.recorder.redact_body("application/x-www-form-urlencoded", body)
+        return redacted, json.loads(parse_qs(redacted)["payload"][0])
+
+    def test_no_pii_in_block_actions(self):
+        redacted, _ = self.redact_interaction(BLOCK_ACTIONS)
+        for value in PII:
+            self.assertNotIn(value, redacted)
+
+    def test_keeps_what_replay_needs(self):
+        _, payload = self.redact_interaction(BLOCK_ACTIONS)
+        self.assertEqual(payload["type"], "block_actions")
+        self.assertEqual(payload["api_app_id"], "A0123")
+        self.assertEqual(payload["trigger_id"], "1234.5678.abcdef")
+        self.assertEqual(payload["user"]["id"], "U0123")
+        self.assertEqual(payload["user"]["team_id"], "T0123")
+        self.assertEqual(payload["channel"]["id"], "C0123")
+        self.assertEqual(payload["container"]["message_ts"], "1700000000.000100")
+        self.assertEqual(payload["message"]["user"], "U0456")
+        self.assertEqual(payload["actions"][0]["action_id"], "approve_faq")
+        self.assertEqual(payload["actions"][0]["value"], "17")
+        self.assertEqual(payload["state"]["values"]["faq_selection_block"]["faq_select"]["selected_option"]["value"], "42")
+
+    def test_masks_text_but_keeps_mentions(self):
+        body = urlencode({"command": "/faq", "text": "reset <@U0123> VPN 2", "user_id": "U0123", "user_name": "jane.doe"}).encode()
+        fields = parse_qs(self.recorder.redact_body("application/x-www-form-urlencoded", body))
+        self.assertEqual(fields["text"], ["xxxxx <@U0123> xxx 0"])
+        self.assertEqual(fields["command"], ["/faq"])
+        self.assertEqual(fields["user_id"], ["U0123"])
+        self.assertEqual(fields["user_name"], [traffic.REDACTED])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,195 @@
+import atexit
+import gzip
+import io
+import json
+import metrics
+import os
+import random
+import re
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode
+
+
+# Records the requests Slack sends to the bot, so real traffic can be replayed against a local
+# instance later (`python -m bench.replay`). Off unless TRAFFIC_RECORD_DIR is set. Each worker
+# appends to its own TRAFFIC_RECORD_DIR/traffic.<pid>.<started>.ndjson.gz, one line per request:
+#
+#   {"t": arrival time, "path": ..., "content_type": ..., "body": redacted body, "retry": X-Slack-Retry-Num,
+#    "status": response status, "duration_ms": time until the response was sent}
+#
+# Bodies are redacted before they're written. Only the string values of the keys the bot reads
+# (KEEP_KEYS: Slack ids, callback and action ids, button and option values, timestamps) are kept,
+# every other string (tokens, response URLs, names, profiles, avatars, links) becomes "redacted".
+# Unless keep_text is set, the text people wrote (messages, command arguments, submitted FAQs)
+# has its letters and digits masked. What the options menu is searched for is kept, those are
+# words from FAQ questions. Ids are kept so replayed requests hit the same FAQs, reviewers and code paths.
+
+RECORDED_PATHS = frozenset(("/slack/command", "/slack/interactions", "/slack/external_options_load", "/slack/events"))
+FLUSH_INTERVAL = 1.0
+
+# Keys whose string values (or lists of strings) the handlers need, in payloads and form fields.
+# "user", "channel" and "team" are ids where they're strings, objects under them are redacted like the rest.
+# "oauth" and "bot" are the user ids in a tokens_revoked event.
+KEEP_KEYS = frozenset((
+    "type", "id", "user", "channel", "team", "user_id", "channel_id", "team_id", "api_app_id", "event_id",
+    "trigger_id", "callback_id", "action_id", "block_id", "value", "selected_channels", "private_metadata",
+    "hash", "ts", "thread_ts", "event_ts", "message_ts", "action_ts", "command", "oauth", "bot",
+))
+TEXT_KEYS = frozenset(("text",))
+REDACTED = "redacted"
+
+# Mentions and channel links (<@U123>, <#C123|name>) are kept, the bot parses them
+MASK_RE = re.compile(r"(<[@#!][^>]*>)|[^\W_]")
+
+
+def mask(text):
+    # Keeps the length and shape of the text (spaces, punctuation, mentions) but not its words
+    return MASK_RE.sub(lambda match: match.group(1) or ("0" if match.group().isdigit() else "x"), text)
+
+
+class TrafficRecorder:
+    def __init__(self, directory, sample_rate=1.0, keep_text=False):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.keep_text = keep_text
+        self._lock = threading.Lock()
+        self._file = None
+        self._pid = None
+        self._last_flush = 0.0
+        atexit.register(self.close)
+
+    def sampled(self, path):
+        return path in RECORDED_PATHS and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def _redact_string(self, key, value):
+        if key in TEXT_KEYS:
+            return value if self.keep_text else mask(value)
+        if key in KEEP_KEYS:
+            return value
+        return REDACTED
+
+    def _redact(self, value, key=None):
+        if isinstance(value, dict):
+            redacted = {k: self._redact(v, k) for k, v in value.items()}
+            # Text typed into a modal
+            if not self.keep_text and value.get("type") == "plain_text_input" and isinstance(value.get("value"), str):
+                redacted["value"] = mask(value["value"])
+            return redacted
+        if isinstance(value, list):
+            return [self._redact(item, key) for item in value]
+        if not isinstance(value, str):
+            return value
+        return self._redact_string(key, value)
+
+    def redact_body(self, content_type, body):
+        # Returns the body as text, with the same encoding (form or JSON) as it came in
+        text = body.decode("utf-8", "replace")
+        if content_type.startswith("application/json"):
+            try:
+                return json.dumps(self._redact(json.loads(text)))
+            except ValueError:
+                return ""
+
+        fields = []
+        for key, value in parse_qsl(text, keep_blank_values=True):
+            if key == "payload":
+                try:
+                    value = json.dumps(self._redact(json.loads(value)))
+                except ValueError:
+                    value = ""
+            else:
+                value = self._redact_string(key, value)
+            fields.append((key, value))
+        return urlencode(fields)
+
+    def record(self, arrived_at, path, content_type, body, status, duration, retry=None):
+        line = json.dumps({
+            "t": arrived_at,
+            "path": path,
+            "content_type": content_type,
+            "body": self.redact_body(content_type, body),
+            "retry": retry,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+        })
+        with self._lock:
+            if self._pid != os.getpid():
+                # A forked worker starts its own file
+                os.makedirs(self.directory, exist_ok=True)
+                self._file = gzip.open(os.path.join(self.directory, f"traffic.{os.getpid()}.{int(time.time())}.ndjson.gz"), "at", compresslevel=6)
+                self._pid = os.getpid()
+            self._file.write(line + "\n")
+            now = time.monotonic()
+            if now - self._last_flush >= FLUSH_INTERVAL:
+                # Readable up to here even if the worker is killed
+                self._file.flush()
+                self._last_flush = now
+        metrics.inc("recorded_requests_total", path=path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+            self._file = None
+            self._pid = None
+
+
+class RecorderMiddleware:
+    # WSGI middleware. The body is read here and handed on, the duration runs until the response is sent.
+    def __init__(self, wsgi_app, recorder):
+        self.wsgi_app = wsgi_app
+        self.recorder = recorder
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if environ.get("REQUEST_METHOD") != "POST" or not self.recorder.sampled(path):
+            return self.wsgi_app(environ, start_response)
+
+        arrived_at = time.time()
+        started = time.perf_counter()
+        body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+        environ["wsgi.input"] = io.BytesIO(body)
+        status = []
+
+        def recording_start_response(status_line, headers, exc_info=None):
+            status.append(int(status_line.split(" ", 1)[0]))
+            return start_response(status_line, headers, exc_info)
+
+        def finish():
+            try:
+                self.recorder.record(
+                    arrived_at, path, environ.get("CONTENT_TYPE", ""), body,
+                    status[0] if status else 500, time.perf_counter() - started,
+                    environ.get("HTTP_X_SLACK_RETRY_NUM")
+                )
+            except Exception as e:
+                print(f"Failed to record request: {e}")
+
+        try:
+            response = self.wsgi_app(environ, recording_start_response)
+        except BaseException:
+            finish()
+            raise
+        return self._iterate(response, finish)
+
+    def _iterate(self, response, finish):
+        try:
+            yield from response
+        finally:
+            if hasattr(response, "close"):
+                response.close()
+            finish()
+
+
+def read(paths):
+    # Yields the recorded requests of every file. A file of a worker that was killed ends early,
+    # everything up to its last flush is still read.
+    for path in paths:
+        try:
+            with gzip.open(path, "rt") as f:
+                for line in f:
+                    if line.endswith("\n"):
+                        yield json.loads(line)
+        except (EOFError, gzip.BadGzipFile):
+            continue
@@ -0,0 +1,83 @@
+from collections import Counter
+import metrics
+import os
+import queries
+import threading
+import time
+
+
+# Records which FAQs get triggered in which channel. Events are buffered in memory and written by
+# a background thread in one transaction per batch (the raw events plus per-day aggregates), so
+# the request that triggers an FAQ never waits for a write.
+class UsageTracker:
+    def __init__(self, db, flush_interval=5, batch_size=500):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+
+        self.recorded = 0
+        self.flushed = 0
+
+    def _ensure_started(self):
+        # Like JobQueue, the flush thread is started lazily in each gunicorn worker
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._buffer = []
+            self._wake = threading.Event()
+            threading.Thread(target=self._run, name="usage-flush", daemon=True).start()
+            self._pid = os.getpid()
+
+    def record(self, faq_id, channel_id, user_id):
+        self._ensure_started()
+        with self._lock:
+            self._buffer.append((int(faq_id), channel_id, user_id, int(time.time())))
+            self.recorded += 1
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to write FAQ usage: {e}")
+
+    def flush(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        if not events:
+            return
+
+        daily = Counter((faq_id, channel_id, time.strftime("%Y-%m-%d", time.gmtime(created_at))) for faq_id, channel_id, _, created_at in events)
+        try:
+            with self.db.transaction("usage_flush") as cursor:
+                cursor.executemany(queries.INSERT_USAGE_EVENT, events)
+                cursor.executemany(queries.UPSERT_USAGE_DAILY, [key + (uses,) for key, uses in daily.items()])
+        except Exception:
+            # Keep the events for the next attempt
+            with self._lock:
+                self._buffer[:0] = events
+            raise
+
+        self.flushed += len(events)
+        metrics.inc("faq_usage_events_total", len(events))
+
+    def stats(self):
+        return {
+            "recorded": self.recorded,
+            "flushed": self.flushed,
+            "buffered": len(self._buffer),
+        }